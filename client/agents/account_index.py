@@ -0,0 +1,199 @@
+"""
+Índice de cuentas para resolver a qué cuenta pertenece un extracto.
+
+Se construye una vez sobre el recurso de cuentas y busca en el encabezado
+del extracto números completos, sufijos, números enmascarados
+("4512 **** **** 4731", "XXXX-4731"), últimos 4 dígitos, banco y nombre.
+Un número completo o un sufijo largo pesa más que cualquier coincidencia
+de últimos 4 dígitos. Solo una resolución fuerte (número o sufijo) se
+guarda en el estado (`origin_account`) y se fija en los inserts; con
+solo los últimos 4 la cuenta se le sugiere al LLM. Si varias cuentas
+empatan o el encabezado menciona números de cuentas distintas, la
+resolución queda marcada como ambigua y el LLM decide entre los
+candidatos.
+"""
+import re
+from collections import defaultdict
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+from agents.blob_store import resolve_blob
+from agents.catalogs import fold, parse_catalogs
+
+HEADER_CHARS = 2000  # el número de cuenta y el banco aparecen al inicio del extracto
+
+# Corridas completas de 4+ dígitos que no son parte de un monto (1,234.56)
+DIGITS_RE = re.compile(r"(?<![\d.,])\d{4,}(?!\d|[.,]\d)")
+GROUP_SEP_RE = re.compile(r"(?<=\d)[ -](?=\d{4})")
+DATES_RE = re.compile(r"\b\d{4}[-/]\d{1,2}[-/]\d{1,2}\b|\b\d{1,2}[-/]\d{1,2}[-/]\d{4}\b")
+# Bloques enmascarados seguidos de los últimos 4: "**** 4731", "XXXX-XXXX-4731", "•••4731"
+MASKED_RE = re.compile(r"(?:[x*•#]{2,}[ -]?)+(\d{4})\b", re.IGNORECASE)
+# Un año suelto ("Enero 2024") no es una terminación de cuenta
+YEAR_RE = re.compile(r"(?:19|20)\d{2}")
+
+# Fuerza de la evidencia de número: ordena antes que el puntaje
+NO_NUMBER, LAST4_ONLY, SUFFIX_MATCH, FULL_MATCH = range(4)
+
+FULL_NUMBER = 10
+SUFFIX = 10       # 6+ dígitos finales del número
+LAST4 = 10
+NAME = 5
+NAME_TOKEN = 2
+BANK = 3
+
+
+def number_runs(text: str) -> List[str]:
+    """Secuencias de 4+ dígitos; une grupos "4111 1111 ..." y sirve con XXXX-1234."""
+    text = DATES_RE.sub(" ", text or "")
+    # El mismo número repetido en el encabezado cuenta una sola vez
+    return list(dict.fromkeys(DIGITS_RE.findall(GROUP_SEP_RE.sub("", text))))
+
+
+def account_label(account: Optional[dict]) -> str:
+    """Nombre, banco y últimos 4 dígitos, p.ej. "Tarjeta Oro BI ****4731"."""
+    account = account or {}
+    numero = re.sub(r"\D", "", str(account.get("numero", "")))
+    return " ".join(filter(None, [account.get("nombre"), account.get("banco"), f"****{numero[-4:]}" if numero else ""]))
+
+
+@dataclass
+class Resolution:
+    account: Optional[Dict[str, Any]]
+    ambiguous: bool
+    candidates: List[Tuple[int, Dict[str, Any]]] = field(default_factory=list)
+    evidence: List[str] = field(default_factory=list)
+    strong: bool = False  # número completo o sufijo, no solo los últimos 4
+
+    @property
+    def account_id(self) -> Optional[str]:
+        return self.account.get("id") if self.account and not self.ambiguous else None
+
+
+class AccountIndex:
+    def __init__(self, accounts: List[Dict[str, Any]]):
+        self.accounts = accounts
+        self.by_number: Dict[str, List[int]] = defaultdict(list)
+        self.by_last4: Dict[str, List[int]] = defaultdict(list)
+        self.by_bank: Dict[str, List[int]] = defaultdict(list)
+        self.names: List[Tuple[str, set]] = []
+        for i, account in enumerate(accounts):
+            numero = re.sub(r"\D", "", str(account.get("numero", "")))
+            if numero:
+                self.by_number[numero].append(i)
+                if len(numero) >= 4:
+                    self.by_last4[numero[-4:]].append(i)
+            bank = fold(account.get("banco", "")).strip()
+            if bank:
+                self.by_bank[bank].append(i)
+            name = fold(account.get("nombre", "")).strip()
+            self.names.append((name, {t for t in re.findall(r"\w+", name) if len(t) >= 4}))
+
+    def match(self, text: str) -> List[Tuple[int, Dict[str, Any]]]:
+        """(puntaje, cuenta) de las cuentas mencionadas en el texto, mejor primero."""
+        scores, strength, _, _ = self._score(text)
+        ranked = sorted(((strength[i], s, i) for i, s in scores.items() if s), key=lambda t: (-t[0], -t[1]))
+        # Si algún número coincide, el banco o el nombre por sí solos no bastan
+        if ranked and ranked[0][0] > NO_NUMBER:
+            ranked = [t for t in ranked if t[0] > NO_NUMBER]
+        return [(s, self.accounts[i]) for _, s, i in ranked]
+
+    def _score(self, text: str):
+        """Puntaje, fuerza de número y evidencia por cuenta, más las cuentas que toca cada número."""
+        scores: Dict[int, int] = defaultdict(int)
+        strength: Dict[int, int] = defaultdict(int)
+        evidence: Dict[int, List[str]] = defaultdict(list)
+        mentions: List[set] = []
+
+        def add(indexes, points, why, kind=NO_NUMBER):
+            for i in indexes:
+                scores[i] += points
+                strength[i] = max(strength[i], kind)
+                evidence[i].append(why)
+            if kind and indexes:
+                mentions.append(set(indexes))
+
+        numbered = set()
+        for run in number_runs(text):
+            if run in self.by_number:
+                add(self.by_number[run], FULL_NUMBER, f"número {run[:4]}…{run[-4:]}", FULL_MATCH)
+                numbered.update(self.by_number[run])
+                continue
+            suffix = [i for n, ids in self.by_number.items() if len(run) >= 6 and n.endswith(run) for i in ids]
+            if suffix:
+                add(suffix, SUFFIX, f"terminación {run}", SUFFIX_MATCH)
+            elif len(run) == 4 and YEAR_RE.fullmatch(run):
+                continue
+            else:
+                suffix = self.by_last4.get(run[-4:], [])
+                add(suffix, LAST4, f"últimos 4 {run[-4:]}", LAST4_ONLY)
+            numbered.update(suffix)
+        for last4 in dict.fromkeys(MASKED_RE.findall(text or "")):
+            ids = [i for i in self.by_last4.get(last4, []) if i not in numbered]
+            add(ids, LAST4, f"enmascarado ****{last4}", LAST4_ONLY)
+            numbered.update(ids)
+
+        folded = fold(text)
+        words = set(re.findall(r"\w+", folded))
+        for i, (name, tokens) in enumerate(self.names):
+            if name and name in folded:
+                add([i], NAME, "nombre")
+            elif tokens & words:
+                add([i], NAME_TOKEN * len(tokens & words), "nombre parcial")
+        for bank, ids in self.by_bank.items():
+            if re.search(rf"\b{re.escape(bank)}\b", folded):
+                add(ids, BANK, f"banco {bank}")
+        return scores, strength, evidence, mentions
+
+    def resolve(self, text: str) -> Resolution:
+        """
+        Cuenta del extracto. Solo se resuelve con evidencia de número; si
+        la mejor (fuerza, puntaje) empata, no hay número o aparecen
+        números de cuentas distintas, queda ambigua.
+        """
+        scores, strength, evidence, mentions = self._score(text)
+        ranked = sorted(((strength[i], s, i) for i, s in scores.items() if s), key=lambda t: (-t[0], -t[1]))
+        candidates = [(s, self.accounts[i]) for _, s, i in ranked]
+        if not ranked:
+            return Resolution(None, ambiguous=False)
+        best_strength, best_score, best = ranked[0]
+        tied = len(ranked) > 1 and ranked[1][:2] == (best_strength, best_score)
+        # Dos números que no comparten ninguna cuenta: el encabezado habla de más de una
+        several = any(not (a & b) for j, a in enumerate(mentions) for b in mentions[j + 1:])
+        if best_strength == NO_NUMBER or tied or several:
+            return Resolution(None, ambiguous=True, candidates=candidates[:5])
+        return Resolution(self.accounts[best], ambiguous=False, candidates=candidates[:5], evidence=evidence[best],
+                          strong=best_strength >= SUFFIX_MATCH)
+
+
+def make_resolve_account_node(finance_catalog_json: List[str]):
+    """
+    Nodo entre el OCR y el clasificador: fija `origin_account` desde el
+    encabezado. Con solo los últimos 4 dígitos la cuenta queda como única
+    candidata (sugerencia para el LLM), sin fijarse en los inserts.
+    """
+    index = AccountIndex(parse_catalogs(finance_catalog_json)["accounts"])
+
+    def resolve_account_node(state: Dict[str, Any]) -> Dict[str, Any]:
+        md = resolve_blob(state.get("markdown"))
+        if not md:
+            return {"origin_account": None, "origin_ambiguous": False, "origin_candidates": []}
+        resolution = index.resolve(md[:HEADER_CHARS])
+        candidates = [a.get("id") for _, a in resolution.candidates]
+        if resolution.account_id and not resolution.strong:
+            account = resolution.account
+            print(f"🏦 Cuenta probable del extracto: {account.get('nombre')} ({', '.join(resolution.evidence)}); "
+                  "confirma el clasificador")
+            return {"origin_account": None, "origin_ambiguous": False, "origin_candidates": [account.get("id")]}
+        if resolution.account_id:
+            account = resolution.account
+            print(f"🏦 Cuenta del extracto: {account.get('nombre')} ({', '.join(resolution.evidence)})")
+        elif resolution.ambiguous:
+            print(f"⚠️ Cuenta del extracto ambigua: {len(candidates)} candidatas; decide el clasificador")
+        else:
+            print("⚠️ No se reconoció la cuenta del extracto; decide el clasificador")
+        return {
+            "origin_account": resolution.account_id,
+            "origin_ambiguous": resolution.ambiguous,
+            "origin_candidates": candidates,
+        }
+
+    return resolve_account_node
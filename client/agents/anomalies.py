@@ -0,0 +1,231 @@
+"""
+Detección incremental de anomalías sobre los movimientos nuevos.
+
+Observer del tool node (o del flusher de la cola): cada insert confirmado
+se compara contra estadísticas acumuladas y luego las actualiza, en tiempo
+constante por fila:
+
+- Montos atípicos: media y varianza por categoría y por comercio con el
+  algoritmo de Welford; se marca un cargo muy por encima de lo habitual.
+- Posibles duplicados: mismo comercio y mismo monto dentro de pocos días.
+- Suscripciones nuevas: un comercio que cobra un monto casi fijo con
+  intervalos de ~1 mes varias veces seguidas.
+
+Las estadísticas van por tipo de movimiento ("Debito|super la torre"):
+un reembolso no se mezcla con los cargos del mismo comercio. Los
+créditos actualizan sus estadísticas pero no generan alertas.
+
+Las estadísticas se persisten como snapshot JSON más un log JSONL de los
+movimientos posteriores (mismo esquema que agents/merchant_index.py).
+`get-anomalies` lee las alertas recientes sin ir a Notion.
+"""
+import json
+import math
+import os
+from collections import deque
+from datetime import date
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+from langchain_core.tools import BaseTool, StructuredTool
+from agents.merchant_index import tokenize
+from agents.movements import INSERT_TOOL, inserted_page_id
+
+KINDS = ("outlier", "duplicate", "subscription")
+MONTHLY_GAP = (25, 35)   # días entre cobros de una suscripción mensual
+CREDIT_TYPE = "Credito"
+SNAPSHOT_VERSION = 2     # v2: estadísticas por (tipo, comercio/categoría)
+
+
+def merchant_key(description: str) -> str:
+    """Comercio sin números de sucursal, autorización ni cuotas: "super la torre 12" → "super la torre"."""
+    tokens = [t for t in tokenize(description) if not any(c.isdigit() for c in t)]
+    return " ".join(tokens[:3])
+
+
+def welford(stats: Dict[str, Any], x: float):
+    stats["n"] += 1
+    delta = x - stats["mean"]
+    stats["mean"] += delta / stats["n"]
+    stats["m2"] += delta * (x - stats["mean"])
+
+
+def std(stats: Dict[str, Any]) -> float:
+    return math.sqrt(stats["m2"] / (stats["n"] - 1)) if stats["n"] > 1 else 0.0
+
+
+class AnomalyDetector:
+    def __init__(self, path: str = "anomalies.json", z_threshold: float = 3.5, min_samples: int = 5,
+                 duplicate_days: int = 3, recurring_charges: int = 3, recurring_tolerance: float = 0.1,
+                 max_alerts: int = 200, snapshot_every: int = 200):
+        self.path = Path(path)
+        self.log_path = self.path.with_suffix(".log.jsonl")
+        self.z_threshold = z_threshold
+        self.min_samples = min_samples
+        self.duplicate_days = duplicate_days
+        self.recurring_charges = recurring_charges
+        self.recurring_tolerance = recurring_tolerance
+        self.snapshot_every = snapshot_every
+
+        self.categories: Dict[str, Dict[str, Any]] = {}
+        self.merchants: Dict[str, Dict[str, Any]] = {}
+        self.alerts: deque = deque(maxlen=max_alerts)
+        self.observed = 0
+        self._pending_log = 0
+        self._load()
+
+    # ---------- Persistencia ----------
+    def _load(self):
+        if self.path.exists():
+            with open(self.path, "r", encoding="utf-8") as f:
+                snapshot = json.load(f)
+            self.alerts.extend(snapshot["alerts"])
+            # Un snapshot con otras llaves se descarta: se vuelve a cargar el historial
+            if snapshot.get("version") == SNAPSHOT_VERSION:
+                self.categories = snapshot["categories"]
+                self.merchants = snapshot["merchants"]
+                self.observed = snapshot["observed"]
+        if self.log_path.exists():
+            with open(self.log_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        self.check(json.loads(line))
+                    except json.JSONDecodeError:
+                        continue  # última línea truncada
+
+    def save(self):
+        tmp = self.path.with_suffix(".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({
+                "version": SNAPSHOT_VERSION,
+                "categories": self.categories,
+                "merchants": self.merchants,
+                "alerts": list(self.alerts),
+                "observed": self.observed,
+            }, f, ensure_ascii=False)
+        os.replace(tmp, self.path)
+        self.log_path.unlink(missing_ok=True)
+        self._pending_log = 0
+
+    @property
+    def empty(self) -> bool:
+        return not self.observed
+
+    # ---------- Detección ----------
+    def check(self, movement: Dict[str, Any], alert: bool = True) -> List[Dict[str, Any]]:
+        """Evalúa el movimiento contra lo acumulado y luego lo suma; O(1) por fila."""
+        try:
+            day = date.fromisoformat(str(movement.get("date", ""))[:10])
+        except ValueError:
+            return []
+        amount = abs(float(movement.get("amount") or 0))
+        kind = movement.get("type") or ""
+        merchant = merchant_key(movement.get("description", ""))
+        category = movement.get("spendType") or ""
+        credit = kind == CREDIT_TYPE
+        found = []
+
+        def flag(kind: str, detail: str, **extra):
+            found.append({"kind": kind, "date": day.isoformat(), "amount": amount,
+                          "description": movement.get("description", ""), "detail": detail, **extra})
+
+        m = self.merchants.setdefault(f"{kind}|{merchant}", {
+            "n": 0, "mean": 0.0, "m2": 0.0, "last_date": None, "last_amount": None, "streak": 0, "recurring": False,
+        }) if merchant else None
+        c = self.categories.setdefault(f"{kind}|{category}", {"n": 0, "mean": 0.0, "m2": 0.0}) if category else None
+
+        # Atípico: se evalúa contra el comercio si tiene historia, si no contra la categoría
+        for label, stats in ((f"comercio '{merchant}'", m), (f"categoría '{category}'", c)):
+            if credit:
+                break
+            if stats and stats["n"] >= self.min_samples:
+                # Piso de dispersión: montos idénticos no deben volver infinito el z-score
+                spread = max(std(stats), 0.1 * stats["mean"], 1.0)
+                z = (amount - stats["mean"]) / spread
+                if z >= self.z_threshold:
+                    flag("outlier", f"{amount:.2f} vs. promedio {stats['mean']:.2f} en {label} (z={z:.1f})",
+                         z=round(z, 1))
+                break
+
+        if m and m["last_date"]:
+            last = date.fromisoformat(m["last_date"])
+            gap = (day - last).days
+            if not credit and abs(gap) <= self.duplicate_days and m["last_amount"] is not None \
+                    and abs(amount - m["last_amount"]) < 0.005:
+                flag("duplicate", f"mismo monto en '{merchant}' el {last.isoformat()}")
+            # Suscripción: cobros ~mensuales de un monto casi fijo
+            steady = m["last_amount"] and abs(amount - m["last_amount"]) <= self.recurring_tolerance * m["last_amount"]
+            if gap > 0:
+                m["streak"] = m["streak"] + 1 if MONTHLY_GAP[0] <= gap <= MONTHLY_GAP[1] and steady else 0
+                if not m["recurring"] and m["streak"] + 1 >= self.recurring_charges:
+                    m["recurring"] = True
+                    if not credit:
+                            flag("subscription", f"'{merchant}' cobra ~{amount:.2f} cada mes "
+                                             f"({m['streak'] + 1} cobros seguidos)")
+
+        if m:
+            welford(m, amount)
+            if not m["last_date"] or day.isoformat() >= m["last_date"]:
+                m["last_date"], m["last_amount"] = day.isoformat(), amount
+        if c:
+            welford(c, amount)
+        self.observed += 1
+        if alert:
+            self.alerts.extend(found)
+        return found
+
+    def observe(self, name: str, args: dict, result: Any):
+        """Observer para el tool node: revisa cada insert exitoso."""
+        if name != INSERT_TOOL or not inserted_page_id(result):
+            return
+        movement = {k: args.get(k) for k in ("date", "amount", "description", "type", "spendType")}
+        for alert in self.check(movement):
+            print(f"🚨 Anomalía ({alert['kind']}): {alert['description']} — {alert['detail']}")
+        with open(self.log_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(movement, ensure_ascii=False) + "\n")
+        self._pending_log += 1
+        if self._pending_log >= self.snapshot_every:
+            self.save()
+
+    def bootstrap(self, rows):
+        """
+        Primera carga desde el historial exportado, sin generar alertas. Las
+        filas se consumen en el orden recibido, sin cargarlas en memoria; el
+        llamador las pasa por fecha (`MovementStore.iter_rows_by_date`).
+        """
+        for row in rows:
+            self.check(row, alert=False)
+        self.save()
+        print(f"🚨 Detector de anomalías: {self.observed} movimientos del historial, "
+              f"{len(self.merchants)} comercios")
+
+    def recent(self, kind: Optional[str] = None, limit: int = 10) -> List[Dict[str, Any]]:
+        alerts = [a for a in reversed(self.alerts) if not kind or a["kind"] == kind]
+        return alerts[:limit]
+
+
+def make_anomalies_tool(detector: AnomalyDetector) -> BaseTool:
+    """Tool local `get-anomalies`: alertas recientes del detector."""
+
+    async def get_anomalies(kind: Optional[str] = None, limit: int = 10) -> str:
+        if kind and kind not in KINDS:
+            return f"Tipo de anomalía desconocido '{kind}'; usa uno de: {', '.join(KINDS)}."
+        alerts = detector.recent(kind, limit)
+        if not alerts:
+            return "No se detectaron anomalías en los movimientos recientes."
+        lines = [
+            f"#{i + 1} - [{a['kind']}] Fecha: {a['date']}, Monto: {a['amount']}, "
+            f"Descripción: {a['description']} — {a['detail']}"
+            for i, a in enumerate(alerts)
+        ]
+        return "\n".join(lines)
+
+    return StructuredTool.from_function(
+        coroutine=get_anomalies,
+        name="get-anomalies",
+        description=(
+            "Alertas recientes sobre movimientos inusuales, detectadas al insertarlos: cargos muy por encima "
+            "de lo habitual (outlier), posibles cobros duplicados (duplicate) y suscripciones nuevas "
+            "(subscription). kind filtra por tipo; limit es la cantidad de alertas, de la más reciente a la más antigua."
+        ),
+        metadata={"local": True},
+    )
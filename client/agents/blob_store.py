@@ -0,0 +1,91 @@
+"""
+Almacén de blobs direccionado por contenido para campos grandes del State.
+
+El checkpointer serializa el estado completo en cada paso del grafo; si
+`markdown` lleva el extracto entero, cada paso copia todo el documento.
+En su lugar el estado guarda una referencia corta (`blob:sha256:<hex>`) y
+los nodos la resuelven solo cuando necesitan el contenido.
+"""
+import hashlib
+import os
+import tempfile
+import threading
+import zlib
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Optional
+
+BLOB_PREFIX = "blob:sha256:"
+
+
+def is_blob_ref(value: Any) -> bool:
+    return isinstance(value, str) and value.startswith(BLOB_PREFIX)
+
+
+class BlobStore:
+    def __init__(self, root: str = ".blobs", cache_size: int = 16):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.cache_size = cache_size
+        self._cache: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _path(self, digest: str) -> Path:
+        return self.root / digest[:2] / digest[2:]
+
+    def _remember(self, ref: str, text: str):
+        with self._lock:
+            self._cache[ref] = text
+            self._cache.move_to_end(ref)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def put(self, text: str) -> str:
+        """Guarda el texto (si no existe ya) y devuelve su referencia."""
+        data = text.encode("utf-8")
+        digest = hashlib.sha256(data).hexdigest()
+        ref = BLOB_PREFIX + digest
+        path = self._path(digest)
+        if not path.exists():
+            path.parent.mkdir(parents=True, exist_ok=True)
+            # Escritura atómica: un lector nunca ve un blob a medias
+            fd, tmp = tempfile.mkstemp(dir=path.parent)
+            with os.fdopen(fd, "wb") as f:
+                f.write(zlib.compress(data, 6))
+            os.replace(tmp, path)
+        self._remember(ref, text)
+        return ref
+
+    def get(self, ref: str) -> str:
+        with self._lock:
+            if ref in self._cache:
+                self._cache.move_to_end(ref)
+                return self._cache[ref]
+        digest = ref[len(BLOB_PREFIX):]
+        text = zlib.decompress(self._path(digest).read_bytes()).decode("utf-8")
+        self._remember(ref, text)
+        return text
+
+    def resolve(self, value: Any) -> Any:
+        """Devuelve el contenido si `value` es una referencia; si no, el valor tal cual."""
+        return self.get(value) if is_blob_ref(value) else value
+
+
+_default_store: Optional[BlobStore] = None
+
+
+def set_blob_store(store: BlobStore):
+    global _default_store
+    _default_store = store
+
+
+def get_blob_store() -> BlobStore:
+    global _default_store
+    if _default_store is None:
+        _default_store = BlobStore()
+    return _default_store
+
+
+def resolve_blob(value: Any) -> Any:
+    """Atajo para resolver una referencia con el almacén configurado."""
+    return get_blob_store().resolve(value) if is_blob_ref(value) else value
@@ -0,0 +1,87 @@
+"""
+Selección de catálogos relevantes para cada llamada al LLM.
+
+En lugar de pegar todos los catálogos en cada system prompt, se incluyen
+solo las cuentas que aparecen en el mensaje o en el encabezado del
+extracto (por número de tarjeta/cuenta, banco o nombre) y, en las
+preguntas, solo las categorías mencionadas. El bloque va en JSON
+minificado y las cuentas en forma compacta (número enmascarado a los
+últimos 4 dígitos, sin campos vacíos).
+"""
+import json
+import re
+from typing import Any, Dict, List, Optional, Tuple
+from agents.account_index import HEADER_CHARS, AccountIndex
+from agents.catalogs import fold, match_category, parse_catalogs
+
+ACCOUNT_WORDS_RE = re.compile(r"\b(cuenta|tarjeta|prestamo|saldo|banco)")
+# Marcador en los system prompts que se reemplaza por el bloque de cada llamada
+CATALOG_SLOT = "<<CATALOGOS>>"
+
+
+def minify(value: Any) -> str:
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":"))
+
+
+def compact_account(account: Dict[str, Any]) -> Dict[str, Any]:
+    numero = re.sub(r"\D", "", str(account.get("numero", "")))
+    compact = {
+        "id": account.get("id"),
+        "nombre": account.get("nombre"),
+        "numero": f"****{numero[-4:]}" if numero else "",
+        "tipo": account.get("tipo"),
+        "banco": account.get("banco"),
+        "diacorte": account.get("diacorte"),
+        "diapago": account.get("diapago"),
+    }
+    return {k: v for k, v in compact.items() if v}
+
+
+class CatalogRetriever:
+    def __init__(self, finance_catalog_json: List[str], max_accounts: int = 4, fallback_accounts: int = 8):
+        catalogs = parse_catalogs(finance_catalog_json)
+        self.accounts = catalogs["accounts"]
+        self.types = catalogs["typetransactions"]
+        self.categories = catalogs["typespend"]
+        self.max_accounts = max_accounts
+        self.fallback_accounts = fallback_accounts
+        self.index = AccountIndex(self.accounts)
+
+    def match_accounts(self, text: str) -> List[Tuple[int, Dict[str, Any]]]:
+        """(puntaje, cuenta) de las cuentas mencionadas en el texto, mejor primero."""
+        return self.index.match(text)[:self.max_accounts]
+
+    def account(self, account_id: str) -> Optional[Dict[str, Any]]:
+        return next((a for a in self.accounts if a.get("id") == account_id), None)
+
+    def block(self, text: str, all_categories: bool = False, fallback: bool = True) -> str:
+        """
+        Bloque de catálogos para el prompt.
+
+        `all_categories`: el clasificador necesita todas las categorías
+        (son pocas y fijas); en preguntas basta con las mencionadas.
+        `fallback`: si ninguna cuenta coincide, incluir una lista acotada.
+        """
+        matched = [account for _, account in self.match_accounts(text)]
+        if not matched and fallback:
+            matched = self.accounts[:self.fallback_accounts]
+
+        if all_categories:
+            categories = self.categories
+        else:
+            category = match_category(text, self.categories)
+            categories = [category] if category else self.categories
+
+        return minify({
+            "cuentas": [compact_account(a) for a in matched],
+            "tiposTransaccion": self.types,
+            "categorias": categories,
+        })
+
+    def question_block(self, text: str) -> str:
+        """Bloque para una pregunta: cuentas solo si se mencionan."""
+        return self.block(text, fallback=bool(ACCOUNT_WORDS_RE.search(fold(text))))
+
+    def statement_block(self, markdown: str) -> str:
+        """Bloque para un extracto: las cuentas se buscan en su encabezado."""
+        return self.block(markdown[:HEADER_CHARS], all_categories=True)
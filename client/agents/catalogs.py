@@ -0,0 +1,58 @@
+"""
+Utilidades para leer los catálogos que expone el MCP como recursos
+(`notion://accounts`, `notion://typetransactions`, `notion://typespend`)
+y para normalizar texto en español al compararlo contra ellos.
+"""
+import json
+import re
+import unicodedata
+from typing import Dict, List
+
+
+def fold(text: str) -> str:
+    """Minúsculas y sin acentos: 'Súper Mercado' → 'super mercado'."""
+    decomposed = unicodedata.normalize("NFKD", text or "")
+    return "".join(c for c in decomposed if not unicodedata.combining(c)).lower()
+
+
+def parse_catalogs(resource_names: List[str]) -> Dict[str, list]:
+    """
+    Interpreta los recursos ya serializados (`r.as_string()`).
+
+    Devuelve {"accounts": [...], "typetransactions": [...], "typespend": [...]}.
+    Los dos catálogos de tipos tienen la misma forma ({"data": {"types": []}}),
+    se distinguen porque el de transacciones solo contiene Credito/Debito.
+    """
+    catalogs = {"accounts": [], "typetransactions": [], "typespend": []}
+    for raw in resource_names:
+        try:
+            data = json.loads(raw)
+        except (TypeError, json.JSONDecodeError):
+            continue
+
+        if isinstance(data, list) and data and isinstance(data[0], dict) and "id" in data[0]:
+            catalogs["accounts"] = data
+            continue
+
+        types = (data.get("data") or {}).get("types") if isinstance(data, dict) else None
+        if not types:
+            continue
+        if {fold(t) for t in types} <= {"credito", "debito", "ingreso"}:
+            catalogs["typetransactions"] = types
+        else:
+            catalogs["typespend"] = types
+    return catalogs
+
+
+def match_category(text: str, categories: List[str]) -> str | None:
+    """Devuelve la categoría del catálogo mencionada en el texto (la más larga gana)."""
+    folded = fold(text)
+    words = set(re.findall(r"\w+", folded))
+    best = None
+    for category in categories:
+        key = fold(category)
+        # "supermercado" también debe encontrar "Super Mercado"
+        if re.search(rf"\b{re.escape(key)}\b", folded) or key.replace(" ", "") in words:
+            if best is None or len(category) > len(best):
+                best = category
+    return best
@@ -1,11 +1,37 @@
-from typing import Dict, Any
+import uuid
+from typing import Dict, Any, Optional
 from datetime import datetime
-from langchain_core.language_models import BaseLanguageModel
-from langchain_core.messages import SystemMessage, HumanMessage
+from langchain_core.messages import SystemMessage, HumanMessage, AIMessage, ToolMessage
+from agents.model_tiering import ModelTierPolicy
+from agents.ingest_journal import IngestJournal
+from agents.blob_store import resolve_blob
+from agents.catalog_retriever import CATALOG_SLOT, CatalogRetriever
+from agents.account_index import account_label
+from agents.loop_controller import LoopController
+from agents.categorizer import Categorizer
+from agents.movements import INSERT_TOOL, accepted_insert, current_run
+from agents.statement_parser import parse_rows
 
 
-def make_finance_classifier_node(llm: BaseLanguageModel, finance_catalog_json: list[str]):
-    catalogs_block = "\n".join(finance_catalog_json)
+def make_finance_classifier_node(tier_policy: ModelTierPolicy, finance_catalog_json: list[str],
+                                 journal: IngestJournal = None, controller: LoopController = None,
+                                 categorizer: Optional[Categorizer] = None, min_confidence: float = 0.8):
+    """
+    Con `categorizer` (ver agents/categorizer.py), el primer paso de un
+    extracto inserta sin LLM las filas que el modelo local clasifica con
+    confianza y cuyo tipo (Débito/Crédito) se lee en el propio extracto.
+    El LLM recibe después el extracto completo con la lista de lo ya
+    insertado y extrae el resto, incluidas las filas que el parser no
+    reconoce.
+
+    La cuenta origen la resuelve antes el nodo `resolve_account`
+    (agents/account_index.py): si es única, se le indica al LLM y se fija
+    en cada insert.
+    """
+    controller = controller or LoopController()
+    # Solo las cuentas del extracto (por su encabezado) entran al prompt
+    retriever = CatalogRetriever(finance_catalog_json)
+    catalogs_block = CATALOG_SLOT
     today = datetime.today().strftime("%Y-%m-%d")
     system_prompt = f"""Eres Finance-Expert-Classify, especialista en procesar extractos bancarios y gestionar transacciones financieras.
 
@@ -17,18 +43,16 @@ def make_finance_classifier_node(llm: BaseLanguageModel, finance_catalog_json: l
 ### 🧠 PROTOCOLO DE PROCESAMIENTO:
 
 **FASE 1 - EXTRACCIÓN (cuando recibes un extracto nuevo):**
-- Identifica a que cuenta pertenece el extracto - ese sera el origen de las transacciones
+- El origen de las transacciones es la cuenta del extracto: si recibes "CUENTA ORIGEN", usa ese ID; si no, identifícala por el encabezado
 - Extrae TODAS las transacciones del extracto bancario
 - Usa las herramientas para insertar cada transacción
 - Clasifica según los catálogos disponibles
 - Después de llamar herramientas, espera los resultados
 
-**FASE 2 - VERIFICACIÓN (después de ejecutar herramientas):**
-- Revisa los resultados de las inserciones en el historial de mensajes
-- Verifica que todas las transacciones se procesaron correctamente
-- Identifica si hay errores en las inserciones
-- Si faltan transacciones por procesar, regresa a FASE 1
-- Si todas están procesadas correctamente, pasa a FASE 3
+**FASE 2 - VERIFICACIÓN (automática):**
+- Tras cada lote de inserciones el sistema concilia el extracto contra la base de datos
+- Si faltan filas, recibirás un mensaje "VERIFICACIÓN AUTOMÁTICA" con la lista exacta
+- Inserta SOLO las filas listadas; no vuelvas a insertar las demás
 
 **FASE 3 - FINALIZACIÓN:**
 - Proporciona un resumen final de las transacciones procesadas
@@ -39,20 +63,19 @@ def make_finance_classifier_node(llm: BaseLanguageModel, finance_catalog_json: l
 ### 🔍 CÓMO IDENTIFICAR EN QUÉ FASE ESTÁS:
 
 1. **¿Hay un extracto nuevo sin procesar?** → FASE 1 (Extracción)
-2. **¿Acabas de recibir respuestas de herramientas de inserción?** → FASE 2 (Verificación)
-3. **¿Ya verificaste que todas las transacciones están procesadas?** → FASE 3 (Finalización)
+2. **¿Recibiste un mensaje de VERIFICACIÓN AUTOMÁTICA?** → inserta solo las filas faltantes
+3. **¿No hay conciliación disponible y ya insertaste todo?** → FASE 3 (Finalización)
 
 ### 📋 INDICADORES CLAROS POR FASE:
 
 **FASE 1 - Responde:** "Iniciando extracción de transacciones..." + usar herramientas
-**FASE 2 - Responde:** "Verificando inserciones..." + revisar resultados + decidir siguiente paso
 **FASE 3 - Responde:** "Procesamiento completado. Resumen final:" + NO MÁS HERRAMIENTAS
 
 ### 💡 Reglas especiales de clasificación:
 - Si la descripción contiene patrones como `1/25`, `2/12`, etc., clasifica como **"Cuotas"** o **"Gasto Recurrente"**
 - Si el monto tiene símbolo `$` o proviene de una columna marcada en **dólares**, convierte el valor a **quetzales** multiplicando por **8**
 - Fechas: usa formato YYYY-MM-DD
-- Tipos de transacción comunes: "Debito", "Ingreso"
+- Tipos de transacción: usa exactamente los del catálogo de tipos de transacción
 
 ### ⚠️ REGLAS CRÍTICAS:
 1. **No dupliques transacciones**: verifica el historial antes de insertar
@@ -79,65 +102,167 @@ Fecha actual: {today}
 Recuerda: Identifica tu fase actual, actúa según el protocolo y sé claro sobre tu estado.
 """
 
+    def local_pass(md: str, origin: Optional[str]) -> Optional[AIMessage]:
+        """Tool calls de insert para las filas seguras, o None si no aplica."""
+        # La cuenta tiene que estar resuelta sin ambigüedad
+        if not categorizer or not categorizer.ready or not origin:
+            return None
+        confident, doubtful = categorizer.classify(parse_rows(md), min_confidence)
+        # Sin el tipo escrito en el extracto (columna de débitos/créditos) un
+        # reembolso se archivaría como cargo: esas filas van al LLM
+        doubtful += [row for row in confident if row["statement_type"] != row["type"]]
+        confident = [row for row in confident if row["statement_type"] == row["type"]]
+        if not confident:
+            return None
+
+        calls = []
+        for row in confident:
+            args = {"date": row["date"].isoformat(), "amount": row["amount"], "description": row["description"],
+                    "type": row["type"], "spendType": row["spendType"], "origin": origin}
+            calls.append({"name": INSERT_TOOL, "id": f"local-{uuid.uuid4().hex[:12]}",
+                          "args": {k: v for k, v in args.items() if v != ""}})
+        print(f"🧠 Categorizador local: {len(confident)} filas seguras, {len(doubtful)} para el LLM")
+        return AIMessage(content=(
+            f"Iniciando extracción de transacciones... {len(confident)} filas clasificadas con el "
+            f"categorizador local; {len(doubtful)} quedan para revisión."
+        ), tool_calls=calls)
+
+    def already_inserted(state: Dict[str, Any], statement_id: Optional[str]) -> list:
+        """Filas del extracto ya aceptadas: del journal o, sin él, los inserts locales de la corrida."""
+        if statement_id:
+            return [r for r in journal.rows(statement_id) if r["_status"] != "failed"]
+        run = current_run(state.get("messages", []))
+        accepted = {m.tool_call_id for m in run if isinstance(m, ToolMessage) and accepted_insert(m.content)}
+        return [
+            call["args"] for m in run if isinstance(m, AIMessage)
+            for call in (m.tool_calls or []) if call["name"] == INSERT_TOOL and call["id"] in accepted
+        ]
+
+    def origin_message(state: Dict[str, Any]) -> Optional[HumanMessage]:
+        """Cuenta origen resuelta, candidatas si fue ambigua o la probable si solo coincidieron los últimos 4."""
+        origin = state.get("origin_account")
+        if origin:
+            return HumanMessage(content=(
+                f"### CUENTA ORIGEN (resuelta automáticamente): {origin} ({account_label(retriever.account(origin))}). "
+                "Usa este ID como `origin` en todas las transacciones."
+            ))
+        candidates = [a for a in map(retriever.account, state.get("origin_candidates") or []) if a]
+        if state.get("origin_ambiguous") and candidates:
+            listado = "\n".join(f"- {a.get('id')}: {account_label(a)}" for a in candidates)
+            return HumanMessage(content=(
+                "### CUENTA ORIGEN AMBIGUA: el encabezado coincide con varias cuentas. "
+                f"Elige el `origin` entre estas según el extracto:\n{listado}"
+            ))
+        if candidates:
+            account = candidates[0]
+            return HumanMessage(content=(
+                f"### CUENTA ORIGEN PROBABLE (solo coinciden los últimos 4 dígitos): {account.get('id')} "
+                f"({account_label(account)}). Confírmala con el encabezado del extracto antes de usarla como `origin`."
+            ))
+        return None
+
     async def finance_classifier_node(state: Dict[str, Any]) -> Dict[str, Any]:
-        messages = [SystemMessage(content=system_prompt)]
+        statement_id = state.get("statement_id") if journal else None
+
+        # Extracto ya ingerido por completo: no-op sin LLM
+        if statement_id and journal.is_complete(statement_id):
+            inserted = journal.rows(statement_id, status="inserted")
+            return {"messages": [AIMessage(content=(
+                "Procesamiento completado. Este extracto ya había sido ingerido por completo "
+                f"({len(inserted)} movimientos); no se insertó nada nuevo."
+            ))], "completion": controller.finish(state, "already_ingested")}
+
+        # Presupuesto del ciclo: se corta antes de gastar otra llamada al LLM
+        loop = controller.step(state)
+        reason = controller.stop_reason(loop)
+        if reason:
+            loop_state = {**state, "loop": loop}
+            return {"messages": [AIMessage(content=(
+                f"Procesamiento detenido: {controller.describe(reason)}. "
+                f"Se insertaron {loop['inserted']} movimientos; revisa el extracto si faltan filas."
+            ))], "loop": loop, "completion": controller.finish(loop_state, reason)}
+
+        md = resolve_blob(state.get("markdown"))
+        # Lo insertado en corridas anteriores cuenta para la cobertura del extracto
+        if not state.get("loop") and statement_id:
+            loop = {**loop, "resumed": len(journal.rows(statement_id, status="inserted"))}
+        if md and not state.get("loop"):
+            local = local_pass(md, state.get("origin_account"))
+            if local:
+                # El siguiente paso le pasa al LLM el extracto completo (ver `llm` en `loop`)
+                return {"messages": [local], "loop": loop, "classifier_tier": 0}
+
+        block = retriever.statement_block(md) if md else retriever.block("", all_categories=True)
+        messages = [SystemMessage(content=system_prompt.replace(CATALOG_SLOT, block))]
         
         # Incluir TODO el historial para que el modelo tenga contexto completo
         if state.get("messages"):
             messages.extend(state["messages"])
 
+        tier_state = state
+
         # Solo agregar el markdown si es la primera vez que lo procesamos
-        if md := state.get("markdown"):
-            # Verificar si ya se procesó este extracto mirando el historial
-            already_processed = any(
-                "Iniciando extracción de transacciones" in str(msg.content) if hasattr(msg, 'content') else False
-                for msg in state.get("messages", [])
-            )
-            
-            if not already_processed:
+        if md:
+            # Primera llamada al LLM de la corrida (ocr_node reinicia `loop` por
+            # extracto); puede venir después del paso del categorizador local
+            if not (state.get("loop") or {}).get("llm"):
                 print("📄 Extracto bancario recibido para procesar")
                 print(md[:200] + "..." if len(md) > 200 else md)
                 messages.append(HumanMessage(content=f"### NUEVO EXTRACTO BANCARIO PARA PROCESAR:\n\n{md.strip()}"))
+                # Extracto nuevo: volver a empezar por el tier más barato
+                tier_state = {**state, "classifier_tier": 0, "loop": loop}
+
+                origin_note = origin_message(state)
+                if origin_note:
+                    messages.append(origin_note)
+
+                # Reanudación o categorizador local: informar qué filas ya se insertaron
+                done = already_inserted(state, statement_id)
+                if done:
+                    listado = "\n".join(
+                        f"- {r.get('date')} | {r.get('amount')} | {r.get('description')}" for r in done
+                    )
+                    if loop.get("resumed"):
+                        print(f"🔁 Reanudando extracto: {loop['resumed']} filas ya insertadas")
+                    messages.append(HumanMessage(content=(
+                        "### FILAS DEL EXTRACTO YA INSERTADAS (en una corrida anterior o por el categorizador "
+                        f"local; NO las vuelvas a insertar, procesa todas las demás):\n{listado}"
+                    )))
+
+        response, tier = await tier_policy.ainvoke(messages, tier_state)
+        pin_origin(response, state.get("origin_account"))
 
-        response = await llm.ainvoke(messages)
+        loop = {**loop, "llm": True}
+        update = {"messages": [response], "classifier_tier": tier, "loop": loop}
+        if not getattr(response, "tool_calls", None):
+            # Sin tool calls el modelo dio su resumen: la corrida termina aquí
+            update["completion"] = controller.finish({**state, "loop": loop}, "complete")
+            if statement_id:
+                if journal.complete(statement_id):
+                    print("📒 Extracto marcado como completo en el journal")
+                else:
+                    print("📒 El extracto queda en progreso: hay filas pendientes o fallidas, o ninguna insertada")
 
-        return {
-            "messages": [response]
-        }
+        return update
 
     return finance_classifier_node
 
 
-# FUNCIÓN DE CONDICIÓN PERSONALIZADA para detectar cuándo terminar
+def pin_origin(response, origin: Optional[str]):
+    """Con la cuenta resuelta, ningún insert puede ir a otra cuenta."""
+    if not origin:
+        return
+    for call in getattr(response, "tool_calls", None) or []:
+        if call.get("name") == INSERT_TOOL and call.get("args", {}).get("origin") != origin:
+            call["args"] = {**call.get("args", {}), "origin": origin}
+
+
 def finance_phase_condition(state):
     """
-    Determina si el classifier debe llamar tools o terminar basándose en las fases
+    Tools si el clasificador pidió herramientas y la corrida no tiene
+    `completion` (ver agents/loop_controller.py); si no, END.
     """
     last_message = state["messages"][-1] if state.get("messages") else None
-    
-    if not last_message:
+    if state.get("completion") or not getattr(last_message, "tool_calls", None):
         return "END"
-    
-    # Si el último mensaje tiene tool_calls, ejecutar herramientas
-    if hasattr(last_message, 'tool_calls') and last_message.tool_calls:
-        return "tools"
-    
-    # Verificar si el mensaje indica que estamos en FASE 3 (finalización)
-    if hasattr(last_message, 'content') and last_message.content:
-        content = last_message.content.lower()
-        
-        # Indicadores de que estamos en FASE 3 y debemos terminar
-        completion_indicators = [
-            "procesamiento completado",
-            "resumen final:",
-            "✅ todas las transacciones",
-            "fase 3",
-            "finalización completada"
-        ]
-        
-        if any(indicator in content for indicator in completion_indicators):
-            print("🏁 Detectado: Proceso en FASE 3 - Terminando")
-            return "END"
-    
-    # Si no hay tool_calls y no está en fase 3, algo puede estar mal, terminar
-    return "END"
+    return "tools"
@@ -15,6 +15,8 @@ from typing import List, Dict, Any
 from datetime import datetime
 from langchain_core.language_models import BaseLanguageModel
 from langchain_core.messages import SystemMessage, HumanMessage
+from agents.catalog_retriever import CATALOG_SLOT, CatalogRetriever
+from agents.blob_store import resolve_blob
 
 
 def make_finance_expert_node(
@@ -33,7 +35,8 @@ def make_finance_expert_node(
     """
 
     # ---------- 1) Prompt del sistema ----------
-    catalogs_block = "\n".join(finance_catalog_json)
+    retriever = CatalogRetriever(finance_catalog_json)
+    catalogs_block = CATALOG_SLOT
     today =  datetime.today().strftime("%Y-%m-%d")
     system_prompt = f"""
 Eres **Finance-Expert Agent**, un asistente financiero personal.
@@ -86,12 +89,19 @@ El usuario también puede hacer preguntas como:
     async def finance_expert_node(state: Dict[str, Any]) -> Dict[str, Any]:
         """Actualiza solo 'messages'; las tool-calls las ejecuta ToolNode."""
         messages = state.get("messages", []).copy()
+        md = resolve_blob(state.get("markdown"))
+
+        # Catálogos relevantes: los del extracto o los de la última pregunta
+        if md:
+            block = retriever.statement_block(md)
+        else:
+            block = retriever.question_block(str(messages[-1].content) if messages else "")
 
         # Añadimos el system prompt AL INICIO de la lista
-        messages.insert(0, SystemMessage(content=system_prompt))
+        messages.insert(0, SystemMessage(content=system_prompt.replace(CATALOG_SLOT, block)))
 
         # Si existe markdown (viene del OCR) lo enviamos como contexto
-        if md := state.get("markdown"):
+        if md:
            
             messages.append(
                 HumanMessage(
@@ -2,13 +2,18 @@ from typing import Dict, Any
 from datetime import datetime
 from langchain_core.language_models import BaseLanguageModel
 from langchain_core.messages import SystemMessage, HumanMessage, AIMessage, ToolMessage
+from agents.resilience import Upstream, CircuitOpenError, classify_error
+from agents.catalog_retriever import CATALOG_SLOT, CatalogRetriever
 
 
-def make_finance_qa_node(llm: BaseLanguageModel, finance_catalog_json: list[str]):
-    catalogs_block = "\n".join(finance_catalog_json)
+def make_finance_qa_node(llm: BaseLanguageModel, finance_catalog_json: list[str], upstream: Upstream = None):
+    upstream = upstream or Upstream("openai")
+    # Por pregunta: solo las cuentas y categorías que se mencionan
+    retriever = CatalogRetriever(finance_catalog_json)
+    catalogs_block = CATALOG_SLOT
     today = datetime.today().strftime("%Y-%m-%d")
 
-    system_prompt = f"""
+    system_prompt_template = f"""
 Eres Finance-Expert-QA, un asistente especializado en responder preguntas financieras del usuario usando las herramientas disponibles.
 Catálogos disponibles:
 {catalogs_block}
@@ -22,7 +27,7 @@ Responde siempre en formato markdown
 Fecha actual: {today}
 """
 
-    def clean_and_optimize_messages(messages: list, max_messages: int = 12) -> list:
+    def clean_and_optimize_messages(messages: list, system_prompt: str, max_messages: int = 12) -> list:
         """
         Limpia y optimiza la lista de mensajes manteniendo el contexto importante
         """
@@ -133,9 +138,14 @@ Fecha actual: {today}
 
     async def finance_qa_node(state: Dict[str, Any]) -> Dict[str, Any]:
         messages = state.get("messages", [])
+        # Las dos últimas preguntas: cubre seguimientos como "¿y en la otra tarjeta?"
+        recent_questions = [str(m.content) for m in messages if isinstance(m, HumanMessage)][-2:]
+        system_prompt = system_prompt_template.replace(
+            CATALOG_SLOT, retriever.question_block("\n".join(recent_questions))
+        )
         
         # Limpiar y optimizar mensajes
-        optimized_messages = clean_and_optimize_messages(messages)
+        optimized_messages = clean_and_optimize_messages(messages, system_prompt)
         
         # Comprimir contenido muy largo si es necesario
         final_messages = []
@@ -171,10 +181,15 @@ Fecha actual: {today}
                     print(f"⚠️  Advertencia: ToolMessage en posición {i} sin AIMessage previo")
         
         try:
-            ai_msg = await llm.ainvoke(final_messages)
+            ai_msg = await upstream.call(lambda: llm.ainvoke(final_messages))
             return {"messages": [ai_msg]}
         except Exception as e:
             print(f"❌ Error en el LLM: {e}")
+            if classify_error(e)[0] or isinstance(e, CircuitOpenError):
+                # Saturación o caída: ya se reintentó; repetir con otro prompt no ayuda
+                return {"messages": [AIMessage(
+                    content="⚠️ El modelo no está disponible en este momento. Intenta de nuevo en unos segundos."
+                )]}
             # En caso de error, intentar con mensajes más básicos
             basic_messages = [
                 SystemMessage(content=system_prompt),
@@ -0,0 +1,98 @@
+"""
+Preprocesado de imágenes antes del OCR.
+
+Las fotos de estados de cuenta tomadas con el teléfono pesan 8–12 MB y
+tienen mucha más resolución de la que el OCR necesita. Cada página se
+corrige de orientación (EXIF), se pasa a escala de grises, se reduce a
+`MAX_SIDE` px en el lado mayor y se recomprime como JPEG.
+
+Memoria acotada:
+- los JPEG se decodifican ya reducidos (`Image.draft`, escalado DCT), sin
+  cargar nunca la imagen a resolución completa;
+- PNG, WebP y TIFF no admiten decodificación reducida: se rechazan las
+  páginas de más de `MAX_SOURCE_PIXELS` antes de decodificarlas (el
+  encabezado ya trae el tamaño);
+- los TIFF multipágina se procesan página a página;
+- el JPEG resultante va a un archivo temporal en spool y el base64 se
+  genera por bloques.
+"""
+import base64
+import tempfile
+from pathlib import Path
+from typing import Iterator, Tuple
+from PIL import Image, ImageSequence
+
+MAX_SIDE = 2000
+# Tope para formatos que se decodifican completos: 50 MP en RGBA son ~200 MB
+# (un escaneo carta a 600 dpi tiene ~34 MP)
+MAX_SOURCE_PIXELS = 50_000_000
+JPEG_QUALITY = 80
+CHUNK = 3 * 64 * 1024  # múltiplo de 3: los bloques base64 se concatenan sin relleno intermedio
+
+# Todas salen como JPEG en escala de grises, sea cual sea el formato de entrada
+IMAGE_EXTENSIONS = (".png", ".jpg", ".jpeg", ".webp", ".tif", ".tiff")
+
+
+# Orientación EXIF → transposición que la corrige
+EXIF_ORIENTATION = 0x0112
+ORIENTATION_FIX = {
+    2: Image.Transpose.FLIP_LEFT_RIGHT,
+    3: Image.Transpose.ROTATE_180,
+    4: Image.Transpose.FLIP_TOP_BOTTOM,
+    5: Image.Transpose.TRANSPOSE,
+    6: Image.Transpose.ROTATE_270,
+    7: Image.Transpose.TRANSVERSE,
+    8: Image.Transpose.ROTATE_90,
+}
+
+
+def _prepare(page: Image.Image, max_side: int) -> Image.Image:
+    orientation = page.getexif().get(EXIF_ORIENTATION, 1)
+    page = page.convert("L")
+    page.thumbnail((max_side, max_side), Image.LANCZOS)
+    # Se rota ya reducida: rotar la original duplicaría el pico de memoria
+    if orientation in ORIENTATION_FIX:
+        page = page.transpose(ORIENTATION_FIX[orientation])
+    return page
+
+
+def _data_uri(fileobj) -> str:
+    fileobj.seek(0)
+    parts = ["data:image/jpeg;base64,"]
+    while chunk := fileobj.read(CHUNK):
+        parts.append(base64.b64encode(chunk).decode("ascii"))
+    return "".join(parts)
+
+
+def iter_ocr_pages(path: str, max_side: int = MAX_SIDE, quality: int = JPEG_QUALITY) -> Iterator[Tuple[str, dict]]:
+    """
+    Devuelve, página a página, (data URI listo para el OCR, estadísticas).
+    Un TIFF multipágina produce una entrada por página.
+    """
+    source_bytes = Path(path).stat().st_size
+    with Image.open(path) as img:
+        original_size = img.size
+        if img.format == "JPEG":
+            # Decodifica directamente a 1/2, 1/4 u 1/8 de la resolución
+            img.draft("L", (max_side, max_side))
+
+        frames = ImageSequence.Iterator(img) if getattr(img, "n_frames", 1) > 1 else [img]
+        for index, frame in enumerate(frames):
+            if img.format != "JPEG" and frame.size[0] * frame.size[1] > MAX_SOURCE_PIXELS:
+                raise ValueError(
+                    f"Página {index + 1} de {frame.size[0]}x{frame.size[1]} px excede el máximo de "
+                    f"{MAX_SOURCE_PIXELS / 1e6:.0f} MP para {img.format}; reduce la imagen o envíala como JPEG/PDF."
+                )
+            page = _prepare(frame, max_side)
+            with tempfile.SpooledTemporaryFile(max_size=4 * 1024 * 1024) as out:
+                page.save(out, format="JPEG", quality=quality, optimize=True)
+                stats = {
+                    "page": index + 1,
+                    "source_bytes": source_bytes,
+                    "source_size": original_size,
+                    "size": page.size,
+                    "bytes": out.tell(),
+                }
+                uri = _data_uri(out)
+            page.close()
+            yield uri, stats
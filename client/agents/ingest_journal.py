@@ -0,0 +1,153 @@
+"""
+Journal de ingesta de extractos (SQLite).
+
+Cada extracto se identifica por la huella (sha256) de su archivo. Cada
+fila que el clasificador intenta insertar queda registrada como
+pending → inserted (con el ID de la página de Notion) o failed. Con esto:
+
+- reenviar un extracto ya completo es un no-op (ni OCR ni LLM);
+- reenviar uno interrumpido solo inserta las filas que faltan;
+- el tool node nunca repite un insert que ya tuvo éxito.
+"""
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional
+from agents.catalogs import fold
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS statements (
+    fingerprint  TEXT PRIMARY KEY,
+    source       TEXT,
+    status       TEXT NOT NULL,            -- in_progress | complete
+    created_at   REAL NOT NULL,
+    completed_at REAL
+);
+CREATE TABLE IF NOT EXISTS rows (
+    fingerprint TEXT NOT NULL,
+    row_key     TEXT NOT NULL,
+    args        TEXT NOT NULL,
+    status      TEXT NOT NULL,             -- pending | inserted | failed
+    page_id     TEXT,
+    error       TEXT,
+    updated_at  REAL NOT NULL,
+    PRIMARY KEY (fingerprint, row_key)
+);
+"""
+
+
+def fingerprint_file(path: str, chunk_size: int = 1 << 20) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(chunk_size):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def fingerprint_text(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def row_key(args: dict, occurrence: int = 0) -> str:
+    """
+    Identidad de una fila: fecha, monto, descripción normalizada y cuenta,
+    más el ordinal de la fila entre las idénticas del mismo extracto (el
+    mismo pasaje de bus dos veces el mismo día son dos filas).
+    """
+    amount = args.get("amount")
+    parts = [
+        str(args.get("date", "")),
+        f"{float(amount):.2f}" if isinstance(amount, (int, float)) else str(amount),
+        " ".join(fold(str(args.get("description", ""))).split()),
+        str(args.get("origin", "")),
+    ]
+    if occurrence:
+        parts.append(str(occurrence))  # la primera conserva la clave de siempre
+    return hashlib.sha1("|".join(parts).encode("utf-8")).hexdigest()
+
+
+class IngestJournal:
+    def __init__(self, path: str = "ingest_journal.db"):
+        # El OCR corre en un hilo del executor: conexión compartida + lock
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(SCHEMA)
+        self._lock = threading.Lock()
+
+    def _execute(self, sql: str, params: tuple = ()):
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    # ---------- Extractos ----------
+    def start_statement(self, fingerprint: str, source: str):
+        self._execute(
+            "INSERT OR IGNORE INTO statements (fingerprint, source, status, created_at) VALUES (?, ?, 'in_progress', ?)",
+            (fingerprint, source, time.time()),
+        )
+
+    def is_complete(self, fingerprint: str) -> bool:
+        rows = self._execute("SELECT status FROM statements WHERE fingerprint = ?", (fingerprint,))
+        return bool(rows) and rows[0][0] == "complete"
+
+    def complete(self, fingerprint: str, reconciled: bool = False) -> bool:
+        """
+        Marca el extracto como completo si no quedan filas pendientes o
+        fallidas y hay evidencia de que se procesó: al menos una fila
+        insertada o una conciliación sin faltantes. Un extracto sin filas
+        (el modelo no pudo leerlo o se negó) queda en progreso y se reintenta.
+        """
+        open_rows, inserted = self._execute(
+            "SELECT COALESCE(SUM(status != 'inserted'), 0), COALESCE(SUM(status = 'inserted'), 0) "
+            "FROM rows WHERE fingerprint = ?", (fingerprint,)
+        )[0]
+        if open_rows or not (inserted or reconciled):
+            return False
+        self._execute(
+            "UPDATE statements SET status = 'complete', completed_at = ? WHERE fingerprint = ?",
+            (time.time(), fingerprint),
+        )
+        return True
+
+    # ---------- Filas ----------
+    def lookup(self, fingerprint: str, key: str) -> Optional[Dict]:
+        rows = self._execute(
+            "SELECT status, page_id, error FROM rows WHERE fingerprint = ? AND row_key = ?", (fingerprint, key)
+        )
+        if not rows:
+            return None
+        status, page_id, error = rows[0]
+        return {"status": status, "page_id": page_id, "error": error}
+
+    def _upsert(self, fingerprint: str, key: str, args: Optional[dict], status: str,
+                page_id: Optional[str] = None, error: Optional[str] = None):
+        self._execute(
+            """INSERT INTO rows (fingerprint, row_key, args, status, page_id, error, updated_at)
+               VALUES (?, ?, ?, ?, ?, ?, ?)
+               ON CONFLICT (fingerprint, row_key) DO UPDATE SET
+                   status = excluded.status, page_id = excluded.page_id,
+                   error = excluded.error, updated_at = excluded.updated_at""",
+            (fingerprint, key, json.dumps(args or {}, ensure_ascii=False), status, page_id, error, time.time()),
+        )
+
+    def mark_pending(self, fingerprint: str, key: str, args: dict):
+        self._upsert(fingerprint, key, args, "pending")
+
+    def mark_inserted(self, fingerprint: str, key: str, args: dict, page_id: str):
+        self._upsert(fingerprint, key, args, "inserted", page_id=page_id)
+
+    def mark_failed(self, fingerprint: str, key: str, args: dict, error: str):
+        self._upsert(fingerprint, key, args, "failed", error=error)
+
+    def rows(self, fingerprint: str, status: Optional[str] = None) -> List[Dict]:
+        sql = "SELECT args, status, page_id FROM rows WHERE fingerprint = ?"
+        params: tuple = (fingerprint,)
+        if status:
+            sql += " AND status = ?"
+            params += (status,)
+        return [
+            {**json.loads(args), "_status": st, "_page_id": page_id}
+            for args, st, page_id in self._execute(sql + " ORDER BY updated_at", params)
+        ]
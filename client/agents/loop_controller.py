@@ -0,0 +1,113 @@
+"""
+Control del ciclo finance_classifier → tools → reconcile.
+
+Antes el ciclo terminaba buscando frases ("procesamiento completado",
+"fase 3"...) en la respuesta del modelo; si el modelo las redactaba
+distinto, el ciclo seguía hasta el recursion limit de LangGraph. Ahora el
+estado lleva `loop` (pasos, inicio, filas insertadas, pasos sin progreso)
+y cada salida del ciclo deja un `completion` estructurado:
+
+    {"status": "complete" | "reconciled" | "incomplete" | "converged"
+               | "step_budget" | "time_budget" | "already_ingested",
+     "steps": N, "seconds": S, "inserted": K, ...}
+
+El clasificador consulta el controlador antes de llamar al LLM, así que
+un ciclo desbocado se corta sin gastar otra llamada.
+"""
+import json
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+from agents.movements import count_inserted
+
+DEFAULT_MAX_STEPS = 6
+# fetch_user_info, router_node, ocr_node y resolve_account corren antes del ciclo
+PRE_LOOP_SUPERSTEPS = 4
+
+STOP_MESSAGES = {
+    "converged": "no hubo inserciones nuevas en los últimos {patience} pasos",
+    "step_budget": "se alcanzó el límite de {max_steps} pasos",
+    "time_budget": "se alcanzó el límite de {max_seconds:.0f} s",
+}
+
+
+class LoopController:
+    def __init__(self, max_steps: int = DEFAULT_MAX_STEPS, max_seconds: float = 600.0, patience: int = 2,
+                 log_path: Optional[str] = "loop_log.jsonl", on_finish: Optional[List[Callable]] = None):
+        # Cada paso son 3 supersteps (clasificador, tools, reconcile); quien
+        # invoca el grafo pasa `recursion_limit(config)` para que alcancen
+        self.max_steps = max_steps
+        self.max_seconds = max_seconds
+        self.patience = patience
+        self.log_path = Path(log_path) if log_path else None
+        # Callables `(state, completion)` que se llaman al cerrar cada corrida
+        self.on_finish = on_finish or []
+
+    def step(self, state: Dict[str, Any]) -> Dict[str, Any]:
+        """Registra una llamada del clasificador (el primer paso abre la corrida)."""
+        loop = state.get("loop")
+        if not loop:
+            return {"steps": 1, "started": time.time(), "baseline": count_inserted(state.get("messages", [])),
+                    "inserted": 0, "per_step": [], "stalls": 0}
+        return {**loop, "steps": loop["steps"] + 1}
+
+    def progress(self, state: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Tras cada lote de tools: filas nuevas insertadas y pasos seguidos sin progreso."""
+        loop = state.get("loop")
+        if not loop:
+            return None
+        inserted = count_inserted(state.get("messages", [])) - loop["baseline"]
+        new_rows = inserted - loop["inserted"]
+        return {
+            **loop,
+            "inserted": inserted,
+            "per_step": loop["per_step"] + [new_rows],
+            "stalls": 0 if new_rows else loop["stalls"] + 1,
+        }
+
+    def stop_reason(self, loop: Dict[str, Any]) -> Optional[str]:
+        if loop["stalls"] >= self.patience:
+            return "converged"
+        if loop["steps"] > self.max_steps:
+            return "step_budget"
+        if time.time() - loop["started"] > self.max_seconds:
+            return "time_budget"
+        return None
+
+    def describe(self, reason: str) -> str:
+        return STOP_MESSAGES[reason].format(
+            patience=self.patience, max_steps=self.max_steps, max_seconds=self.max_seconds
+        )
+
+    def finish(self, state: Dict[str, Any], status: str, **extra) -> Dict[str, Any]:
+        """Completion estructurado de la corrida; se imprime y se agrega al log."""
+        loop = state.get("loop") or {}
+        completion = {
+            "status": status,
+            "steps": loop.get("steps", 0),
+            "seconds": round(time.time() - loop["started"], 2) if loop else 0.0,
+            "inserted": loop.get("inserted", 0),
+            "per_step": loop.get("per_step", []),
+            **extra,
+        }
+        print(f"🏁 Ciclo del clasificador: {status} — {completion['steps']} pasos, "
+              f"{completion['inserted']} filas insertadas en {completion['seconds']:.1f}s")
+        if self.log_path:
+            with open(self.log_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps({"ts": time.time(), **completion}, ensure_ascii=False) + "\n")
+        for hook in self.on_finish:
+            try:
+                hook(state, completion)
+            except Exception as e:
+                print(f"⚠️ Hook {getattr(hook, '__qualname__', hook)} falló: {e}")
+        return completion
+
+
+def recursion_limit(config: Dict[str, Any]) -> int:
+    """
+    `recursion_limit` de LangGraph para el `loop.max_steps` de config.yaml:
+    los supersteps previos al ciclo, 3 por paso y la última llamada del
+    clasificador (la que corta), con margen. Nunca menos que el default (25).
+    """
+    max_steps = int((config.get("loop") or {}).get("max_steps", DEFAULT_MAX_STEPS))
+    return max(25, PRE_LOOP_SUPERSTEPS + 3 * max_steps + 1 + 2)
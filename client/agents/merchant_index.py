@@ -0,0 +1,347 @@
+"""
+Índice local de búsqueda difusa sobre descripciones de movimientos.
+
+Índice invertido en memoria sobre trigramas de texto sin acentos
+ni mayúsculas, de modo que "la torre" encuentra
+"SUPER MERCADO LA TORRE #12". Se alimenta de dos formas:
+
+- `sync()`: trae de Notion (tool `list-movements`) solo lo creado desde
+  la última sincronización; `refresh()` la lanza en segundo plano;
+- `observe()`: observer del tool node que agrega cada `insert-movement`
+  exitoso al instante.
+
+Los movimientos de un mismo comercio repiten casi siempre el texto y solo
+cambian los números (sucursal, autorización, cuotas), así que los
+trigramas con letras se indexan por "forma" (la descripción sin tokens
+numéricos) y solo los trigramas numéricos van por movimiento. Una búsqueda
+cuenta coincidencias sobre unas pocas formas en vez de sobre todo el
+historial.
+
+El estado se persiste como snapshot (pickle) más un log JSONL de las
+altas posteriores al snapshot.
+"""
+import asyncio
+import heapq
+import json
+import math
+import os
+import pickle
+import re
+import time
+from collections import Counter, defaultdict
+from itertools import chain
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+from langchain_core.tools import BaseTool, StructuredTool
+from agents.catalogs import fold
+from agents.movements import INSERT_TOOL, inserted_page_id, tool_text
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text: str) -> List[str]:
+    return TOKEN_RE.findall(fold(text))
+
+
+def trigrams(tokens: List[str]) -> set:
+    grams = set()
+    for token in tokens:
+        padded = f" {token} "
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+def is_digit_gram(gram: str) -> bool:
+    """Trigrama sin letras (" 12", "345"): solo sale de tokens con números."""
+    return gram.strip().isdigit()
+
+
+class MerchantIndex:
+    def __init__(self, path: str = "merchant_index.pkl", min_score: float = 0.6, snapshot_every: int = 500):
+        self.path = Path(path)
+        self.log_path = self.path.with_suffix(".log.jsonl")
+        self.min_score = min_score
+        self.snapshot_every = snapshot_every
+
+        self.docs: List[Dict[str, Any]] = []
+        self.ids: Dict[str, int] = {}
+        self.shapes: Dict[tuple, int] = {}                           # tokens con letras → forma
+        self.shape_docs: List[List[int]] = []                        # forma → movimientos
+        self.shape_grams: List[int] = []                             # forma → nº de trigramas con letras
+        self.gram_postings: Dict[str, List[int]] = defaultdict(list)  # trigrama con letras → formas
+        self.digit_postings: Dict[str, List[int]] = defaultdict(list)  # trigrama numérico → movimientos
+        self.watermark: Optional[str] = None     # created_time del último movimiento sincronizado
+        self.last_sync = 0.0
+        self._pending_log = 0
+        self._sync_lock = asyncio.Lock()
+        self._sync_task: Optional[asyncio.Task] = None
+        self._load()
+
+    # ---------- Persistencia ----------
+    def _load(self):
+        if self.path.exists():
+            with open(self.path, "rb") as f:
+                snapshot = pickle.load(f)
+            self.docs = snapshot["docs"]
+            self.ids = snapshot["ids"]
+            self.watermark = snapshot["watermark"]
+            if "shapes" in snapshot:
+                self.shapes = snapshot["shapes"]
+                self.shape_docs = snapshot["shape_docs"]
+                self.shape_grams = snapshot["shape_grams"]
+                self.gram_postings = defaultdict(list, snapshot["gram_postings"])
+                self.digit_postings = defaultdict(list, snapshot["digit_postings"])
+            else:
+                # Snapshot anterior a las formas: se reindexa desde los documentos
+                for doc_id in range(len(self.docs)):
+                    self._index(doc_id)
+        if self.log_path.exists():
+            with open(self.log_path, "r", encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        self._add(json.loads(line))
+                    except json.JSONDecodeError:
+                        continue  # última línea truncada
+
+    def save(self):
+        tmp = self.path.with_suffix(".tmp")
+        with open(tmp, "wb") as f:
+            pickle.dump({
+                "docs": self.docs,
+                "ids": self.ids,
+                "shapes": self.shapes,
+                "shape_docs": self.shape_docs,
+                "shape_grams": self.shape_grams,
+                "gram_postings": dict(self.gram_postings),
+                "digit_postings": dict(self.digit_postings),
+                "watermark": self.watermark,
+            }, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, self.path)
+        self.log_path.unlink(missing_ok=True)
+        self._pending_log = 0
+
+    # ---------- Altas ----------
+    def _index(self, doc_id: int):
+        tokens = self.docs[doc_id]["tokens"]
+        shape = tuple(t for t in tokens if not t.isdigit())
+        shape_id = self.shapes.get(shape)
+        if shape_id is None:
+            shape_id = self.shapes[shape] = len(self.shape_docs)
+            self.shape_docs.append([])
+            letter_grams = [g for g in trigrams(list(shape)) if not is_digit_gram(g)]
+            self.shape_grams.append(len(letter_grams))
+            for gram in letter_grams:
+                self.gram_postings[gram].append(shape_id)
+        self.shape_docs[shape_id].append(doc_id)
+        self.docs[doc_id]["shape"] = shape_id
+        for gram in trigrams(tokens):
+            if is_digit_gram(gram):
+                self.digit_postings[gram].append(doc_id)
+
+    def _add(self, movement: Dict[str, Any]) -> bool:
+        page_id = movement.get("id")
+        if not page_id or page_id in self.ids:
+            return False
+        tokens = tokenize(movement.get("description", ""))
+        doc_id = len(self.docs)
+        self.docs.append({
+            "id": page_id,
+            "date": movement.get("date", ""),
+            "amount": movement.get("amount", 0),
+            "description": movement.get("description", ""),
+            "type": movement.get("type", ""),
+            "spendType": movement.get("spendType", ""),
+            "tokens": tokens,
+            "grams": len(trigrams(tokens)),
+        })
+        self.ids[page_id] = doc_id
+        self._index(doc_id)
+        if movement.get("created") and (self.watermark is None or movement["created"] > self.watermark):
+            self.watermark = movement["created"]
+        return True
+
+    def add(self, movement: Dict[str, Any]):
+        """Alta incremental durable: índice en memoria + log."""
+        if not self._add(movement):
+            return
+        with open(self.log_path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(movement, ensure_ascii=False) + "\n")
+        self._pending_log += 1
+        if self._pending_log >= self.snapshot_every:
+            self.save()
+
+    def observe(self, name: str, args: dict, result: Any):
+        """Observer para el tool node: indexa cada insert exitoso."""
+        if name != INSERT_TOOL:
+            return
+        page_id = inserted_page_id(result)
+        if page_id:
+            self.add({
+                "id": page_id,
+                "date": args.get("date", ""),
+                "amount": args.get("amount", 0),
+                "description": args.get("description", ""),
+                "type": args.get("type", ""),
+                "spendType": args.get("spendType", ""),
+            })
+
+    @property
+    def syncing(self) -> bool:
+        return self._sync_task is not None and not self._sync_task.done()
+
+    def refresh(self, list_tool: BaseTool, limiter=None, max_age: float = 600.0):
+        """Lanza `sync` en segundo plano si toca; ninguna búsqueda lo espera."""
+        if self.syncing or time.time() - self.last_sync < max_age:
+            return
+        self._sync_task = asyncio.create_task(self._background_sync(list_tool, limiter, max_age))
+
+    async def _background_sync(self, list_tool: BaseTool, limiter, max_age: float):
+        try:
+            await self.sync(list_tool, limiter=limiter, max_age=max_age)
+        except Exception as e:
+            print(f"⚠️ No se pudo sincronizar el índice de comercios: {e}")
+
+    async def sync(self, list_tool: BaseTool, limiter=None, max_age: float = 600.0):
+        """
+        Trae de Notion lo creado desde el watermark (como mucho cada `max_age`
+        s). El filtro es inclusivo porque created_time tiene resolución de
+        minutos: lo ya indexado de ese minuto se descarta por ID.
+        """
+        async with self._sync_lock:
+            if time.time() - self.last_sync < max_age:
+                return
+            cursor, added = None, 0
+            watermark = self.watermark
+            while True:
+                args = {"pageSize": 100}
+                if cursor:
+                    args["startCursor"] = cursor
+                if watermark:
+                    args["createdAfter"] = watermark
+                if limiter:
+                    raw = await limiter.call(lambda: list_tool.ainvoke(args))
+                else:
+                    raw = await list_tool.ainvoke(args)
+                page = json.loads(tool_text(raw))
+                added += sum(self._add(m) for m in page["movements"])
+                if not page.get("hasMore"):
+                    break
+                cursor = page["nextCursor"]
+            self.last_sync = time.time()
+            if added:
+                self.save()
+                print(f"🔎 Índice de comercios: +{added} movimientos ({len(self.docs)} en total)")
+
+    # ---------- Búsqueda ----------
+    def search(self, query: str, limit: int = 10, offset: int = 0) -> Dict[str, Any]:
+        q_tokens = tokenize(query)
+        q_grams = trigrams(q_tokens)
+        if not q_grams:
+            return {"total": 0, "results": []}
+
+        # Un documento califica si comparte al menos `need` trigramas de la
+        # consulta: los de letras se cuentan por forma y los numéricos por
+        # movimiento (un trigrama es de un tipo u otro, nunca de ambos).
+        n_grams = len(q_grams)
+        need = max(1, math.ceil(self.min_score * n_grams))
+        letter_grams = [g for g in q_grams if not is_digit_gram(g)]
+        digit_grams = [g for g in q_grams if is_digit_gram(g)]
+        q_token_set = set(q_tokens)
+        want = offset + limit
+
+        def score(hits: int, doc_grams: int, exact: int) -> float:
+            jaccard = hits / max(n_grams + doc_grams - hits, 1)
+            return hits / n_grams + 0.5 * jaccard + 0.25 * exact / len(q_token_set)
+
+        if not digit_grams:
+            # Todos los movimientos de una forma comparten coincidencias y
+            # tokens exactos; solo cambia cuántos trigramas numéricos tienen.
+            # Se recorren las formas de mayor a menor cota y se corta en
+            # cuanto ninguna puede entrar en la página.
+            shape_hits = Counter(chain.from_iterable(self.gram_postings.get(g, ()) for g in letter_grams))
+            bounds = []
+            total = 0
+            for shape_id, hits in shape_hits.items():
+                if hits < need:
+                    continue
+                total += len(self.shape_docs[shape_id])
+                exact = len(q_token_set.intersection(self.docs[self.shape_docs[shape_id][0]]["tokens"]))
+                bounds.append((score(hits, self.shape_grams[shape_id], exact), shape_id, hits, exact))
+            bounds.sort(reverse=True)
+            top: List[tuple] = []
+            for bound, shape_id, hits, exact in bounds:
+                if len(top) >= want and bound < top[0][0]:
+                    break
+                for doc_id in self.shape_docs[shape_id]:
+                    doc = self.docs[doc_id]
+                    item = (score(hits, doc["grams"], exact), doc["date"], doc_id)
+                    if len(top) < want:
+                        heapq.heappush(top, item)
+                    else:
+                        heapq.heappushpop(top, item)
+            page = sorted(top, reverse=True)[offset:]
+        else:
+            # Formas que califican por sí solas, más los movimientos que
+            # completan lo que falta con trigramas numéricos
+            digit_hits = Counter(chain.from_iterable(self.digit_postings.get(g, ()) for g in digit_grams))
+            shape_hits = Counter(chain.from_iterable(self.gram_postings.get(g, ()) for g in letter_grams))
+            candidates = [
+                doc_id for shape_id, hits in shape_hits.items() if hits >= need for doc_id in self.shape_docs[shape_id]
+            ]
+            candidates += [
+                doc_id for doc_id in digit_hits if shape_hits.get(self.docs[doc_id]["shape"], 0) < need
+            ]
+            scored = []
+            for doc_id in candidates:
+                doc = self.docs[doc_id]
+                hits = shape_hits.get(doc["shape"], 0) + digit_hits.get(doc_id, 0)
+                if hits < need:
+                    continue
+                exact = len(q_token_set.intersection(doc["tokens"]))
+                scored.append((score(hits, doc["grams"], exact), doc["date"], doc_id))
+            total = len(scored)
+            page = heapq.nlargest(want, scored)[offset:]
+
+        return {
+            "total": total,
+            "results": [
+                {k: v for k, v in self.docs[d].items() if k not in ("tokens", "grams", "shape")} | {"score": round(s, 3)}
+                for s, _, d in page
+            ],
+        }
+
+
+def make_search_tool(index: MerchantIndex, list_tool: Optional[BaseTool] = None, limiter=None) -> BaseTool:
+    """Tool local `search-movements` (búsqueda difusa con ranking y paginación)."""
+
+    async def search_movements(query: str, limit: int = 10, offset: int = 0) -> str:
+        if list_tool:
+            index.refresh(list_tool, limiter=limiter)
+
+        found = index.search(query, limit=limit, offset=offset)
+        if not found["results"] and index.syncing and not index.docs:
+            # Primera carga en curso: el planificador delega al LLM y el LLM ve el error
+            raise RuntimeError("El índice de comercios se está cargando desde Notion; "
+                               "usa get-movements-by-keyword para esta consulta.")
+        if not found["results"]:
+            return f"No se encontraron movimientos parecidos a '{query}'."
+
+        lines = [
+            f"#{offset + i + 1} - Fecha: {m['date']}, Monto: {m['amount']}, Descripción: {m['description']}, "
+            f"Tipo: {m['type']}, Categoría: {m['spendType']}"
+            for i, m in enumerate(found["results"])
+        ]
+        shown_to = offset + len(found["results"])
+        lines.append(f"\nMostrando {offset + 1}-{shown_to} de {found['total']} coincidencias.")
+        return "\n".join(lines)
+
+    return StructuredTool.from_function(
+        coroutine=search_movements,
+        name="search-movements",
+        description=(
+            "Búsqueda difusa local de movimientos por comercio o descripción: ignora mayúsculas y acentos "
+            "y tolera variantes (p.ej. 'la torre' encuentra 'SUPER MERCADO LA TORRE #12'). "
+            "Devuelve resultados ordenados por relevancia; usa offset para paginar."
+        ),
+        metadata={"local": True},
+    )
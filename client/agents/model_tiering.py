@@ -0,0 +1,92 @@
+"""
+Selección adaptativa de modelo para el clasificador.
+
+Cada respuesta se genera primero con el modelo más barato de la lista de
+tiers; si la validación local detecta problemas (categorías fuera del
+catálogo, cuenta origen desconocida, fechas inválidas o filas faltantes al
+cerrar) se repite con el siguiente tier. Una vez escalada, la corrida se
+queda en el tier superior (`classifier_tier` en el estado).
+"""
+import re
+from typing import Any, Callable, Dict, List, Tuple
+from langchain_core.messages import AIMessage
+from agents.catalogs import parse_catalogs
+from agents.movements import INSERT_TOOL
+from agents.statement_parser import parse_rows
+from agents.blob_store import resolve_blob
+
+ISO_DATE_RE = re.compile(r"^\d{4}-\d{2}-\d{2}$")
+
+
+def make_classifier_validator(finance_catalog_json: List[str], min_coverage: float = 0.9) -> Callable:
+    catalogs = parse_catalogs(finance_catalog_json)
+    spend_types = set(catalogs["typespend"])
+    tx_types = set(catalogs["typetransactions"])
+    account_ids = {a["id"] for a in catalogs["accounts"]}
+
+    def validate(response: AIMessage, state: Dict[str, Any]) -> List[str]:
+        problems = []
+        tool_calls = getattr(response, "tool_calls", None) or []
+
+        for call in tool_calls:
+            if call["name"] != INSERT_TOOL:
+                continue
+            args = call.get("args") or {}
+            desc = args.get("description", "?")
+            if spend_types and args.get("spendType") and args["spendType"] not in spend_types:
+                problems.append(f"categoría fuera del catálogo: {args['spendType']} ({desc})")
+            if tx_types and args.get("type") and args["type"] not in tx_types:
+                problems.append(f"tipo fuera del catálogo: {args['type']} ({desc})")
+            if account_ids and args.get("origin") not in account_ids:
+                problems.append(f"cuenta origen desconocida: {args.get('origin')} ({desc})")
+            if not ISO_DATE_RE.match(str(args.get("date", ""))):
+                problems.append(f"fecha inválida: {args.get('date')} ({desc})")
+            if not isinstance(args.get("amount"), (int, float)):
+                problems.append(f"monto inválido: {args.get('amount')} ({desc})")
+
+        # Respuesta final: ¿se insertaron (casi) todas las filas del extracto?
+        if not tool_calls and state.get("markdown"):
+            # Mismas filas que concilia reconcile: sin totales, saldos ni fechas límite
+            expected = len(parse_rows(resolve_blob(state["markdown"])))
+            # Todo el extracto: esta corrida (`loop`, lo cuenta el ciclo) más lo
+            # insertado en corridas anteriores
+            loop = state.get("loop") or {}
+            inserted = loop.get("inserted", 0) + loop.get("resumed", 0)
+            if expected and inserted < expected * min_coverage:
+                problems.append(f"faltan filas: {inserted} insertadas de {expected} detectadas")
+
+        return problems
+
+    return validate
+
+
+class ModelTierPolicy:
+    """Invoca el tier más barato que pase la validación."""
+
+    def __init__(self, tiers: List[Tuple[str, Any]], validator: Callable, upstream=None):
+        if not tiers:
+            raise ValueError("Se necesita al menos un tier de modelo")
+        self.tiers = tiers
+        self.validator = validator
+        self.upstream = upstream  # agents.resilience.Upstream: ritmo y reintentos del proveedor
+
+    async def ainvoke(self, messages: list, state: Dict[str, Any]) -> Tuple[AIMessage, int]:
+        start = min(state.get("classifier_tier") or 0, len(self.tiers) - 1)
+        for tier in range(start, len(self.tiers)):
+            name, llm = self.tiers[tier]
+            if self.upstream:
+                response = await self.upstream.call(lambda: llm.ainvoke(messages))
+            else:
+                response = await llm.ainvoke(messages)
+            problems = self.validator(response, state)
+            is_last = tier == len(self.tiers) - 1
+
+            if not problems:
+                print(f"🎚️ Clasificador atendido por {name} (tier {tier})")
+                return response, tier
+            if is_last:
+                print(f"🎚️ Clasificador atendido por {name} (tier {tier}, último tier) con "
+                      f"{len(problems)} advertencias: {problems[:3]}")
+                return response, tier
+
+            print(f"⬆️ Escalando de {name} a {self.tiers[tier + 1][0]}: {problems[:3]}")
@@ -0,0 +1,288 @@
+"""
+Almacén columnar local del historial de movimientos.
+
+Formato (un directorio, un archivo por columna, sin dependencias):
+
+    meta.json              filas confirmadas, watermark (con los IDs de su minuto) y diccionarios
+    id.bin                 IDs de página, 36 bytes fijos por fila
+    date.i32               días desde 1970-01-01 (int32)
+    amount.f64             montos (float64)
+    type.u16               código en meta["dicts"]["type"] (uint16)
+    spendType.u16          código en meta["dicts"]["spendType"]
+    origin.u16             código en meta["dicts"]["origin"]
+    description.off        offset final de cada descripción (int64)
+    description.utf8       descripciones concatenadas
+
+El writer solo agrega al final y confirma cada lote reescribiendo
+meta.json de forma atómica; al abrir, cualquier byte escrito después de
+la última confirmación se descarta. El reader mapea los archivos con
+mmap y expone las columnas numéricas como memoryviews, sin parsear JSON.
+"""
+import json
+import mmap
+import os
+import sys
+from array import array
+from datetime import date
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+from langchain_core.tools import BaseTool, StructuredTool
+
+EPOCH = date(1970, 1, 1).toordinal()
+NULL_DATE = -(2 ** 31)
+ID_WIDTH = 36
+DICT_COLUMNS = ("type", "spendType", "origin")
+
+# (archivo, typecode de array, bytes por fila) de cada columna de ancho fijo
+FIXED_COLUMNS = {
+    "date": ("date.i32", "i", 4),
+    "amount": ("amount.f64", "d", 8),
+    "type": ("type.u16", "H", 2),
+    "spendType": ("spendType.u16", "H", 2),
+    "origin": ("origin.u16", "H", 2),
+    "description_end": ("description.off", "q", 8),
+}
+
+
+def date_to_days(value: str) -> int:
+    try:
+        return date.fromisoformat(value[:10]).toordinal() - EPOCH
+    except (TypeError, ValueError):
+        return NULL_DATE
+
+
+def days_to_date(days: int) -> Optional[date]:
+    return None if days == NULL_DATE else date.fromordinal(days + EPOCH)
+
+
+def _empty_meta() -> Dict[str, Any]:
+    return {"version": 1, "rows": 0, "description_bytes": 0, "watermark": None,
+            "dicts": {c: [] for c in DICT_COLUMNS}}
+
+
+def _read_meta(root: Path) -> Dict[str, Any]:
+    path = root / "meta.json"
+    if not path.exists():
+        return _empty_meta()
+    return json.loads(path.read_text(encoding="utf-8"))
+
+
+class MovementStoreWriter:
+    """Escritura incremental en memoria constante (un lote a la vez)."""
+
+    def __init__(self, root: str):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.meta = _read_meta(self.root)
+        self._codes = {c: {v: i for i, v in enumerate(self.meta["dicts"][c])} for c in DICT_COLUMNS}
+        self._truncate_uncommitted()
+
+    def _truncate_uncommitted(self):
+        rows = self.meta["rows"]
+        sizes = {filename: rows * width for filename, _, width in FIXED_COLUMNS.values()}
+        sizes["id.bin"] = rows * ID_WIDTH
+        sizes["description.utf8"] = self.meta["description_bytes"]
+        for filename, size in sizes.items():
+            path = self.root / filename
+            with open(path, "ab") as f:
+                f.truncate(size)
+
+    def _code(self, column: str, value: str) -> int:
+        codes = self._codes[column]
+        if value not in codes:
+            codes[value] = len(codes)
+            self.meta["dicts"][column].append(value)
+        return codes[value]
+
+    def append(self, movements: List[Dict[str, Any]]) -> int:
+        """
+        Agrega un lote y lo confirma; devuelve las filas agregadas. La
+        exportación relee el minuto del watermark (filtro inclusivo), así que
+        se descartan por ID los movimientos ya guardados de ese minuto.
+        """
+        boundary = set(self.meta.get("watermark_ids") or [])
+        movements = [m for m in movements if m.get("id") not in boundary]
+        if not movements:
+            return 0
+        columns = {name: array(code) for name, (_, code, _) in FIXED_COLUMNS.items()}
+        ids = bytearray()
+        descriptions = bytearray()
+        offset = self.meta["description_bytes"]
+
+        for m in movements:
+            ids += str(m.get("id", "")).encode("ascii", "ignore")[:ID_WIDTH].ljust(ID_WIDTH, b" ")
+            columns["date"].append(date_to_days(m.get("date", "")))
+            columns["amount"].append(float(m.get("amount") or 0))
+            for c in DICT_COLUMNS:
+                columns[c].append(self._code(c, m.get(c) or ""))
+            encoded = (m.get("description") or "").encode("utf-8")
+            descriptions += encoded
+            offset += len(encoded)
+            columns["description_end"].append(offset)
+
+        for name, (filename, _, _) in FIXED_COLUMNS.items():
+            col = columns[name]
+            if sys.byteorder != "little":
+                col.byteswap()
+            with open(self.root / filename, "ab") as f:
+                col.tofile(f)
+        with open(self.root / "id.bin", "ab") as f:
+            f.write(ids)
+        with open(self.root / "description.utf8", "ab") as f:
+            f.write(descriptions)
+
+        self.meta["rows"] += len(movements)
+        self.meta["description_bytes"] = offset
+        created = [m["created"] for m in movements if m.get("created")]
+        if created:
+            watermark = max([self.meta["watermark"] or "", *created])
+            if watermark != self.meta["watermark"]:
+                self.meta["watermark"], boundary = watermark, set()
+            boundary.update(m["id"] for m in movements if m.get("created") == watermark and m.get("id"))
+            self.meta["watermark_ids"] = sorted(boundary)
+        self._commit()
+        return len(movements)
+
+    def _commit(self):
+        for filename in [f for f, _, _ in FIXED_COLUMNS.values()] + ["id.bin", "description.utf8"]:
+            with open(self.root / filename, "ab") as f:
+                os.fsync(f.fileno())
+        tmp = self.root / "meta.json.tmp"
+        tmp.write_text(json.dumps(self.meta, ensure_ascii=False), encoding="utf-8")
+        os.replace(tmp, self.root / "meta.json")
+
+    @property
+    def watermark(self) -> Optional[str]:
+        return self.meta["watermark"]
+
+
+class MovementStore:
+    """Lectura mapeada en memoria. Las columnas numéricas son memoryviews."""
+
+    def __init__(self, root: str):
+        self.root = Path(root)
+        self.meta = _read_meta(self.root)
+        self.rows = self.meta["rows"]
+        self.dicts = self.meta["dicts"]
+        self._maps: List[mmap.mmap] = []
+        self.columns: Dict[str, memoryview] = {}
+
+        for name, (filename, code, width) in FIXED_COLUMNS.items():
+            self.columns[name] = self._map(filename, self.rows * width).cast(code)
+        self._ids = self._map("id.bin", self.rows * ID_WIDTH)
+        self._descriptions = self._map("description.utf8", self.meta["description_bytes"])
+
+    def _map(self, filename: str, size: int) -> memoryview:
+        if size == 0:
+            return memoryview(b"")
+        with open(self.root / filename, "rb") as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._maps.append(mm)
+        return memoryview(mm)[:size]
+
+    def close(self):
+        self.columns.clear()
+        self._ids = self._descriptions = None
+        for mm in self._maps:
+            try:
+                mm.close()
+            except BufferError:
+                pass  # aún hay vistas vivas fuera del store
+        self._maps.clear()
+
+    def __len__(self) -> int:
+        return self.rows
+
+    def description(self, i: int) -> str:
+        ends = self.columns["description_end"]
+        start = ends[i - 1] if i else 0
+        return bytes(self._descriptions[start:ends[i]]).decode("utf-8")
+
+    def page_id(self, i: int) -> str:
+        return bytes(self._ids[i * ID_WIDTH:(i + 1) * ID_WIDTH]).decode("ascii").strip()
+
+    def row(self, i: int) -> Dict[str, Any]:
+        day = days_to_date(self.columns["date"][i])
+        return {
+            "id": self.page_id(i),
+            "date": day.isoformat() if day else "",
+            "amount": self.columns["amount"][i],
+            "description": self.description(i),
+            **{c: self.dicts[c][self.columns[c][i]] for c in DICT_COLUMNS},
+        }
+
+    def iter_rows(self) -> Iterator[Dict[str, Any]]:
+        for i in range(self.rows):
+            yield self.row(i)
+
+    def iter_rows_by_date(self) -> Iterator[Dict[str, Any]]:
+        """Filas en orden de fecha (estable): índices agrupados por día desde la columna date."""
+        dates = self.columns["date"]
+        buckets: Dict[int, array] = {}
+        for i in range(self.rows):
+            bucket = buckets.get(dates[i])
+            if bucket is None:
+                bucket = buckets[dates[i]] = array("q")
+            bucket.append(i)
+        for day in sorted(buckets):
+            for i in buckets[day]:
+                yield self.row(i)
+
+    def totals_by_month(self, start: date, end: date, category: Optional[str] = None) -> Dict[tuple, float]:
+        """
+        {(YYYY-MM, categoría, tipo): total} recorriendo solo columnas
+        numéricas; débitos y créditos se suman por separado.
+        """
+        lo, hi = start.toordinal() - EPOCH, end.toordinal() - EPOCH
+        dates, amounts, spend = self.columns["date"], self.columns["amount"], self.columns["spendType"]
+        types = self.columns["type"]
+        wanted = self.dicts["spendType"].index(category) if category in self.dicts["spendType"] else None
+        if category and wanted is None:
+            return {}
+
+        totals: Dict[tuple, float] = {}
+        for i in range(self.rows):
+            d = dates[i]
+            if d < lo or d > hi or (wanted is not None and spend[i] != wanted):
+                continue
+            day = date.fromordinal(d + EPOCH)
+            key = (f"{day.year:04d}-{day.month:02d}", self.dicts["spendType"][spend[i]], self.dicts["type"][types[i]])
+            totals[key] = totals.get(key, 0.0) + amounts[i]
+        return totals
+
+
+def has_export(root: str) -> bool:
+    return (Path(root) / "meta.json").exists()
+
+
+def make_history_tool(root: str) -> BaseTool:
+    """Tool local `get-history-summary`: totales mensuales desde la exportación."""
+
+    async def get_history_summary(startDate: str, endDate: str, category: Optional[str] = None) -> str:
+        store = MovementStore(root)
+        try:
+            totals = store.totals_by_month(date.fromisoformat(startDate), date.fromisoformat(endDate), category)
+            watermark = store.meta["watermark"]
+        finally:
+            store.close()
+        if not totals:
+            return f"No hay movimientos exportados entre {startDate} y {endDate}."
+        lines = [f"{month} | {cat} | {type_} | {total:.2f}" for (month, cat, type_), total in sorted(totals.items())]
+        by_type: Dict[str, float] = {}
+        for (_, _, type_), total in totals.items():
+            by_type[type_] = by_type.get(type_, 0.0) + total
+        summary = "; ".join(f"{type_ or 'sin tipo'}: {total:.2f}" for type_, total in sorted(by_type.items()))
+        lines.append(f"\nTotal por tipo: {summary} (datos exportados hasta {watermark}).")
+        return "Mes | Categoría | Tipo | Total\n" + "\n".join(lines)
+
+    return StructuredTool.from_function(
+        coroutine=get_history_summary,
+        name="get-history-summary",
+        description=(
+            "Totales por mes, categoría y tipo (Debito = gastos, Credito = ingresos, por separado) sobre el "
+            "historial exportado localmente (rangos largos, comparaciones entre meses o años). Fechas "
+            "YYYY-MM-DD; category es opcional. "
+            "Puede no incluir los movimientos más recientes que la última exportación."
+        ),
+        metadata={"local": True},
+    )
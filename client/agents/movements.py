@@ -0,0 +1,59 @@
+"""
+Helpers compartidos para leer los resultados de las tools de movimientos.
+"""
+import json
+import re
+from typing import Any, List, Optional
+from langchain_core.messages import ToolMessage, HumanMessage
+
+INSERT_TOOL = "insert-movement"
+
+PAGE_ID_RE = re.compile(r"\(ID: ([0-9a-fA-F-]{32,36})\)")
+# Ack de la cola write-behind (agents/outbox.py): aceptado, aún no en Notion
+QUEUED_RE = re.compile(r"\(En cola: (\d+)\)")
+# `name` de los HumanMessage que genera el grafo (no el usuario)
+AUTO_MESSAGE = "auto"
+
+
+def tool_text(content: Any) -> str:
+    """El tool node guarda `json.dumps(result)`; devuelve el texto original."""
+    if isinstance(content, str):
+        try:
+            content = json.loads(content)
+        except json.JSONDecodeError:
+            return content
+    if isinstance(content, list):
+        return "\n".join(c.get("text", "") if isinstance(c, dict) else str(c) for c in content)
+    return str(content)
+
+
+def inserted_page_id(result: Any) -> Optional[str]:
+    """ID de la página creada por `insert-movement`, o None si falló."""
+    match = PAGE_ID_RE.search(tool_text(result))
+    return match.group(1) if match else None
+
+
+def accepted_insert(result: Any) -> bool:
+    """Insert creado en Notion o aceptado por la cola write-behind."""
+    text = tool_text(result)
+    return bool(PAGE_ID_RE.search(text) or QUEUED_RE.search(text))
+
+
+def count_inserted(messages: List[Any]) -> int:
+    """Número de inserciones exitosas (o encoladas) en el historial de mensajes."""
+    return sum(
+        1 for m in messages
+        if isinstance(m, ToolMessage) and m.name == INSERT_TOOL and accepted_insert(m.content)
+    )
+
+
+def current_run(messages: List[Any]) -> List[Any]:
+    """
+    Mensajes desde el último mensaje del usuario (la corrida actual). Los
+    mensajes que inyecta el propio grafo (`name=AUTO_MESSAGE`, p.ej. la
+    verificación automática) no abren corrida.
+    """
+    for i in range(len(messages) - 1, -1, -1):
+        if isinstance(messages[i], HumanMessage) and getattr(messages[i], "name", None) != AUTO_MESSAGE:
+            return messages[i + 1:]
+    return list(messages)
@@ -1,26 +1,56 @@
 import os
-import base64
 import requests
 import tempfile
 import PyPDF2
 from mistralai import Mistral
 from langchain_core.runnables import RunnableConfig
 from agents.schemas import State
+from agents.ingest_journal import IngestJournal, fingerprint_file, fingerprint_text
+from agents.blob_store import get_blob_store
+from agents.image_preprocess import IMAGE_EXTENSIONS, iter_ocr_pages
 
 class ocr_node:
-    def __init__(self, api_mistral: str):
+    def __init__(self, api_mistral: str, journal: IngestJournal = None):
         self.api_mistral = api_mistral
+        self.journal = journal
 
     def __call__(self, state: State, config: RunnableConfig):
-        client = Mistral(api_key=self.api_mistral)
         user_input = state["messages"][-1].content.strip()
         print(f"Archivo recibido: {user_input}")
 
+        statement_id = None
+        if self.journal:
+            if user_input.startswith("http"):
+                statement_id = fingerprint_text(user_input)
+            elif os.path.isfile(user_input):
+                statement_id = fingerprint_file(user_input)
+
+            if statement_id and self.journal.is_complete(statement_id):
+                print("⏭️ Extracto ya ingerido por completo; se omite el OCR.")
+                return {"messages": [("system", "Extracto ya ingerido previamente.")],
+                        "statement_id": statement_id, "markdown": "", "loop": None, "completion": None}
+
+        result = self._procesar(user_input, Mistral(api_key=self.api_mistral))
+
+        # El extracto completo va al blob store; el estado solo lleva la referencia
+        if result.get("markdown"):
+            result["markdown"] = get_blob_store().put(result["markdown"])
+
+        if statement_id and result.get("markdown"):
+            self.journal.start_statement(statement_id, user_input)
+        else:
+            statement_id = None
+        result["statement_id"] = statement_id
+        # Extracto nuevo: conciliación y control del ciclo empiezan de cero
+        result.update(reconcile_missing=None, loop=None, completion=None)
+        return result
+
+    def _procesar(self, user_input: str, client):
         if user_input.startswith("http"):
             return self._procesar_url_remota(user_input, client)
 
         ext = user_input.lower().split(".")[-1]
-        if ext in ["png", "jpg", "jpeg"]:
+        if f".{ext}" in IMAGE_EXTENSIONS:
             return self._procesar_imagen_local(user_input, client)
 
         elif ext == "pdf":
@@ -30,14 +60,22 @@ class ocr_node:
             return {"messages": [("system", f"Formato de archivo no soportado: {ext}")]}
 
     def _procesar_imagen_local(self, path, client):
-        base64_image = self.encode_image(path)
-        if not base64_image:
+        # Una llamada de OCR por página (los TIFF pueden traer varias)
+        markdowns = []
+        try:
+            for data_uri, stats in iter_ocr_pages(path):
+                print(f"🗜️ Página {stats['page']}: {stats['source_bytes'] / 1e6:.1f} MB "
+                      f"{stats['source_size'][0]}x{stats['source_size'][1]} → "
+                      f"{stats['bytes'] / 1e3:.0f} KB {stats['size'][0]}x{stats['size'][1]} (gris)")
+                ocr_response = client.ocr.process(
+                    model="mistral-ocr-latest",
+                    document={"type": "image_url", "image_url": data_uri}
+                )
+                markdowns.extend(page.markdown for page in ocr_response.pages)
+        except Exception as e:
+            print(f"Error al procesar imagen: {e}")
             return {"messages": [("system", "Error al procesar imagen local")]}
-        ocr_response = client.ocr.process(
-            model="mistral-ocr-latest",
-            document={"type": "image_url", "image_url": f"data:image/jpeg;base64,{base64_image}"}
-        )
-        markdown = "\n\n".join(page.markdown for page in ocr_response.pages)
+        markdown = "\n\n".join(markdowns)
         return {"messages": [("system", "Markdown combinado de todas las páginas extraído.")], "markdown": markdown}
 
     def _procesar_pdf_local(self, path, client):
@@ -57,7 +95,7 @@ class ocr_node:
 
     def _procesar_url_remota(self, url: str, client):
         ext = url.split("?")[0].lower().split(".")[-1]
-        if ext in ["png", "jpg", "jpeg"]:
+        if f".{ext}" in IMAGE_EXTENSIONS:
             ocr_response = client.ocr.process(
                 model="mistral-ocr-latest",
                 document={"type": "image_url", "image_url": url}
@@ -82,14 +120,6 @@ class ocr_node:
         else:
             return {"messages": [("system", f"Formato remoto no soportado: {ext}")]}
         
-    def encode_image(self, path):
-        try:
-            with open(path, "rb") as image_file:
-                return base64.b64encode(image_file.read()).decode("utf-8")
-        except Exception as e:
-            print(f"Error al codificar imagen: {e}")
-            return None
-
     def es_pdf_textual(self, path: str) -> str:
         if not os.path.isfile(path):
             print(f"El archivo {path} no existe.")
@@ -0,0 +1,341 @@
+"""
+Cola durable (write-behind) para los `insert-movement`.
+
+El tool node valida cada insert, lo guarda en una tabla SQLite y responde
+al clasificador en el acto ("encolado"); un flusher en segundo plano lo
+sube a Notion al ritmo del limitador compartido. Así la ingesta de un
+extracto avanza a velocidad de disco y la subida termina por detrás.
+
+- Durabilidad: el ack se da después del commit (`synchronous=FULL`).
+- Reintentos: un 429 o un breaker abierto no llegaron a crear nada y se
+  reintentan con backoff y jitter hasta `max_attempts`. Un timeout o un
+  5xx pueden llegar después de que Notion creó la página: la fila queda
+  `uncertain` y antes de reenviarla se busca en Notion (`list-movements`
+  por fecha, monto, descripción y cuenta). Los demás errores marcan la
+  fila como fallida.
+- Recuperación: al abrir la cola, las filas que quedaron `inflight` por
+  una caída vuelven a `queued` como `uncertain`, con la misma búsqueda
+  previa.
+- Journal: el flusher marca cada fila como insertada o fallida, y cierra
+  los extractos sellados cuando su cola se vacía.
+"""
+import asyncio
+import json
+import math
+import random
+import sqlite3
+import threading
+import time
+from datetime import date
+from typing import Any, Callable, Dict, List, Optional
+from langchain_core.tools import BaseTool
+from agents.catalogs import fold
+from agents.ingest_journal import IngestJournal
+from agents.movements import inserted_page_id, tool_text
+from agents.resilience import THROTTLED, CircuitOpenError, classify_error
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    id              INTEGER PRIMARY KEY AUTOINCREMENT,
+    statement_id    TEXT,
+    row_key         TEXT,
+    args            TEXT NOT NULL,
+    status          TEXT NOT NULL,         -- queued | inflight | done | failed
+    attempts        INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL,
+    enqueued_at     REAL NOT NULL,
+    done_at         REAL,
+    page_id         TEXT,
+    error           TEXT,
+    uncertain       INTEGER NOT NULL DEFAULT 0   -- un intento pudo haber creado la página
+);
+-- Los NULL no chocan: solo se deduplican las filas de un extracto
+CREATE UNIQUE INDEX IF NOT EXISTS outbox_row ON outbox (statement_id, row_key);
+CREATE INDEX IF NOT EXISTS outbox_due ON outbox (status, next_attempt_at);
+CREATE TABLE IF NOT EXISTS sealed (statement_id TEXT PRIMARY KEY);
+"""
+
+def validate_insert(args: dict) -> Optional[str]:
+    """Mismas reglas que el schema de `insert-movement`; None si es válido."""
+    try:
+        date.fromisoformat(str(args.get("date", "")))
+    except ValueError:
+        return f"fecha inválida {args.get('date')!r} (usa YYYY-MM-DD)"
+    amount = args.get("amount")
+    if isinstance(amount, bool) or not isinstance(amount, (int, float)) or not math.isfinite(amount):
+        return f"monto inválido {amount!r}"
+    for field in ("description", "origin"):
+        if not isinstance(args.get(field), str) or not args[field].strip():
+            return f"falta '{field}'"
+    for field in ("type", "spendType"):
+        if args.get(field) is not None and not isinstance(args[field], str):
+            return f"'{field}' debe ser texto"
+    return None
+
+
+class Outbox:
+    def __init__(self, path: str = "outbox.db"):
+        # Mismo patrón que IngestJournal: conexión compartida + lock
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=FULL")
+        self._conn.executescript(SCHEMA)
+        if "uncertain" not in {row[1] for row in self._conn.execute("PRAGMA table_info(outbox)")}:
+            self._conn.execute("ALTER TABLE outbox ADD COLUMN uncertain INTEGER NOT NULL DEFAULT 0")
+        self._lock = threading.Lock()
+        recovered = self._execute(
+            "UPDATE outbox SET status = 'queued', uncertain = 1 WHERE status = 'inflight' RETURNING id"
+        )
+        if recovered:
+            print(f"♻️ Cola de Notion: {len(recovered)} inserts en vuelo recuperados tras una interrupción")
+
+    def _execute(self, sql: str, params: tuple = ()):
+        with self._lock:
+            return self._conn.execute(sql, params).fetchall()
+
+    def enqueue(self, args: dict, statement_id: Optional[str] = None, key: Optional[str] = None) -> int:
+        """Encola (o reactiva, si había fallado) un insert; devuelve su id."""
+        now = time.time()
+        return self._execute(
+            """INSERT INTO outbox (statement_id, row_key, args, status, next_attempt_at, enqueued_at)
+               VALUES (?, ?, ?, 'queued', ?, ?)
+               ON CONFLICT (statement_id, row_key) DO UPDATE SET
+                   status = CASE WHEN status = 'failed' THEN 'queued' ELSE status END,
+                   attempts = CASE WHEN status = 'failed' THEN 0 ELSE attempts END,
+                   next_attempt_at = excluded.next_attempt_at
+               RETURNING id""",
+            (statement_id, key if statement_id else None, json.dumps(args, ensure_ascii=False), now, now),
+        )[0][0]
+
+    def claim(self) -> Optional[Dict[str, Any]]:
+        """Toma la fila vencida más antigua y la marca `inflight`."""
+        rows = self._execute(
+            """UPDATE outbox SET status = 'inflight', attempts = attempts + 1
+               WHERE id = (SELECT id FROM outbox WHERE status = 'queued' AND next_attempt_at <= ?
+                           ORDER BY id LIMIT 1)
+               RETURNING id, statement_id, row_key, args, attempts, uncertain""",
+            (time.time(),),
+        )
+        if not rows:
+            return None
+        id_, statement_id, key, args, attempts, uncertain = rows[0]
+        return {"id": id_, "statement_id": statement_id, "row_key": key, "args": json.loads(args),
+                "attempts": attempts, "uncertain": bool(uncertain)}
+
+    def mark_done(self, id_: int, page_id: str):
+        self._execute("UPDATE outbox SET status = 'done', page_id = ?, error = NULL, done_at = ? WHERE id = ?",
+                      (page_id, time.time(), id_))
+
+    def retry_later(self, id_: int, error: str, delay: float, uncertain: bool = False):
+        self._execute(
+            "UPDATE outbox SET status = 'queued', error = ?, next_attempt_at = ?, uncertain = uncertain OR ? "
+            "WHERE id = ?",
+            (error, time.time() + delay, int(uncertain), id_),
+        )
+
+    def claimed_pages(self, page_ids: List[str]) -> set:
+        """Cuáles de estas páginas ya están asignadas a otra fila de la cola."""
+        if not page_ids:
+            return set()
+        marks = ",".join("?" * len(page_ids))
+        rows = self._execute(f"SELECT page_id FROM outbox WHERE status = 'done' AND page_id IN ({marks})",
+                             tuple(page_ids))
+        return {page_id for (page_id,) in rows}
+
+    def mark_failed(self, id_: int, error: str):
+        self._execute("UPDATE outbox SET status = 'failed', error = ?, done_at = ? WHERE id = ?",
+                      (error, time.time(), id_))
+
+    def pending(self, origin: Optional[str] = None) -> List[dict]:
+        """Args de los inserts aún no confirmados por Notion."""
+        rows = self._execute("SELECT args FROM outbox WHERE status IN ('queued', 'inflight') ORDER BY id")
+        movements = [json.loads(args) for (args,) in rows]
+        return [m for m in movements if origin is None or m.get("origin") == origin]
+
+    def next_due(self) -> Optional[float]:
+        rows = self._execute("SELECT MIN(next_attempt_at) FROM outbox WHERE status = 'queued'")
+        return rows[0][0]
+
+    def stats(self) -> Dict[str, Any]:
+        """Profundidad de la cola y retraso (edad del insert pendiente más antiguo)."""
+        depth, oldest = self._execute(
+            "SELECT COUNT(*), MIN(enqueued_at) FROM outbox WHERE status IN ('queued', 'inflight')"
+        )[0]
+        failed = self._execute("SELECT COUNT(*) FROM outbox WHERE status = 'failed'")[0][0]
+        return {"depth": depth, "lag": time.time() - oldest if oldest else 0.0, "failed": failed}
+
+    # ---------- Extractos ----------
+    def seal(self, statement_id: str):
+        """El grafo terminó con el extracto: cerrarlo en el journal cuando su cola se vacíe."""
+        self._execute("INSERT OR IGNORE INTO sealed (statement_id) VALUES (?)", (statement_id,))
+
+    def drained_sealed(self) -> List[str]:
+        rows = self._execute(
+            """SELECT s.statement_id FROM sealed s WHERE NOT EXISTS (
+                   SELECT 1 FROM outbox o WHERE o.statement_id = s.statement_id
+                   AND o.status IN ('queued', 'inflight'))"""
+        )
+        return [sid for (sid,) in rows]
+
+    def unseal(self, statement_id: str):
+        self._execute("DELETE FROM sealed WHERE statement_id = ?", (statement_id,))
+
+
+class OutboxFlusher:
+    def __init__(self, outbox: Outbox, insert_tool: BaseTool, limiter, journal: Optional[IngestJournal] = None,
+                 observers: Optional[List[Callable]] = None, workers: int = 2, max_attempts: int = 8,
+                 max_backoff: float = 300.0, list_tool: Optional[BaseTool] = None):
+        self.outbox = outbox
+        self.insert_tool = insert_tool
+        # Sin list-movements una fila incierta no se puede verificar: se marca fallida, no se reenvía
+        self.list_tool = list_tool
+        self.limiter = limiter
+        self.journal = journal
+        self.observers = observers or []
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.max_backoff = max_backoff
+        self._tasks: List[asyncio.Task] = []
+        self._wake: Optional[asyncio.Event] = None
+
+    # ---------- API para el tool node ----------
+    def enqueue(self, args: dict, statement_id: Optional[str] = None, key: Optional[str] = None) -> int:
+        id_ = self.outbox.enqueue(args, statement_id, key)
+        self.start()
+        self._wake.set()
+        return id_
+
+    def seal(self, statement_id: Optional[str]):
+        """El grafo terminó con el extracto; se cierra en el journal al vaciarse su cola."""
+        if statement_id:
+            self.outbox.seal(statement_id)
+            self._close_sealed()
+
+    def start(self):
+        """Arranca los workers en el event loop actual (idempotente)."""
+        if self._tasks and not all(t.done() for t in self._tasks):
+            return
+        self._wake = asyncio.Event()
+        self._tasks = [asyncio.create_task(self._worker(), name=f"outbox-{i}") for i in range(self.workers)]
+
+    async def drain(self, timeout: Optional[float] = None) -> bool:
+        """Espera a que la cola se vacíe (p.ej. antes de salir de un script)."""
+        self.start()
+        deadline = time.monotonic() + timeout if timeout else None
+        while self.outbox.stats()["depth"]:
+            if deadline and time.monotonic() > deadline:
+                return False
+            self._wake.set()
+            await asyncio.sleep(0.2)
+        return True
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    # ---------- Workers ----------
+    async def _worker(self):
+        while True:
+            row = self.outbox.claim()
+            if row is None:
+                await self._idle()
+                continue
+            await self._flush(row)
+            self._close_sealed()
+
+    async def _idle(self):
+        due = self.outbox.next_due()
+        timeout = max(0.05, due - time.time()) if due else 5.0
+        self._wake.clear()
+        try:
+            await asyncio.wait_for(self._wake.wait(), timeout=timeout)
+        except asyncio.TimeoutError:
+            pass
+
+    async def _flush(self, row: Dict[str, Any]):
+        args = row["args"]
+        try:
+            if row["uncertain"]:
+                # Un intento anterior pudo haber creado la página: buscarla antes de reenviar
+                existing = await self._find_existing(row)
+                if existing:
+                    print(f"🔎 Cola de Notion: '{args.get('description')}' ya estaba en Notion ({existing})")
+                    self._done(row, existing, f"Movimiento insertado con éxito (ID: {existing})")
+                    return
+            # No idempotente: el Upstream solo reintenta 429; el resto lo decide la cola
+            result = await self.limiter.call(lambda: self.insert_tool.ainvoke(args), idempotent=False)
+        except Exception as e:
+            kind = classify_error(e)[0]
+            # 429 o breaker abierto: Notion no recibió el insert. Timeout o 5xx: quizá sí
+            uncertain = kind is not None and kind != THROTTLED
+            if uncertain and self.list_tool is None:
+                self._fail(row, f"{e} (resultado incierto: verifica en Notion antes de reintentar)")
+            elif (kind or isinstance(e, CircuitOpenError)) and row["attempts"] < self.max_attempts:
+                delay = random.uniform(0, min(self.max_backoff, 2 ** row["attempts"]))
+                self.outbox.retry_later(row["id"], str(e), delay, uncertain=uncertain)
+                print(f"⏳ Cola de Notion: reintento {row['attempts']} de '{args.get('description')}' en {delay:.1f}s")
+            else:
+                self._fail(row, str(e))
+            return
+
+        page_id = inserted_page_id(result)
+        if not page_id:
+            self._fail(row, str(result))
+            return
+        self._done(row, page_id, result)
+
+    async def _find_existing(self, row: Dict[str, Any]) -> Optional[str]:
+        """Página de Notion con la misma fecha, monto, descripción y cuenta que aún no es de otra fila."""
+        if self.list_tool is None:
+            raise RuntimeError("resultado incierto y sin list-movements para verificarlo")
+        args = row["args"]
+        query = {"origin": args["origin"], "startDate": args["date"], "endDate": args["date"], "pageSize": 100}
+        raw = await self.limiter.call(lambda: self.list_tool.ainvoke(query))
+        description = " ".join(fold(args["description"]).split())
+        matches = [
+            m["id"] for m in json.loads(tool_text(raw))["movements"]
+            if abs(float(m.get("amount") or 0) - float(args["amount"])) < 0.005
+            and " ".join(fold(m.get("description", "")).split()) == description
+        ]
+        taken = self.outbox.claimed_pages(matches)
+        if self.journal and row["statement_id"]:
+            taken |= {r["_page_id"] for r in self.journal.rows(row["statement_id"], status="inserted")}
+        return next((page_id for page_id in matches if page_id not in taken), None)
+
+    def _done(self, row: Dict[str, Any], page_id: str, result: Any):
+        args, statement_id, key = row["args"], row["statement_id"], row["row_key"]
+        self.outbox.mark_done(row["id"], page_id)
+        if self.journal and statement_id:
+            self.journal.mark_inserted(statement_id, key, args, page_id)
+        for observer in self.observers:
+            try:
+                observer(self.insert_tool.name, args, result)
+            except Exception as e:
+                print(f"⚠️ Observer {getattr(observer, '__qualname__', observer)} falló: {e}")
+
+    def _fail(self, row: Dict[str, Any], error: str):
+        self.outbox.mark_failed(row["id"], error)
+        if self.journal and row["statement_id"]:
+            self.journal.mark_failed(row["statement_id"], row["row_key"], row["args"], error)
+        print(f"❌ Cola de Notion: insert fallido '{row['args'].get('description')}': {error}")
+
+    def _close_sealed(self):
+        for statement_id in self.outbox.drained_sealed():
+            if self.journal and self.journal.complete(statement_id):
+                print("📒 Extracto marcado como completo en el journal (cola de Notion vacía)")
+            self.outbox.unseal(statement_id)
+
+
+_default_flusher: Optional[OutboxFlusher] = None
+
+
+def set_write_behind(flusher: Optional[OutboxFlusher]):
+    global _default_flusher
+    _default_flusher = flusher
+
+
+def get_write_behind() -> Optional[OutboxFlusher]:
+    """Flusher configurado por build_graph, o None si la cola está desactivada."""
+    return _default_flusher
@@ -0,0 +1,137 @@
+"""
+Prefetch especulativo para `finance_qa`.
+
+Mientras el LLM decide qué tool llamar, se lanzan en paralelo las
+consultas más probables según la pregunta (rango de fechas y categoría
+que aparecen en el texto). Los resultados quedan unos segundos en una
+caché; si el LLM pide exactamente esa llamada, el tool node la toma de
+ahí en vez de ir a Notion.
+
+Cada prefetch que caduca sin usarse se registra en un JSONL junto con la
+pregunta que lo originó, para poder ajustar la heurística.
+"""
+import asyncio
+import json
+import time
+from datetime import date, datetime, timedelta
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+from langchain_core.tools import BaseTool
+from agents.catalogs import match_category, parse_catalogs
+from agents.query_planner import resolve_period
+from agents.resilience import is_idempotent_tool
+
+MISS = object()
+
+
+def cache_key(name: str, args: dict) -> str:
+    """Clave canónica: el orden de los args y los None no importan."""
+    clean = {k: v for k, v in args.items() if v is not None}
+    return name + json.dumps(clean, sort_keys=True, ensure_ascii=False)
+
+
+def speculate(text: str, categories: List[str], today: Optional[date] = None) -> List[Tuple[str, dict]]:
+    """Llamadas probables para la pregunta, de la más a la menos probable."""
+    today = today or date.today()
+    category = match_category(text, categories)
+    period = resolve_period(text, today)
+
+    if period:
+        ranges = [period]
+    else:
+        # Sin fechas explícitas casi siempre se pregunta por este mes o el anterior
+        last_month_end = today.replace(day=1) - timedelta(days=1)
+        ranges = [(today.replace(day=1), today), (last_month_end.replace(day=1), last_month_end)]
+
+    calls = []
+    for start, end in ranges:
+        dates = {"startDate": start.isoformat(), "endDate": end.isoformat()}
+        if category:
+            calls.append(("get-total-by-category", {"category": category, **dates}))
+        elif period:
+            calls.append(("get-movements-by-date-range", dates))
+    return calls
+
+
+class Prefetcher:
+    def __init__(self, tools: List[BaseTool], finance_catalog_json: List[str], limiter=None,
+                 ttl: float = 30.0, max_calls: int = 2, log_path: Optional[str] = "prefetch_log.jsonl"):
+        self.tools_by_name: Dict[str, BaseTool] = {t.name: t for t in tools}
+        self.categories = parse_catalogs(finance_catalog_json)["typespend"]
+        self.limiter = limiter
+        self.ttl = ttl
+        self.max_calls = max_calls
+        self.log_path = Path(log_path) if log_path else None
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        self.stats = {"issued": 0, "hits": 0, "wasted": 0, "misses": 0}
+
+    # ---------- Lanzamiento ----------
+    def start(self, text: str):
+        """Lanza en segundo plano las llamadas probables para `text`."""
+        self._expire()
+        for name, args in speculate(text, self.categories)[:self.max_calls]:
+            tool = self.tools_by_name.get(name)
+            key = cache_key(name, args)
+            if tool is None or key in self._entries:
+                continue
+            task = asyncio.create_task(self._run(tool, args))
+            task.add_done_callback(lambda t: t.exception() if not t.cancelled() else None)
+            self._entries[key] = {"task": task, "created": time.monotonic(), "question": text, "used": False}
+            self.stats["issued"] += 1
+            print(f"🔮 Prefetch: {name} {args}")
+
+    async def _run(self, tool: BaseTool, args: dict):
+        if self.limiter:
+            return await self.limiter.call(lambda: tool.ainvoke(args))
+        return await tool.ainvoke(args)
+
+    # ---------- Consumo ----------
+    async def take(self, name: str, args: dict) -> Any:
+        """Resultado prefetcheado para la llamada, o MISS."""
+        self._expire()
+        entry = self._entries.get(cache_key(name, args))
+        if entry is None:
+            if name in self.tools_by_name:
+                self.stats["misses"] += 1
+            return MISS
+        try:
+            result = await entry["task"]
+        except Exception:
+            self._entries.pop(cache_key(name, args), None)
+            return MISS  # que el tool node haga la llamada normal
+        if not entry["used"]:
+            entry["used"] = True
+            self.stats["hits"] += 1
+        print(f"🎯 Prefetch aprovechado: {name}")
+        return result
+
+    def invalidate(self):
+        """Descarta todo (p.ej. tras un insert, que cambia los totales)."""
+        for key in list(self._entries):
+            self._discard(key)
+
+    def _expire(self):
+        now = time.monotonic()
+        for key, entry in list(self._entries.items()):
+            if now - entry["created"] > self.ttl:
+                self._discard(key)
+
+    def _discard(self, key: str):
+        entry = self._entries.pop(key)
+        if entry["used"]:
+            return
+        entry["task"].cancel()
+        self.stats["wasted"] += 1
+        if self.log_path:
+            with open(self.log_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps({
+                    "at": datetime.now().isoformat(timespec="seconds"),
+                    "question": entry["question"],
+                    "call": key,
+                    "stats": self.stats,
+                }, ensure_ascii=False) + "\n")
+
+    def observe(self, name: str, args: dict, result: Any):
+        """Observer del tool node: un insert invalida la caché."""
+        if not is_idempotent_tool(name):
+            self.invalidate()
@@ -0,0 +1,198 @@
+"""
+Planificador determinista para preguntas frecuentes.
+
+Reconoce formas comunes de pregunta ("últimos 10 movimientos",
+"¿cuánto gasté en supermercado el mes pasado?", "busca netflix"),
+resuelve las fechas relativas localmente, llama directo a la tool MCP y
+arma la respuesta con una plantilla: una sola llamada a tool, sin LLM.
+Si la pregunta no encaja con total seguridad, pasa a `finance_qa`.
+"""
+import re
+from datetime import date, timedelta
+from typing import Dict, Any, List, Optional, Tuple
+from langchain_core.messages import AIMessage
+from langchain_core.tools import BaseTool
+from agents.catalogs import fold, parse_catalogs, match_category
+
+MONTHS = {
+    "enero": 1, "febrero": 2, "marzo": 3, "abril": 4, "mayo": 5, "junio": 6, "julio": 7,
+    "agosto": 8, "septiembre": 9, "setiembre": 9, "octubre": 10, "noviembre": 11, "diciembre": 12,
+}
+
+NUMBER_WORDS = {"un": 1, "una": 1, "dos": 2, "tres": 3, "cuatro": 4, "cinco": 5, "seis": 6,
+                "siete": 7, "ocho": 8, "nueve": 9, "diez": 10, "quince": 15, "veinte": 20}
+
+LATEST_RE = re.compile(
+    r"^(?:cuales son |muestrame |dame |ver |lista(?:r)? )?(?:mis |los |las )?"
+    r"(?:ultim[oa]s|recientes)\s+(?:(\d+|\w+)\s+)?(?:movimientos|transacciones)$"
+)
+# "cuánto gasté en <categoría> <periodo>"; el resto se valida en plan_total
+TOTAL_RE = re.compile(
+    r"^(?:cuanto (?:dinero )?(?:he |hemos |se )?(?:gaste|gastado|gastamos|gasto)"
+    r"|(?:cual (?:es|fue) el )?total (?:de )?(?:gastos?|gastado))\s+(?:en|de|por)\s+(.+)$"
+)
+# Varias categorías o periodos, comparaciones y exclusiones: mejor el LLM
+COMPOUND_RE = re.compile(r"\b(?:y|e|o|u|vs|versus|comparad[oa]s?|contra|sin|excepto|salvo|menos|mas|ademas|incluyendo)\b")
+FILLER_WORDS = {"en", "el", "la", "los", "las", "de", "del", "por", "durante", "al", "a"}
+SEARCH_RE = re.compile(r"^(?:busca|buscar|buscame)\s+(?:movimientos\s+(?:de|con)\s+)?[\"']?(.+?)[\"']?$")
+
+
+def _month_bounds(year: int, month: int) -> Tuple[date, date]:
+    start = date(year, month, 1)
+    next_month = date(year + month // 12, month % 12 + 1, 1)
+    return start, next_month - timedelta(days=1)
+
+
+def resolve_period(text: str, today: Optional[date] = None) -> Optional[Tuple[date, date]]:
+    """Convierte expresiones relativas ("mes pasado", "en marzo") en (inicio, fin)."""
+    today = today or date.today()
+    t = fold(text)
+
+    if re.search(r"\bhoy\b", t):
+        return today, today
+    if re.search(r"\bayer\b", t):
+        y = today - timedelta(days=1)
+        return y, y
+    if re.search(r"\besta semana\b", t):
+        return today - timedelta(days=today.weekday()), today
+    if re.search(r"\bsemana (pasada|anterior)\b", t):
+        start = today - timedelta(days=today.weekday() + 7)
+        return start, start + timedelta(days=6)
+    if re.search(r"\beste mes\b", t):
+        return today.replace(day=1), today
+    if re.search(r"\bmes (pasado|anterior)\b", t):
+        last = today.replace(day=1) - timedelta(days=1)
+        return _month_bounds(last.year, last.month)
+    if re.search(r"\beste ano\b", t):
+        return date(today.year, 1, 1), today
+    if re.search(r"\bano (pasado|anterior)\b", t):
+        return date(today.year - 1, 1, 1), date(today.year - 1, 12, 31)
+    if m := re.search(r"\bultimos (\d+) dias\b", t):
+        return today - timedelta(days=int(m.group(1)) - 1), today
+    if m := re.search(rf"\ben ({'|'.join(MONTHS)})(?: (?:de |del )?(\d{{4}}))?\b", t):
+        month = MONTHS[m.group(1)]
+        year = int(m.group(2)) if m.group(2) else (today.year if month <= today.month else today.year - 1)
+        start, end = _month_bounds(year, month)
+        return start, min(end, today) if start <= today else end
+    return None
+
+
+def period_spans(text: str) -> List[Tuple[int, int]]:
+    """Posiciones de las expresiones de periodo en el texto ya normalizado."""
+    months = "|".join(MONTHS)
+    pattern = (
+        r"\bhoy\b|\bayer\b|\besta semana\b|\bsemana (?:pasada|anterior)\b|\beste mes\b"
+        r"|\bmes (?:pasado|anterior)\b|\beste ano\b|\bano (?:pasado|anterior)\b|\bultimos \d+ dias\b"
+        rf"|\b(?:{months})(?: (?:de |del )?\d{{4}})?\b"
+    )
+    return [m.span() for m in re.finditer(pattern, text)]
+
+
+def plan_total(rest: str, categories: List[str], today: Optional[date] = None) -> Optional[dict]:
+    """
+    Args de `get-total-by-category` si `rest` es exactamente una categoría
+    y un periodo (más preposiciones); None si sobra o falta algo.
+    """
+    category = match_category(rest, categories)
+    spans = period_spans(rest)
+    if not category or len(spans) != 1:
+        return None
+    key = fold(category)
+    leftover, n = re.subn(rf"\b(?:{re.escape(key)}|{re.escape(key.replace(' ', ''))})\b", " ", rest)
+    if n != 1:
+        return None
+    # Ninguna otra categoría del catálogo puede quedar mencionada
+    if match_category(leftover, categories):
+        return None
+    start, end = spans[0]
+    leftover = leftover.replace(rest[start:end], " ", 1)
+    if COMPOUND_RE.search(leftover) or set(leftover.split()) - FILLER_WORDS:
+        return None
+    period = resolve_period(rest, today)
+    if not period:
+        return None
+    return {"category": category, "startDate": period[0].isoformat(), "endDate": period[1].isoformat()}
+
+
+def plan_query(text: str, categories: List[str], today: Optional[date] = None) -> Optional[Tuple[str, dict]]:
+    """
+    Devuelve (tool, args) si la pregunta encaja con una forma conocida, o
+    None si no hay certeza. Solo se aceptan coincidencias completas.
+    """
+    t = fold(text).strip().rstrip("?.!").lstrip("¿¡").strip()
+
+    if m := LATEST_RE.match(t):
+        raw = m.group(1)
+        if raw is None:
+            limit = 5
+        elif raw.isdigit():
+            limit = int(raw)
+        elif raw in NUMBER_WORDS:
+            limit = NUMBER_WORDS[raw]
+        else:
+            return None
+        if 0 < limit <= 100:
+            return "get-latest-movements", {"limit": limit}
+        return None
+
+    if m := TOTAL_RE.match(t):
+        args = plan_total(m.group(1), categories, today)
+        return ("get-total-by-category", args) if args else None
+
+    if m := SEARCH_RE.match(t):
+        keyword = m.group(1).strip()
+        # Palabras sueltas y cortas; frases largas suelen ser preguntas
+        if keyword and len(keyword.split()) <= 3:
+            return "get-movements-by-keyword", {"keyword": keyword.upper(), "limit": 10}
+
+    return None
+
+
+def render_answer(tool_name: str, args: dict, result: str) -> str:
+    if tool_name == "get-latest-movements":
+        return f"### Últimos {args['limit']} movimientos\n\n{result}"
+    if tool_name == "get-total-by-category":
+        # Rangos de varios meses traen debajo el subtotal de cada mes
+        total, _, months = result.partition("\n")
+        return (f"### {args['category']} ({args['startDate']} → {args['endDate']})\n\n"
+                f"**{total}**" + (f"\n\n{months}" if months else ""))
+    keyword = args.get("query") or args.get("keyword")
+    return f"### Movimientos que coinciden con \"{keyword}\"\n\n{result}"
+
+
+def make_query_planner_node(tools: List[BaseTool], finance_catalog_json: List[str], limiter=None, prefetch=None):
+    """
+    Con `prefetch` (agents/prefetch.py), las preguntas que pasan al LLM
+    lanzan antes las consultas probables, en paralelo con su primera llamada.
+    """
+    tools_by_name: Dict[str, BaseTool] = {t.name: t for t in tools}
+    categories = parse_catalogs(finance_catalog_json)["typespend"]
+
+    async def query_planner_node(state: Dict[str, Any]) -> Dict[str, Any]:
+        text = str(state["messages"][-1].content)
+        plan = plan_query(text, categories)
+        if not plan or plan[0] not in tools_by_name:
+            if prefetch:
+                prefetch.start(text)
+            return {"next": "finance_qa"}
+
+        tool_name, args = plan
+        if tool_name == "get-movements-by-keyword" and "search-movements" in tools_by_name:
+            # Índice local: difuso, sin acentos y sin ir a Notion
+            tool_name, args = "search-movements", {"query": args["keyword"], "limit": args["limit"]}
+        tool = tools_by_name[tool_name]
+        try:
+            if limiter and not (tool.metadata or {}).get("local"):
+                result = await limiter.call(lambda: tool.ainvoke(args))
+            else:
+                result = await tool.ainvoke(args)
+        except Exception as e:
+            print(f"⚠️ Planificador: '{tool_name}' falló ({e}); se delega al LLM.")
+            if prefetch:
+                prefetch.start(text)
+            return {"next": "finance_qa"}
+
+        print(f"⚡ Planificador determinista: {tool_name} {args}")
+        return {"messages": [AIMessage(content=render_answer(tool_name, args, str(result)))], "next": "END"}
+
+    return query_planner_node
@@ -1,17 +1,66 @@
 # ──────────────────────────────────────────────────────────────
 #  rate_limited_tool_node.py
 # ──────────────────────────────────────────────────────────────
-import asyncio, time, json
-from typing import List, Dict
+import json
+from collections import Counter
+from typing import Callable, List, Dict, Optional
 from langchain_core.messages import ToolMessage, AIMessage
 from langchain_core.tools import BaseTool
+from agents.movements import INSERT_TOOL, accepted_insert, current_run, inserted_page_id
+from agents.ingest_journal import IngestJournal, row_key
+from agents.resilience import AdaptiveLimiter, CircuitOpenError, Upstream, classify_error, is_idempotent_tool
+from agents.prefetch import MISS, Prefetcher
+from agents.outbox import OutboxFlusher, validate_insert
+
+
+def accepted_rows(messages: List) -> Counter:
+    """Inserts aceptados en la corrida actual, por clave base de fila."""
+    run = current_run(messages)
+    calls = {
+        call["id"]: call["args"] for m in run if isinstance(m, AIMessage)
+        for call in (m.tool_calls or []) if call["name"] == INSERT_TOOL
+    }
+    return Counter(
+        row_key(calls[m.tool_call_id]) for m in run
+        if isinstance(m, ToolMessage) and m.tool_call_id in calls and accepted_insert(m.content)
+    )
+
 
 def build_rate_limited_tool_node(
     tools: List[BaseTool],
-    min_interval: float = 1.0,        # ► segundos mínimos entre requests
+    min_interval: float = 1.0,        # ► intervalo inicial entre requests
+    limiter: Optional[Upstream] = None,
+    journal: Optional[IngestJournal] = None,
+    observers: Optional[List[Callable]] = None,
+    prefetch: Optional[Prefetcher] = None,
+    write_behind: Optional[OutboxFlusher] = None,
 ):
     """Devuelve un nodo asíncrono que ejecuta los tool-calls de forma
-    secuencial respetando el intervalo.
+    secuencial a través de `limiter` (ver agents/resilience.py): ritmo
+    adaptativo, reintentos de lecturas y circuit breaker.
+
+    Si se pasa `limiter`, el ritmo se comparte con todos los nodos
+    que usen el mismo; si no, se crea uno propio. Las tools locales
+    (`metadata={"local": True}`) no pasan por el limitador.
+
+    Un fallo que persiste tras los reintentos se devuelve como
+    ToolMessage de error en vez de interrumpir el grafo.
+
+    Con `journal`, cada `insert-movement` de un extracto (`statement_id`
+    en el estado) se registra, y los que ya se insertaron en una corrida
+    anterior no se vuelven a enviar a Notion. Las filas idénticas se
+    distinguen por su ordinal: la n-ésima aceptada de la corrida usa la
+    clave n, así que reintentar una fallida reusa su clave.
+
+    `observers` son callables `(name, args, result)` que se llaman tras
+    cada tool-call exitoso (p.ej. para mantener índices locales).
+
+    Con `prefetch`, una llamada que ya se lanzó de forma especulativa
+    (ver agents/prefetch.py) toma el resultado de la caché.
+
+    Con `write_behind`, los `insert-movement` válidos se encolan en disco
+    y se confirman al instante; la subida a Notion (y el journal y los
+    observers de esos inserts) corre en segundo plano (agents/outbox.py).
 
     Uso:
         tool_node = build_rate_limited_tool_node(finance_tools, min_interval=1)
@@ -21,12 +70,9 @@ def build_rate_limited_tool_node(
     # ---  mapa nombre → tool ----------------------------------
     tools_by_name: Dict[str, BaseTool] = {t.name: t for t in tools}
 
-    # guardamos el instante de la última llamada a cualquier tool
-    last_call_ts = 0.0
+    limiter = limiter or Upstream("notion", AdaptiveLimiter(rate=1.0 / min_interval))
 
     async def _node(state: Dict):
-        nonlocal last_call_ts
-
         # 1️⃣  Tomamos el último mensaje del asistente
         if not state.get("messages"):
             return {}
@@ -37,24 +83,80 @@ def build_rate_limited_tool_node(
             return {}     # → no cambia el estado, seguimos en el grafo
 
         out_messages = []
+        statement_id = state.get("statement_id") if journal else None
+        accepted = accepted_rows(state["messages"]) if statement_id else Counter()
 
         # 3️⃣  Ejecutamos *cada* tool-call de forma secuencial
         for call in ai_msg.tool_calls:
             name = call["name"]
             args = call["args"]
 
-            # respetar ventana de tiempo para rate-limit
-            elapsed = time.perf_counter() - last_call_ts
-            if elapsed < min_interval:
-                await asyncio.sleep(min_interval - elapsed)
+            base = row_key(args) if statement_id and name == INSERT_TOOL else None
+            key = row_key(args, accepted[base]) if base else None
+            previous = journal.lookup(statement_id, key) if key else None
+            if previous and previous["status"] == "inserted":
+                # Ya está en Notion: no repetir el insert
+                result = f"Movimiento ya insertado previamente (ID: {previous['page_id']})"
+                out_messages.append(ToolMessage(content=json.dumps(result), name=name, tool_call_id=call["id"]))
+                accepted[base] += 1
+                print(f"⏭️  Omitido insert duplicado: {args.get('description')}")
+                continue
 
             # buscar herramienta
             tool = tools_by_name[name]
-            # ── invocación asíncrona ──
-            result = await tool.ainvoke(args)
+            if key:
+                journal.mark_pending(statement_id, key, args)
+
+            if write_behind and name == INSERT_TOOL:
+                error = validate_insert(args)
+                if error:
+                    if key:
+                        journal.mark_failed(statement_id, key, args, error)
+                    out_messages.append(ToolMessage(
+                        content=json.dumps(f"❌ Error en '{name}': {error}."),
+                        name=name, tool_call_id=call["id"], status="error",
+                    ))
+                    print(f"❌ Insert inválido ({error}): {args}")
+                    continue
+                queue_id = write_behind.enqueue(args, statement_id, key)
+                result = f"Movimiento aceptado; se guardará en Notion en segundo plano (En cola: {queue_id})"
+                out_messages.append(ToolMessage(content=json.dumps(result), name=name, tool_call_id=call["id"]))
+                if base:
+                    accepted[base] += 1
+                print(f"📥 Encolado insert #{queue_id}: {args.get('description')}")
+                continue
+            # ── invocación asíncrona (ritmo adaptativo + reintentos) ──
+            try:
+                result = await prefetch.take(name, args) if prefetch else MISS
+                if result is MISS:
+                    if (tool.metadata or {}).get("local"):
+                        result = await tool.ainvoke(args)
+                    else:
+                        result = await limiter.call(lambda: tool.ainvoke(args), idempotent=is_idempotent_tool(name))
+            except Exception as e:
+                if key:
+                    journal.mark_failed(statement_id, key, args, str(e))
+                transient = classify_error(e)[0] or isinstance(e, CircuitOpenError)
+                hint = " Servicio saturado o caído: no repitas la llamada ahora." if transient else ""
+                out_messages.append(ToolMessage(
+                    content=json.dumps(f"❌ Error en '{name}': {e}.{hint}"),
+                    name=name, tool_call_id=call["id"], status="error",
+                ))
+                print(f"❌ Herramienta '{name}' falló ({type(e).__name__}): {e}")
+                continue
+            if key:
+                page_id = inserted_page_id(result)
+                if page_id:
+                    journal.mark_inserted(statement_id, key, args, page_id)
+                    accepted[base] += 1
+                else:
+                    journal.mark_failed(statement_id, key, args, str(result))
 
-            # registrar hora de esta llamada
-            last_call_ts = time.perf_counter()
+            for observer in observers or ():
+                try:
+                    observer(name, args, result)
+                except Exception as e:
+                    print(f"⚠️ Observer {getattr(observer, '__qualname__', observer)} falló: {e}")
 
             # 4️⃣  devolvemos un ToolMessage con el resultado
             out_messages.append(
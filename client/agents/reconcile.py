@@ -0,0 +1,246 @@
+"""
+Conciliación determinista de un extracto contra Notion.
+
+Reemplaza la fase de verificación por LLM: las filas del extracto
+(agents/statement_parser.py) se cruzan con los movimientos guardados para
+la misma cuenta y ventana de fechas (tool `list-movements`) mediante un
+sort-merge join por monto, con tolerancia en monto y en fecha. El
+resultado separa filas conciliadas, faltantes (en el extracto pero no en
+Notion) y sobrantes (en Notion pero no en el extracto), y compara el total
+del extracto con la suma de lo insertado para él.
+"""
+import json
+import time
+from collections import Counter, OrderedDict
+from datetime import date, timedelta
+from typing import Any, Dict, List, Optional
+from langchain_core.messages import AIMessage, HumanMessage, ToolMessage
+from langchain_core.tools import BaseTool
+from agents.blob_store import resolve_blob
+from agents.catalogs import fold
+from agents.ingest_journal import IngestJournal
+from agents.loop_controller import LoopController
+from agents.outbox import Outbox
+from agents.movements import AUTO_MESSAGE, INSERT_TOOL, accepted_insert, current_run, tool_text
+from agents.statement_parser import declared_totals, parse_rows
+
+PARSED_CACHE_SIZE = 16  # extractos con filas parseadas en memoria
+
+
+def _amount_tolerance(amount: float, absolute: float, relative: float) -> float:
+    return max(absolute, abs(amount) * relative)
+
+
+def reconcile(statement_rows: List[Dict[str, Any]], stored: List[Dict[str, Any]],
+              date_tolerance: int = 3, amount_tolerance: float = 0.01, relative_tolerance: float = 0.005,
+              inserted: Optional[List[Dict[str, Any]]] = None) -> Dict[str, Any]:
+    """
+    Sort-merge join por monto: ambas listas se ordenan por monto y se
+    recorren con una ventana [monto - tol, monto + tol]; dentro de la
+    ventana gana el movimiento libre con la fecha más cercana (dentro de
+    `date_tolerance` días) y, a igualdad, la descripción más parecida.
+
+    El total guardado es la suma de `inserted` (los inserts aceptados para
+    este extracto) o, sin ellos, de todo lo guardado en la ventana; así un
+    insert con el monto equivocado se nota aunque no deje faltantes.
+    """
+    rows = sorted(statement_rows, key=lambda r: r["amount"])
+    movements = sorted(
+        ({**m, "amount": abs(float(m.get("amount") or 0)), "_date": _to_date(m.get("date"))} for m in stored),
+        key=lambda m: m["amount"],
+    )
+    used = [False] * len(movements)
+    matched, missing = [], []
+    lo = 0
+    for row in rows:
+        tol = _amount_tolerance(row["amount"], amount_tolerance, relative_tolerance)
+        while lo < len(movements) and movements[lo]["amount"] < row["amount"] - tol:
+            lo += 1
+        best, best_key = None, None
+        j = lo
+        while j < len(movements) and movements[j]["amount"] <= row["amount"] + tol:
+            m = movements[j]
+            if not used[j] and m["_date"]:
+                days = abs((m["_date"] - row["date"]).days)
+                if days <= date_tolerance:
+                    key = (days, _word_overlap(row["description"], m.get("description", "")) * -1)
+                    if best_key is None or key < best_key:
+                        best, best_key = j, key
+            j += 1
+        if best is None:
+            missing.append(row)
+        else:
+            used[best] = True
+            matched.append((row, movements[best]))
+
+    extra = [{k: v for k, v in m.items() if k != "_date"} for m, u in zip(movements, used) if not u]
+    statement_total = round(sum(r["amount"] for r in statement_rows), 2)
+    stored_total = round(sum(abs(float(m.get("amount") or 0)) for m in inserted)
+                         if inserted is not None else sum(m["amount"] for m in movements), 2)
+    return {
+        "matched": matched,
+        "queued": sum(1 for _, m in matched if m.get("queued")),
+        "missing": sorted(missing, key=lambda r: r["date"]),
+        "extra": extra,
+        "statement_total": statement_total,
+        "stored_total": stored_total,
+        "totals_match": abs(statement_total - stored_total) <= _amount_tolerance(statement_total, 0.05, 0.001),
+    }
+
+
+def _to_date(value: Any) -> Optional[date]:
+    try:
+        return date.fromisoformat(str(value)[:10])
+    except ValueError:
+        return None
+
+
+def _word_overlap(a: str, b: str) -> int:
+    return len(set(fold(a).split()) & set(fold(b).split()))
+
+
+def _accepted_inserts(run: List[Any], journal: Optional[IngestJournal],
+                      statement_id: Optional[str]) -> List[Dict[str, Any]]:
+    """Inserts aceptados del extracto: del journal (todas las corridas) o de la corrida actual."""
+    if journal and statement_id:
+        return [r for r in journal.rows(statement_id) if r["_status"] != "failed"]
+    calls = {
+        call["id"]: call.get("args") or {} for m in run if isinstance(m, AIMessage)
+        for call in (m.tool_calls or []) if call["name"] == INSERT_TOOL
+    }
+    return [
+        calls[m.tool_call_id] for m in run
+        if isinstance(m, ToolMessage) and m.tool_call_id in calls and accepted_insert(m.content)
+    ]
+
+
+def _fmt_row(row: Dict[str, Any]) -> str:
+    usd = " (USD convertido)" if row.get("usd") else ""
+    return f"- {row['date'].isoformat()} | {row['amount']:.2f}{usd} | {row['description']}"
+
+
+def render_summary(result: Dict[str, Any], declared: List[tuple], elapsed_ms: float) -> str:
+    lines = [
+        "Procesamiento completado. Resumen final:" if not result["missing"] else
+        f"Procesamiento terminado con {len(result['missing'])} filas sin conciliar.",
+        "",
+        "📊 CONCILIACIÓN AUTOMÁTICA:",
+        f"- Filas del extracto: {len(result['matched']) + len(result['missing'])}",
+        f"- Conciliadas con Notion: {len(result['matched'])}"
+        + (f" ({result['queued']} aún en cola de subida)" if result["queued"] else ""),
+        f"- Faltantes: {len(result['missing'])}",
+        f"- En Notion pero no en el extracto (misma cuenta y fechas): {len(result['extra'])}",
+        f"- Total del extracto: Q{result['statement_total']:,.2f} | Total guardado: Q{result['stored_total']:,.2f}"
+        + (" ✅" if result["totals_match"] else " ⚠️"),
+    ]
+    for label, amount in declared:
+        lines.append(f"- {label} (según el extracto): Q{amount:,.2f}")
+    if result["missing"]:
+        lines += ["", "Filas faltantes:"] + [_fmt_row(r) for r in result["missing"][:30]]
+    lines.append(f"\n_(verificado en {elapsed_ms:.0f} ms sin LLM)_")
+    return "\n".join(lines)
+
+
+def make_reconcile_node(list_tool: Optional[BaseTool], limiter=None, journal: IngestJournal = None,
+                        date_tolerance: int = 3, controller: LoopController = None,
+                        outbox: Optional[Outbox] = None):
+    """
+    Nodo que corre tras cada lote de inserts del clasificador. Devuelve
+    `next`: "finance_classifier" con la lista de faltantes si aún hay
+    progreso posible, o "END" con el resumen determinista. También
+    actualiza el progreso del ciclo (`loop`). Con `outbox`, los inserts
+    que aún esperan en la cola write-behind cuentan como guardados.
+    """
+    controller = controller or LoopController()
+    # LRU acotada como la de blob_store: el servidor ASGI vive por muchos extractos
+    parsed_cache: "OrderedDict[str, List[Dict[str, Any]]]" = OrderedDict()
+
+    async def fetch_stored(origin: str, start: date, end: date) -> List[Dict[str, Any]]:
+        movements, cursor = [], None
+        while True:
+            args = {"origin": origin, "startDate": start.isoformat(), "endDate": end.isoformat(), "pageSize": 100}
+            if cursor:
+                args["startCursor"] = cursor
+            raw = await limiter.call(lambda: list_tool.ainvoke(args)) if limiter else await list_tool.ainvoke(args)
+            page = json.loads(tool_text(raw))
+            movements.extend(page["movements"])
+            if not page.get("hasMore"):
+                return movements
+            cursor = page["nextCursor"]
+
+    async def reconcile_node(state: Dict[str, Any]) -> Dict[str, Any]:
+        loop = controller.progress(state)
+        update = await _reconcile({**state, "loop": loop})
+        return {**update, "loop": loop}
+
+    async def _reconcile(state: Dict[str, Any]) -> Dict[str, Any]:
+        # Tras el paso del categorizador local el LLM aún no vio el extracto:
+        # la conciliación espera a que termine su extracción
+        if not (state.get("loop") or {}).get("llm"):
+            return {"next": "finance_classifier"}
+        markdown_ref = state.get("markdown")
+        run = current_run(state.get("messages", []))
+        origins = Counter(
+            (call.get("args") or {}).get("origin")
+            for m in run if isinstance(m, AIMessage) for call in (m.tool_calls or [])
+            if call["name"] == INSERT_TOOL and (call.get("args") or {}).get("origin")
+        )
+        if not markdown_ref or not origins or list_tool is None:
+            return {"next": "finance_classifier"}
+
+        if markdown_ref not in parsed_cache:
+            parsed_cache[markdown_ref] = parse_rows(resolve_blob(markdown_ref))
+            while len(parsed_cache) > PARSED_CACHE_SIZE:
+                parsed_cache.popitem(last=False)
+        parsed_cache.move_to_end(markdown_ref)
+        rows = parsed_cache[markdown_ref]
+        if not rows:
+            print("🧾 Conciliación: no se reconocieron filas en el extracto; decide el clasificador.")
+            return {"next": "finance_classifier"}
+
+        started = time.perf_counter()
+        origin = origins.most_common(1)[0][0]
+        window = timedelta(days=date_tolerance)
+        start, end = min(r["date"] for r in rows) - window, max(r["date"] for r in rows) + window
+        try:
+            # La cola se lee antes que Notion: una fila que se sube entre ambas
+            # lecturas aparece dos veces (sobrante), nunca cero (faltante)
+            queued = [{**m, "queued": True} for m in outbox.pending(origin)] if outbox else []
+            stored = queued + await fetch_stored(origin, start, end)
+        except Exception as e:
+            print(f"⚠️ Conciliación: no se pudieron leer los movimientos guardados ({e}).")
+            return {"next": "finance_classifier"}
+        statement_id = state.get("statement_id")
+        result = reconcile(rows, stored, date_tolerance=date_tolerance,
+                           inserted=_accepted_inserts(run, journal, statement_id))
+        elapsed_ms = (time.perf_counter() - started) * 1000
+        print(f"🧾 Conciliación: {len(result['matched'])} conciliadas, {len(result['missing'])} faltantes, "
+              f"{len(result['extra'])} sobrantes ({elapsed_ms:.0f} ms)")
+
+        missing = len(result["missing"])
+        previous = state.get("reconcile_missing")
+        # Solo se vuelve al clasificador si la pasada anterior redujo los faltantes
+        if missing and (previous is None or missing < previous):
+            listado = "\n".join(_fmt_row(r) for r in result["missing"])
+            return {
+                "messages": [HumanMessage(content=(
+                    f"### VERIFICACIÓN AUTOMÁTICA: faltan {missing} filas del extracto en la base de datos. "
+                    f"Inserta solo estas (cuenta origen {origin}):\n{listado}"
+                ), name=AUTO_MESSAGE)],
+                "reconcile_missing": missing,
+                "next": "finance_classifier",
+            }
+
+        if journal and statement_id and not missing:
+            journal.complete(statement_id, reconciled=True)
+        summary = render_summary(result, declared_totals(resolve_blob(markdown_ref)), elapsed_ms)
+        completion = controller.finish(
+            state, "incomplete" if missing else "reconciled",
+            matched=len(result["matched"]), missing=missing, extra=len(result["extra"]),
+            statement_total=result["statement_total"], stored_total=result["stored_total"],
+        )
+        return {"messages": [AIMessage(content=summary)], "reconcile_missing": missing,
+                "completion": completion, "next": "END"}
+
+    return reconcile_node
+
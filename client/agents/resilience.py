@@ -0,0 +1,220 @@
+"""
+Control de tráfico hacia servicios externos (Notion vía MCP, OpenAI).
+
+- `AdaptiveLimiter`: ritmo AIMD. Sube el ritmo de forma aditiva mientras
+  las llamadas salen bien y lo reduce a la mitad ante un 429 o un
+  timeout; respeta `Retry-After` bloqueando a todos los llamadores.
+- `CircuitBreaker`: tras varios fallos transitorios seguidos deja de
+  llamar durante un tiempo y luego deja pasar una sola llamada de prueba.
+- `Upstream`: une ambos con reintentos con jitter. Las lecturas se
+  reintentan ante cualquier fallo transitorio; las escrituras solo ante
+  `rate_limited`, que garantiza que la llamada no se ejecutó.
+"""
+import asyncio
+import random
+import re
+import time
+from typing import Any, Awaitable, Callable, Optional, Tuple
+
+# Etiqueta que añade el servidor MCP a sus errores (servers/finance/src/notion/errors.ts)
+ERROR_TAG_RE = re.compile(r"\[code=(\w+)(?: retry_after=(\d+(?:\.\d+)?))?\]")
+
+THROTTLED, TIMEOUT, UNAVAILABLE = "throttled", "timeout", "unavailable"
+UNAVAILABLE_CODES = {"service_unavailable", "internal_server_error", "conflict_error", "database_connection_unavailable"}
+UNAVAILABLE_ERRORS = {"WorkerUnavailable", "APIConnectionError", "InternalServerError", "ConnectError"}
+TIMEOUT_ERRORS = {"TimeoutError", "APITimeoutError", "ReadTimeout", "ConnectTimeout"}
+
+
+def classify_error(error: BaseException) -> Tuple[Optional[str], Optional[float]]:
+    """Devuelve (tipo de fallo transitorio o None, segundos de Retry-After)."""
+    code, retry_after = None, None
+    if m := ERROR_TAG_RE.search(str(error)):
+        code = m.group(1)
+        retry_after = float(m.group(2)) if m.group(2) else None
+
+    # Errores del SDK de OpenAI: status_code y cabeceras de la respuesta
+    status = getattr(error, "status_code", None)
+    headers = getattr(getattr(error, "response", None), "headers", None)
+    if headers is not None and headers.get("retry-after"):
+        try:
+            retry_after = float(headers.get("retry-after"))
+        except ValueError:
+            pass
+
+    name = type(error).__name__
+    if code == "rate_limited" or status == 429 or name == "RateLimitError":
+        return THROTTLED, retry_after
+    if code == "timeout" or name in TIMEOUT_ERRORS or isinstance(error, asyncio.TimeoutError):
+        return TIMEOUT, None
+    if code in UNAVAILABLE_CODES or name in UNAVAILABLE_ERRORS or (status or 0) >= 500:
+        return UNAVAILABLE, retry_after
+    return None, None
+
+
+def is_idempotent_tool(name: str) -> bool:
+    return name.startswith(("get-", "list-", "search-"))
+
+
+class AdaptiveLimiter:
+    """Ritmo de llamadas AIMD compartido por todos los llamadores de un servicio."""
+
+    def __init__(self, rate: float = 2.0, min_rate: float = 0.2, max_rate: float = 10.0,
+                 increase: float = 0.05, decrease: float = 0.5):
+        self.rate = rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.increase = increase
+        self.decrease = decrease
+        self._next_slot = 0.0
+        self._blocked_until = 0.0
+        self._last_decrease = 0.0
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        # Se reserva un turno y se duerme fuera del lock, para que varias
+        # coroutines esperen en paralelo cada una su turno.
+        while True:
+            async with self._lock:
+                now = time.monotonic()
+                slot = max(now, self._next_slot, self._blocked_until)
+                self._next_slot = slot + 1.0 / self.rate
+            if slot > now:
+                await asyncio.sleep(slot - now)
+            # Un Retry-After llegado mientras esperábamos invalida el turno
+            if time.monotonic() >= self._blocked_until:
+                return
+
+    def on_success(self):
+        self.rate = min(self.max_rate, self.rate + self.increase)
+
+    def _back_off(self):
+        now = time.monotonic()
+        # Un solo recorte por ráfaga: los fallos de las llamadas ya en vuelo no cuentan
+        if now - self._last_decrease >= 1.0 / self.rate:
+            self.rate = max(self.min_rate, self.rate * self.decrease)
+            self._last_decrease = now
+
+    def on_throttle(self, retry_after: Optional[float] = None):
+        self._back_off()
+        wait = retry_after if retry_after is not None else 1.0 / self.rate
+        self._blocked_until = max(self._blocked_until, time.monotonic() + wait)
+
+    def on_timeout(self):
+        self._back_off()
+
+
+class CircuitOpenError(Exception):
+    """El breaker está abierto: no se intenta la llamada."""
+
+
+class CircuitBreaker:
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at: Optional[float] = None
+        self._probing = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        return "half_open" if time.monotonic() - self.opened_at >= self.reset_timeout else "open"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half_open" and not self._probing:
+            self._probing = True
+            return True
+        return False
+
+    def record_success(self):
+        self.failures = 0
+        self.opened_at = None
+        self._probing = False
+
+    def record_failure(self):
+        self.failures += 1
+        if self._probing or self.failures >= self.failure_threshold:
+            self.opened_at = time.monotonic()
+        self._probing = False
+
+    def release_probe(self):
+        """La llamada de prueba terminó sin resultado (cancelada): se permite otra."""
+        self._probing = False
+
+
+class Upstream:
+    """Limitador + breaker + reintentos de un servicio externo."""
+
+    def __init__(self, name: str, limiter: Optional[AdaptiveLimiter] = None,
+                 breaker: Optional[CircuitBreaker] = None, max_retries: int = 4,
+                 base_delay: float = 0.5, max_delay: float = 20.0):
+        self.name = name
+        self.limiter = limiter or AdaptiveLimiter()
+        self.breaker = breaker or CircuitBreaker()
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    async def acquire(self):
+        await self.limiter.acquire()
+
+    async def call(self, fn: Callable[[], Awaitable[Any]], idempotent: bool = True) -> Any:
+        attempt = 0
+        while True:
+            if not self.breaker.allow():
+                raise CircuitOpenError(
+                    f"{self.name} no disponible temporalmente (circuito abierto tras {self.breaker.failures} fallos)"
+                )
+            try:
+                await self.limiter.acquire()
+                result = await fn()
+            except asyncio.CancelledError:
+                # Cancelada (cliente desconectado, timeout del tool node): sin
+                # veredicto, pero la prueba del half-open no puede quedar tomada
+                self.breaker.release_probe()
+                raise
+            except Exception as e:
+                kind, retry_after = classify_error(e)
+                if kind is None:
+                    # El servicio respondió: el error es de la petición, no del servicio
+                    self.breaker.record_success()
+                    raise
+                if kind == THROTTLED:
+                    # Un 429 indica que el servicio está vivo: no cuenta para el breaker
+                    self.breaker.record_success()
+                    self.limiter.on_throttle(retry_after)
+                else:
+                    self.breaker.record_failure()
+                    self.limiter.on_timeout()
+
+                if not (idempotent or kind == THROTTLED) or attempt >= self.max_retries:
+                    raise
+                # Full jitter; con Retry-After la espera ya la impone el limitador
+                delay = 0.0 if retry_after else random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+                attempt += 1
+                print(f"🔁 {self.name}: {kind}, reintento {attempt}/{self.max_retries} "
+                      f"(ritmo {self.limiter.rate:.2f}/s)")
+                await asyncio.sleep(delay)
+                continue
+
+            self.limiter.on_success()
+            self.breaker.record_success()
+            return result
+
+    def stats(self) -> dict:
+        return {"rate": round(self.limiter.rate, 2), "breaker": self.breaker.state, "failures": self.breaker.failures}
+
+
+def make_upstream(name: str, settings: Optional[dict] = None, **defaults) -> Upstream:
+    """Crea un Upstream a partir de una sección de config (`limits.<name>`)."""
+    settings = {**defaults, **(settings or {})}
+    limiter = AdaptiveLimiter(**{k: float(settings[k]) for k in ("rate", "min_rate", "max_rate") if k in settings})
+    breaker = CircuitBreaker(
+        failure_threshold=int(settings.get("failure_threshold", 5)),
+        reset_timeout=float(settings.get("reset_timeout", 30)),
+    )
+    return Upstream(name, limiter, breaker, max_retries=int(settings.get("max_retries", 4)))
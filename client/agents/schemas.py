@@ -6,8 +6,21 @@ from typing_extensions import TypedDict, Annotated
 class State(TypedDict):
     messages: Annotated[list[AnyMessage], add_messages]
     file_path: str
+    # Los campos grandes guardan una referencia `blob:sha256:...` (ver
+    # agents/blob_store.py); se leen con resolve_blob()
     extracted_text: str
     markdown: str
     movimientos: list
     productos_financieros: list
+    classifier_tier: int
+    statement_id: Optional[str]
+    # Cuenta del extracto resuelta por su encabezado (agents/account_index.py)
+    origin_account: Optional[str]
+    origin_ambiguous: Optional[bool]
+    origin_candidates: Optional[list]
+    # Filas del extracto aún sin conciliar tras la última pasada (agents/reconcile.py)
+    reconcile_missing: Optional[int]
+    # Ciclo del clasificador: progreso y presupuesto, y cómo terminó (agents/loop_controller.py)
+    loop: Optional[dict]
+    completion: Optional[dict]
     next : Optional[str] = None
\ No newline at end of file
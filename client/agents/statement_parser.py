@@ -0,0 +1,174 @@
+"""
+Lectura heurística de las filas de un extracto en markdown (salida del OCR
+o texto del PDF). No reemplaza la extracción del LLM; sirve para validar
+su trabajo sin otra llamada al modelo.
+"""
+import re
+from collections import Counter
+from datetime import date, timedelta
+from typing import Any, Dict, List, Optional
+from agents.catalogs import fold
+
+DATE_RE = re.compile(
+    r"\b(\d{1,2}[/-]\d{1,2}[/-]\d{2,4}|\d{4}-\d{2}-\d{2}|\d{1,2}[ -](?:ene|feb|mar|abr|may|jun|jul|ago|sep|set|oct|nov|dic)[a-z]*(?:[ -]\d{2,4})?)\b",
+    re.IGNORECASE,
+)
+# "1,234.56" o, con punto de miles y coma decimal, "1.234,56"
+AMOUNT_RE = re.compile(
+    r"(?<![\d/])-?(?:Q|\$|US\$)?\s?(?:\d{1,3}(?:[.\s]?\d{3})*,\d{2}|\d{1,3}(?:[,\s]?\d{3})*\.\d{2})\b"
+)
+
+MONTH_ABBR = {"ene": 1, "feb": 2, "mar": 3, "abr": 4, "may": 5, "jun": 6, "jul": 7, "ago": 8,
+              "sep": 9, "set": 9, "oct": 10, "nov": 11, "dic": 12}
+USD_RATE = 8.0  # misma regla que el prompt del clasificador: $ → Q × 8
+
+# Columnas o líneas que no son movimientos
+SKIP_COLUMNS = ("saldo", "balance", "limite", "disponible")
+SKIP_LINES = ("saldo anterior", "saldo inicial", "saldo final", "saldo actual", "total", "pago minimo", "pago de contado",
+              "fecha limite", "fecha de corte", "limite de credito")
+# En cualquier parte de la línea: "Fecha límite de pago: 05/02/2024 Pago mínimo Q350.00" no es un movimiento
+SKIP_LINE_RE = re.compile(r"\b(?:" + "|".join(SKIP_LINES) + r")\b")
+USD_MARKERS = ("$", "us$", "usd", "dolar")
+# Encabezados de columna que dicen el sentido del movimiento
+TYPE_COLUMNS = (("Debito", ("debito", "cargo", "retiro", "debe", "consumo")),
+                ("Credito", ("credito", "abono", "deposito", "haber")))
+
+
+def _parse_date(text: str, year: Optional[int]) -> Optional[date]:
+    m = DATE_RE.search(text)
+    if not m:
+        return None
+    raw = m.group(1).lower()
+    try:
+        if re.match(r"\d{4}-", raw):
+            return date.fromisoformat(raw)
+        if m2 := re.match(r"(\d{1,2})[/-](\d{1,2})[/-](\d{2,4})", raw):
+            d, mo, y = (int(g) for g in m2.groups())
+            return date(y + 2000 if y < 100 else y, mo, d)
+        if m2 := re.match(r"(\d{1,2})[ -]([a-z]{3})[a-z]*(?:[ -](\d{2,4}))?", raw):
+            d, mo = int(m2.group(1)), MONTH_ABBR[m2.group(2)]
+            y = int(m2.group(3)) if m2.group(3) else (year or date.today().year)
+            return date(y + 2000 if y < 100 else y, mo, d)
+    except (ValueError, KeyError):
+        return None
+    return None
+
+
+def parse_amount(text: str) -> Optional[float]:
+    """
+    'Q1,234.56' → 1234.56; '1.234,56' → 1234.56; negativo si lleva '-'.
+
+    >>> parse_amount("12.345.678,90"), parse_amount("Q12,345,678.90"), parse_amount("-1 234,56")
+    (12345678.9, 12345678.9, -1234.56)
+    """
+    m = AMOUNT_RE.search(text)
+    if not m:
+        return None
+    raw = re.sub(r"[^\d.,-]", "", m.group(0))
+    negative = raw.startswith("-")
+    digits = raw.lstrip("-")
+    # El separador que aparece último es el decimal; el otro agrupa miles
+    point = max(digits.rfind("."), digits.rfind(","))
+    value = float(re.sub(r"\D", "", digits[:point]) + "." + digits[point + 1:])
+    return -value if negative else value
+
+
+def _is_usd(*texts: str) -> bool:
+    return any(marker in fold(t) for t in texts for marker in USD_MARKERS)
+
+
+def _column_type(column: str) -> Optional[str]:
+    return next((type_ for type_, words in TYPE_COLUMNS if any(word in column for word in words)), None)
+
+
+def _row_from_cells(cells: List[str], header: Optional[List[str]], year: Optional[int]) -> Optional[Dict[str, Any]]:
+    day = next((d for d in (_parse_date(c, year) for c in cells) if d), None)
+    if not day:
+        return None
+    amount, usd, statement_type, description = None, False, None, []
+    for i, cell in enumerate(cells):
+        column = header[i] if header and i < len(header) else ""
+        if DATE_RE.fullmatch(cell.strip()):
+            continue
+        value = parse_amount(cell) if AMOUNT_RE.fullmatch(cell.strip()) else None
+        if value is None:
+            if cell:
+                description.append(cell)
+        elif amount is None and not any(word in column for word in SKIP_COLUMNS):
+            amount, usd, statement_type = value, _is_usd(cell, column), _column_type(column)
+    if amount is None:
+        return None
+    return {"date": day, "amount": amount, "description": " ".join(description), "usd": usd,
+            "statement_type": statement_type}
+
+
+def _row_from_line(line: str, year: Optional[int]) -> Optional[Dict[str, Any]]:
+    day = _parse_date(line, year)
+    if not day:
+        return None
+    rest = DATE_RE.sub(" ", line)
+    m = AMOUNT_RE.search(rest)
+    if not m:
+        return None
+    description = " ".join(AMOUNT_RE.sub(" ", rest).split())
+    return {"date": day, "amount": parse_amount(m.group(0)), "description": description, "usd": _is_usd(m.group(0)),
+            "statement_type": None}
+
+
+def _statement_year(markdown: str) -> Optional[int]:
+    years = Counter(int(y) for y in re.findall(r"\b(20\d{2})\b", markdown or ""))
+    return years.most_common(1)[0][0] if years else None
+
+
+def parse_rows(markdown: str) -> List[Dict[str, Any]]:
+    """
+    Filas del extracto: {"date", "amount" (Q, valor absoluto), "description", "usd",
+    "statement_type"}. `statement_type` es "Debito" o "Credito" cuando la
+    columna del monto lo dice (Débitos/Créditos, Cargos/Abonos...); si no,
+    None: el signo del monto solo no basta.
+
+    En tablas markdown se usa el encabezado para ignorar columnas de saldo y
+    detectar columnas en dólares; las filas de saldos y totales se omiten.
+    Si el extracto tiene tablas, las líneas sueltas antes de la primera son
+    el encabezado del estado de cuenta (fechas de corte, pagos), no filas.
+    """
+    year = _statement_year(markdown)
+    tomorrow = date.today() + timedelta(days=1)
+    lines = [line.strip() for line in (markdown or "").splitlines()]
+    in_header = any(line.startswith("|") for line in lines)
+    rows, header = [], None
+    for line in lines:
+        if line.startswith("|"):
+            in_header = False
+            cells = [c.strip() for c in line.strip("|").split("|")]
+            if all(re.fullmatch(r":?-+:?", c) for c in cells if c):
+                continue
+            if not DATE_RE.search(line) and not any(AMOUNT_RE.fullmatch(c) for c in cells):
+                header = [fold(c) for c in cells]
+                continue
+            row = _row_from_cells(cells, header, year)
+        elif in_header:
+            continue
+        else:
+            header = None
+            row = _row_from_line(line, year)
+        if not row or SKIP_LINE_RE.search(fold(line)):
+            continue
+        # Fechas sin año al cruzar diciembre → enero
+        if row["date"] > tomorrow:
+            row["date"] = row["date"].replace(year=row["date"].year - 1)
+        if row["usd"]:
+            row["amount"] = round(row["amount"] * USD_RATE, 2)
+        row["amount"] = abs(row["amount"])
+        rows.append(row)
+    return rows
+
+
+def declared_totals(markdown: str) -> List[tuple]:
+    """Líneas de total del propio extracto: [(etiqueta, monto)]."""
+    totals = []
+    for line in (markdown or "").splitlines():
+        text = " ".join(c.strip() for c in line.strip().strip("|").split("|"))
+        if "total" in fold(text) and not DATE_RE.search(text) and (amount := parse_amount(text)) is not None:
+            totals.append((AMOUNT_RE.sub("", text).strip(" :"), abs(amount)))
+    return totals
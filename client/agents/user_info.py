@@ -1,3 +1,12 @@
+from agents.catalogs import parse_catalogs
+from agents.account_index import account_label
 
-def user_info_node(state):
-    return { "productos_financieros" : ["4512-8300-0001-4731"]}
+
+def make_user_info_node(resource_names):
+    """Productos financieros del usuario, tomados del recurso de cuentas."""
+    productos = [account_label(a) for a in parse_catalogs(resource_names)["accounts"]]
+
+    def user_info_node(state):
+        return {"productos_financieros": productos}
+
+    return user_info_node
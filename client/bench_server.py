@@ -0,0 +1,77 @@
+"""
+Benchmark de concurrencia para server.py.
+
+Lanza la misma pregunta desde N sesiones simultáneas para cada nivel de
+concurrencia y reporta throughput y latencias, para verificar que el
+throughput escala con el número de sesiones.
+
+Uso (con el servidor corriendo):
+    python bench_server.py --url http://127.0.0.1:8000 --levels 1 2 4 8 16 --requests 32
+"""
+import argparse
+import asyncio
+import statistics
+import time
+import httpx
+
+
+async def run_level(client: httpx.AsyncClient, url: str, level: int, total: int, question: str) -> dict:
+    # Una sesión por "usuario" concurrente
+    thread_ids = []
+    for _ in range(level):
+        response = await client.post(f"{url}/sessions")
+        response.raise_for_status()
+        thread_ids.append(response.json()["thread_id"])
+
+    latencies = []
+    errors = 0
+
+    async def user(thread_id: str, n_requests: int):
+        nonlocal errors
+        for _ in range(n_requests):
+            start = time.perf_counter()
+            response = await client.post(f"{url}/sessions/{thread_id}/messages", json={"content": question})
+            if response.status_code == 200:
+                latencies.append(time.perf_counter() - start)
+            else:
+                errors += 1
+
+    per_user = max(1, total // level)
+    start = time.perf_counter()
+    await asyncio.gather(*(user(t, per_user) for t in thread_ids))
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        "level": level,
+        "requests": per_user * level,
+        "errors": errors,
+        "seconds": elapsed,
+        "throughput": len(latencies) / elapsed if elapsed else 0.0,
+        "p50": statistics.median(latencies) if latencies else 0.0,
+        "p95": latencies[int(len(latencies) * 0.95) - 1] if latencies else 0.0,
+    }
+
+
+async def main(args):
+    async with httpx.AsyncClient(timeout=args.timeout) as client:
+        (await client.get(f"{args.url}/health")).raise_for_status()
+
+        print(f"{'conc':>5} {'reqs':>5} {'err':>4} {'seg':>8} {'req/s':>8} {'p50':>7} {'p95':>7} {'escala':>7}")
+        baseline = None
+        for level in args.levels:
+            r = await run_level(client, args.url, level, args.requests, args.question)
+            baseline = baseline or r["throughput"] or None
+            scaling = r["throughput"] / baseline if baseline else 0.0
+            print(f"{r['level']:>5} {r['requests']:>5} {r['errors']:>4} {r['seconds']:>8.2f} "
+                  f"{r['throughput']:>8.2f} {r['p50']:>7.2f} {r['p95']:>7.2f} {scaling:>6.2f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark de concurrencia del servidor multi-sesión.")
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--levels", type=int, nargs="+", default=[1, 2, 4, 8, 16])
+    parser.add_argument("--requests", type=int, default=32, help="Peticiones por nivel")
+    parser.add_argument("--question", default="¿Cuáles son mis últimos 5 movimientos?")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    asyncio.run(main(parser.parse_args()))
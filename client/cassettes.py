@@ -0,0 +1,213 @@
+"""
+Grabación y reproducción (cassettes) de llamadas a tools MCP y a los LLM.
+
+En modo `record` se envuelven las tools y los chat models que recibe
+`build_graph`: cada petición/respuesta se guarda con su duración en un
+archivo JSONL. En modo `replay` las mismas envolturas devuelven las
+respuestas grabadas sin tocar Notion ni OpenAI, manteniendo o anulando
+las latencias originales. Así se pueden comparar optimizaciones del grafo
+sobre sesiones reales idénticas, offline.
+
+Formato (una línea JSON por registro):
+    {"type": "meta", "tools": [...], "resource_names": [...]}
+    {"type": "input", "text": "..."}                  # mensajes del usuario, en orden
+    {"type": "tool", "key": "...", "request": {...}, "response": ..., "elapsed": 0.42}
+    {"type": "llm",  "key": "...", "request": {...}, "response": {...}, "elapsed": 1.87}
+"""
+import asyncio
+import hashlib
+import json
+import time
+from collections import defaultdict, deque
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+from langchain_core.load import dumpd, load
+from langchain_core.tools import BaseTool, StructuredTool, ToolException
+
+
+class CassetteMiss(Exception):
+    """La petición no existe en el cassette que se está reproduciendo."""
+
+
+def _canonical(obj: Any) -> str:
+    return json.dumps(obj, sort_keys=True, ensure_ascii=False, default=str)
+
+
+def _message_fingerprint(messages: list) -> list:
+    """Contenido estable de los mensajes: sin ids, que cambian en cada corrida."""
+    out = []
+    for m in messages:
+        out.append([
+            getattr(m, "type", type(m).__name__),
+            getattr(m, "content", str(m)),
+            getattr(m, "name", None),
+            [(tc["name"], tc["args"]) for tc in (getattr(m, "tool_calls", None) or [])],
+        ])
+    return out
+
+
+def _schema_dict(tool: BaseTool) -> dict:
+    schema = tool.args_schema
+    if schema is None:
+        return {}
+    if isinstance(schema, dict):
+        return schema
+    return schema.model_json_schema()
+
+
+class Cassette:
+    def __init__(self, path: str, mode: str = "record", keep_latency: bool = True, strict: bool = False):
+        if mode not in ("record", "replay"):
+            raise ValueError(f"Modo de cassette desconocido: {mode}")
+        self.path = Path(path)
+        self.mode = mode
+        self.keep_latency = keep_latency
+        self.strict = strict
+        self.meta: Dict[str, Any] = {}
+        self.inputs: List[str] = []
+        self.hits = 0
+        self.misses = 0
+        # key → respuestas en orden de grabación; y cola global por tipo
+        self._by_key: Dict[tuple, deque] = defaultdict(deque)
+        self._by_kind: Dict[str, deque] = defaultdict(deque)
+
+        if mode == "replay":
+            self._load()
+        else:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            self.path.write_text("", encoding="utf-8")
+
+    # ---------- Persistencia ----------
+    def _load(self):
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                entry = json.loads(line)
+                if entry["type"] == "meta":
+                    self.meta = entry
+                    continue
+                if entry["type"] == "input":
+                    self.inputs.append(entry["text"])
+                    continue
+                self._by_key[(entry["type"], entry["key"])].append(entry)
+                self._by_kind[entry["type"]].append(entry)
+        print(f"📼 Cassette cargado: {sum(len(q) for q in self._by_kind.values())} interacciones de {self.path}")
+
+    def _append(self, entry: dict):
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(_canonical(entry) + "\n")
+
+    def write_meta(self, tools: List[BaseTool], resource_names: List[str]):
+        self.meta = {
+            "type": "meta",
+            "tools": [{"name": t.name, "description": t.description, "args_schema": _schema_dict(t)} for t in tools],
+            "resource_names": resource_names,
+        }
+        self._append(self.meta)
+
+    def record_input(self, text: str):
+        if self.mode == "record":
+            self._append({"type": "input", "text": text})
+
+    @property
+    def resource_names(self) -> List[str]:
+        return self.meta.get("resource_names", [])
+
+    # ---------- Núcleo record/replay ----------
+    async def _play(self, kind: str, key: str) -> Any:
+        queue = self._by_key.get((kind, key))
+        if queue:
+            entry = queue.popleft()
+            self._by_kind[kind].remove(entry)
+            self.hits += 1
+        elif not self.strict and self._by_kind[kind]:
+            # Sin coincidencia exacta (p.ej. cambió la fecha del prompt): orden de grabación
+            entry = self._by_kind[kind].popleft()
+            self._by_key[(kind, entry["key"])].remove(entry)
+            self.misses += 1
+            print(f"⚠️ Cassette: sin coincidencia exacta para {kind}, usando la siguiente grabada.")
+        else:
+            raise CassetteMiss(f"No hay respuesta grabada para {kind} {key[:80]}")
+
+        if self.keep_latency and entry.get("elapsed"):
+            await asyncio.sleep(entry["elapsed"])
+        if "error" in entry:
+            raise ToolException(entry["error"])
+        return entry["response"]
+
+    async def call_tool(self, tool: Optional[BaseTool], name: str, args: dict) -> Any:
+        key = f"{name}:{_canonical(args)}"
+        if self.mode == "replay":
+            return await self._play("tool", key)
+
+        entry = {"type": "tool", "key": key, "request": {"name": name, "args": args}}
+        start = time.perf_counter()
+        try:
+            result = await tool.ainvoke(args)
+        except ToolException as e:
+            # Los errores de la tool también forman parte de la sesión
+            entry.update(error=str(e), elapsed=round(time.perf_counter() - start, 4))
+            self._append(entry)
+            raise
+        entry.update(response=result, elapsed=round(time.perf_counter() - start, 4))
+        self._append(entry)
+        return result
+
+    async def call_llm(self, llm: Any, label: str, messages: list) -> Any:
+        fingerprint = _message_fingerprint(messages)
+        key = hashlib.sha256(_canonical([label, fingerprint]).encode("utf-8")).hexdigest()
+        if self.mode == "replay":
+            return load(await self._play("llm", key))
+
+        start = time.perf_counter()
+        response = await llm.ainvoke(messages)
+        self._append({
+            "type": "llm", "key": key,
+            "request": {"model": label, "messages": len(messages)},
+            "response": dumpd(response),
+            "elapsed": round(time.perf_counter() - start, 4),
+        })
+        return response
+
+    # ---------- Envolturas ----------
+    def wrap_tools(self, tools: List[BaseTool]) -> List[BaseTool]:
+        """Tools que graban (record) o reproducen (replay) cada llamada."""
+        if self.mode == "replay" and not tools:
+            specs = self.meta.get("tools", [])
+        else:
+            specs = [{"name": t.name, "description": t.description, "args_schema": t.args_schema} for t in tools]
+        by_name = {t.name: t for t in tools}
+
+        def _proxy(spec: dict) -> BaseTool:
+            async def _call(**kwargs):
+                return await self.call_tool(by_name.get(spec["name"]), spec["name"], kwargs)
+
+            return StructuredTool(
+                name=spec["name"],
+                description=spec["description"],
+                args_schema=spec["args_schema"],
+                coroutine=_call,
+            )
+
+        return [_proxy(spec) for spec in specs]
+
+    def wrap_llm(self, llm: Any, label: str) -> "CassetteChatModel":
+        return CassetteChatModel(llm, label, self)
+
+    def summary(self) -> str:
+        if self.mode == "record":
+            return f"📼 Cassette grabado en {self.path}"
+        return f"📼 Replay: {self.hits} coincidencias exactas, {self.misses} por orden"
+
+
+class CassetteChatModel:
+    """Envuelve un chat model (ya con tools enlazadas) que se usa vía `ainvoke`."""
+
+    def __init__(self, llm: Any, label: str, cassette: Cassette):
+        self.llm = llm
+        self.label = label
+        self.cassette = cassette
+
+    async def ainvoke(self, messages: list, *args, **kwargs):
+        return await self.cassette.call_llm(self.llm, self.label, messages)
@@ -1,16 +1,26 @@
 
 
+import argparse
 import asyncio
+import time
 import uuid
 from langchain_core.messages import HumanMessage
-from langchain_mcp_adapters.client import MultiServerMCPClient
+from mcp_setup import open_finance_client
 from config import load_config
 from graph_builder import build_graph
 from utils import printGraph
+from cassettes import Cassette
+from profiler import SamplingProfiler
+from agents.outbox import get_write_behind
+from agents.loop_controller import recursion_limit
 
-async def main():
+async def main(args):
     """
     Función principal para ejecutar el agente en modo de depuración de consola.
+
+    Con --record las llamadas a tools y LLM se graban en un cassette; con
+    --replay se reproducen sin conectarse a Notion ni a OpenAI. Con
+    --profile cada consulta se perfila por muestreo (ver profiler.py).
     """
     print("🔧 Inicializando Finance Assistant en modo DEBUG...")
     
@@ -20,28 +30,23 @@ async def main():
         print("📦 Cargando configuración...")
         config = load_config()
 
-        print("🔧 Conectando al MCP...")
-        client = await MultiServerMCPClient({
-            "finance": {
-                "command": "node",
-                "args": ["C:/Users/jdmonterroson/Documents/tempproyect/mcp-finance-asistant/servers/finance/build/finance.js"],
-                "transport": "stdio",
-                "env": {
-                    "NOTION_TOKEN": config["notion"]["api_key"],
-                    "NOTION_DB_ACCOUNTS": config["notion"]["db_accounts"],
-                    "NOTION_DB_TRANSACTIONS": config["notion"]["db_transactions"]
-                }
-            }
-        }).__aenter__()
-
-        print("🛠️ Obteniendo herramientas y recursos...")
-        tools = client.get_tools()
-        resources = await client.get_resources(server_name="finance")
-        resource_names = [r.as_string() for r in resources]
+        cassette = None
+        client = None
+        if args.replay:
+            cassette = Cassette(args.replay, mode="replay", keep_latency=not args.zero_latency)
+            tools, resource_names = cassette.wrap_tools([]), cassette.resource_names
+        else:
+            print("🔧 Conectando al MCP...")
+            print("🛠️ Obteniendo herramientas y recursos...")
+            client, tools, resource_names = await open_finance_client(config)
+            if args.record:
+                cassette = Cassette(args.record, mode="record")
+                cassette.write_meta(tools, resource_names)
+                tools = cassette.wrap_tools(tools)
 
         print("📊 Construyendo grafo de estados...")
-        graph = build_graph(config, tools, resource_names)
-        config_graph = {"configurable": {"thread_id": thread_id}}
+        graph = build_graph(config, tools, resource_names, cassette=cassette)
+        config_graph = {"configurable": {"thread_id": thread_id}, "recursion_limit": recursion_limit(config)}
 
         try:
             print("📈 Visualización del grafo:")
@@ -51,11 +56,31 @@ async def main():
 
         print("\n✅ Finance Assistant iniciado. Escribe tu consulta o 'salir' para terminar.")
         
+        # En replay los mensajes del usuario también salen del cassette
+        replay_inputs = list(cassette.inputs) if args.replay else None
+        session_start = time.perf_counter()
+
+        profiler = SamplingProfiler(interval=args.profile_interval / 1000, out_dir=args.profile_dir,
+                                    top=args.profile_top) if args.profile else None
+        # Imprimir cada evento crudo es costoso: con --profile falsearía el perfil
+        show_events = args.events and not args.profile
+
         while True:
-            print("\n> ", end="")
-            text = await asyncio.to_thread(input) # Usar input no bloqueante
-            
+            if replay_inputs is not None:
+                text = replay_inputs.pop(0) if replay_inputs else "salir"
+                print(f"\n> {text}")
+            else:
+                print("\n> ", end="")
+                text = await asyncio.to_thread(input) # Usar input no bloqueante
+
             if text.lower() in {"salir", "exit", "quit", "q"}:
+                write_behind = get_write_behind()
+                if write_behind and write_behind.outbox.stats()["depth"]:
+                    print(f"📤 Esperando la cola de Notion ({write_behind.outbox.stats()['depth']} inserts)...")
+                    await write_behind.drain()
+                if cassette:
+                    print(cassette.summary())
+                    print(f"⏱️ Tiempo total de la sesión: {time.perf_counter() - session_start:.2f}s")
                 print("👋 Cerrando sesión.")
                 break
             
@@ -63,16 +88,21 @@ async def main():
                 continue
 
             print("🔄 Procesando...")
+            if cassette:
+                cassette.record_input(text)
             
+            if profiler:
+                profiler.start()
             try:
                 async for event in graph.astream(
                     {"messages": [HumanMessage(content=text)]},
                     config_graph,
                     stream_mode="values"
                 ):
-                    print("--- DEBUG EVENT ---")
-                    print(event)
-                    print("-------------------")
+                    if show_events:
+                        print("--- DEBUG EVENT ---")
+                        print(event)
+                        print("-------------------")
                     
                     if "messages" in event and event["messages"]:
                         last = event["messages"][-1]
@@ -82,6 +112,9 @@ async def main():
 
             except Exception as e:
                 print(f"❌ Error procesando consulta: {str(e)}")
+            finally:
+                if profiler:
+                    profiler.stop(text[:60])
             print("🔄 Consulta procesada........................................")
 
     except Exception as e:
@@ -89,9 +122,28 @@ async def main():
         import traceback
         traceback.print_exc()
 
+def parse_args():
+    parser = argparse.ArgumentParser(description="Finance Assistant en modo DEBUG.")
+    cassette_group = parser.add_mutually_exclusive_group()
+    cassette_group.add_argument("--record", metavar="CASSETTE", help="Grabar tools y LLM en un cassette JSONL")
+    cassette_group.add_argument("--replay", metavar="CASSETTE", help="Reproducir un cassette sin red")
+    parser.add_argument("--zero-latency", action="store_true",
+                        help="En replay, no esperar las latencias grabadas")
+    parser.add_argument("--no-events", dest="events", action="store_false",
+                        help="No imprimir cada evento crudo del grafo")
+    parser.add_argument("--profile", action="store_true",
+                        help="Perfilar cada consulta por muestreo (implica --no-events)")
+    parser.add_argument("--profile-interval", type=float, default=5.0, metavar="MS",
+                        help="Milisegundos entre muestras")
+    parser.add_argument("--profile-top", type=int, default=15, metavar="N",
+                        help="Funciones en el resumen")
+    parser.add_argument("--profile-dir", default="profiles",
+                        help="Directorio de los archivos .folded")
+    return parser.parse_args()
+
 if __name__ == "__main__":
     try:
-        asyncio.run(main())
+        asyncio.run(main(parse_args()))
     except KeyboardInterrupt:
         print("\n👋 Interrupción por teclado. Adiós.")
 
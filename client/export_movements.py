@@ -0,0 +1,85 @@
+"""
+Exportación del historial de movimientos a archivos columnares locales.
+
+Recorre la base de transacciones página a página (tool `list-movements`,
+ordenada por created_time) y agrega cada página al almacén columnar de
+agents/movement_store.py: la memoria usada no depende del tamaño del
+historial. Cada ejecución continúa desde el watermark de la anterior, así
+que solo se descargan los movimientos nuevos.
+
+Uso:
+    python export_movements.py                 # incremental
+    python export_movements.py --out history --full
+"""
+import argparse
+import asyncio
+import json
+import shutil
+import time
+from pathlib import Path
+from config import load_config
+from mcp_setup import open_finance_client
+from agents.movement_store import MovementStoreWriter
+from agents.movements import tool_text
+from agents.resilience import make_upstream
+
+
+async def export(list_tool, writer: MovementStoreWriter, page_size: int = 100, limiter=None) -> int:
+    """Agrega al almacén todo lo creado desde el watermark. Devuelve las filas nuevas."""
+    cursor, added = None, 0
+    watermark = writer.watermark
+    while True:
+        args = {"pageSize": page_size}
+        if cursor:
+            args["startCursor"] = cursor
+        if watermark:
+            args["createdAfter"] = watermark
+        if limiter:
+            raw = await limiter.call(lambda: list_tool.ainvoke(args))
+        else:
+            raw = await list_tool.ainvoke(args)
+        page = json.loads(tool_text(raw))
+        added += writer.append(page["movements"])
+        print(f"   … {writer.meta['rows']} filas ({added} nuevas)")
+        if not page.get("hasMore"):
+            return added
+        cursor = page["nextCursor"]
+
+
+async def run(args):
+    print("📦 Cargando configuración...")
+    config = load_config()
+    out = Path(args.out or (config.get("history") or {}).get("path") or "history")
+    if args.full and out.exists():
+        shutil.rmtree(out)
+
+    print("🔧 Conectando al MCP...")
+    client, tools, _ = await open_finance_client(config)
+    try:
+        list_tool = next((t for t in tools if t.name == "list-movements"), None)
+        if list_tool is None:
+            raise RuntimeError("El servidor MCP no expone 'list-movements'; recompila servers/finance.")
+
+        writer = MovementStoreWriter(str(out))
+        print(f"📤 Exportando a {out} (desde {writer.watermark or 'el inicio'})...")
+        start = time.perf_counter()
+        notion = make_upstream("notion", (config.get("limits") or {}).get("notion"))
+        added = await export(list_tool, writer, limiter=notion)
+        print(f"✅ {added} movimientos nuevos, {writer.meta['rows']} en total "
+              f"({time.perf_counter() - start:.1f}s).")
+    finally:
+        await client.__aexit__(None, None, None)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Exporta los movimientos de Notion a archivos columnares.")
+    parser.add_argument("--out", help="Directorio de salida (por defecto history.path de config.yaml)")
+    parser.add_argument("--full", action="store_true", help="Borra la exportación previa y empieza de cero")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(run(parse_args()))
+    except KeyboardInterrupt:
+        print("\n⏸️ Exportación interrumpida. Lo confirmado se conserva; vuelve a ejecutar para continuar.")
@@ -1,46 +1,191 @@
+import os
 from langgraph.graph import StateGraph, END
 from langgraph.checkpoint.memory import MemorySaver
 from agents.schemas import State
-from agents.user_info import user_info_node
+from agents.user_info import make_user_info_node
 from agents.ocr_agent import ocr_node
 from agents.finance_experts import make_finance_expert_node
 from agents.rate_limited_tool_node import build_rate_limited_tool_node
+from agents.resilience import make_upstream
 from agents.router_node import router_node
 from agents.finance_qa_node import make_finance_qa_node
+from agents.query_planner import make_query_planner_node
+from agents.model_tiering import ModelTierPolicy, make_classifier_validator
+from agents.ingest_journal import IngestJournal
+from agents.blob_store import BlobStore, set_blob_store
+from agents.merchant_index import MerchantIndex, make_search_tool
+from agents.prefetch import Prefetcher
+from agents.movement_store import MovementStore, has_export, make_history_tool
+from agents.reconcile import make_reconcile_node
+from agents.loop_controller import DEFAULT_MAX_STEPS, LoopController
+from agents.outbox import Outbox, OutboxFlusher, set_write_behind
+from agents.categorizer import Categorizer
+from agents.account_index import make_resolve_account_node
+from agents.anomalies import AnomalyDetector, make_anomalies_tool
 from agents.finance_classifier_node import make_finance_classifier_node, finance_phase_condition
 from langgraph.prebuilt import tools_condition
 
-def build_graph(config, tools, resource_names):
+def build_graph(config, tools, resource_names, limiter=None, cassette=None):
+    """
+    Compila el grafo. El grafo compilado no guarda estado por conversación
+    (todo vive en el checkpointer por thread_id), así que puede compartirse
+    entre sesiones concurrentes; `limiter` (un `resilience.Upstream`)
+    permite además compartir el ritmo adaptativo de Notion entre varios
+    grafos.
+
+    Con `cassette` (ver cassettes.py) los chat models graban o reproducen
+    sus respuestas; las tools se envuelven antes, en quien llama.
+    """
     from langchain_openai import ChatOpenAI
 
-    llm = ChatOpenAI(model="gpt-4o-mini", temperature=0, api_key=config["llm"]["api_key"])
-    llm_complex = ChatOpenAI(model="gpt-4o", temperature=0, api_key=config["llm"]["api_key"])
+    limits = config.get("limits") or {}
+    limiter = limiter or make_upstream("notion", limits.get("notion"), rate=2.0, max_rate=3.5)
+    # Los reintentos los hace el Upstream (con jitter y breaker), no el SDK
+    llm_upstream = make_upstream("openai", limits.get("openai"), rate=5.0, max_rate=50.0)
+
+    # Índice local de comercios: tool extra para QA, alimentado por los inserts
+    merchant_index = MerchantIndex((config.get("search") or {}).get("path") or "merchant_index.pkl")
+    tools_by_name = {t.name: t for t in tools}
+    qa_tools = tools + [make_search_tool(merchant_index, tools_by_name.get("list-movements"), limiter)]
+
+    # Historial exportado (export_movements.py): totales de rangos largos sin ir a Notion
+    history_path = (config.get("history") or {}).get("path") or "history"
+    if has_export(history_path):
+        qa_tools.append(make_history_tool(history_path))
+
+    # Anomalías: cada insert se revisa al confirmarse; QA consulta las alertas
+    anomalies_config = config.get("anomalies") or {}
+    detector = None
+    if anomalies_config.get("enabled", True):
+        detector = AnomalyDetector(
+            anomalies_config.get("path") or "anomalies.json",
+            z_threshold=float(anomalies_config.get("z_threshold", 3.5)),
+            min_samples=int(anomalies_config.get("min_samples", 5)),
+            duplicate_days=int(anomalies_config.get("duplicate_days", 3)),
+        )
+        if detector.empty and has_export(history_path):
+            store = MovementStore(history_path)
+            try:
+                detector.bootstrap(store.iter_rows_by_date())
+            finally:
+                store.close()
+        qa_tools.append(make_anomalies_tool(detector))
+
+    # Consultas probables lanzadas mientras el LLM planifica
+    prefetch_config = config.get("prefetch") or {}
+    prefetch = None
+    if prefetch_config.get("enabled", True):
+        prefetch = Prefetcher(
+            tools, resource_names, limiter=limiter,
+            ttl=float(prefetch_config.get("ttl", 30)),
+            max_calls=int(prefetch_config.get("max_calls", 2)),
+            log_path=prefetch_config.get("log_path", "prefetch_log.jsonl"),
+        )
+
+    llm = ChatOpenAI(model="gpt-4o-mini", temperature=0, api_key=config["llm"]["api_key"], max_retries=0)
+    llm_tools = llm.bind_tools(qa_tools)
+
+    # Tiers del clasificador: del más barato al más capaz
+    classifier_models = (config.get("classifier") or {}).get("tiers") or ["gpt-4o-mini", "gpt-4o"]
+    classifier_tiers = [
+        (name, ChatOpenAI(model=name, temperature=0, api_key=config["llm"]["api_key"], max_retries=0).bind_tools(tools))
+        for name in classifier_models
+    ]
+
+    if cassette:
+        llm_tools = cassette.wrap_llm(llm_tools, "qa:gpt-4o-mini")
+        classifier_tiers = [(name, cassette.wrap_llm(m, f"classifier:{name}")) for name, m in classifier_tiers]
 
-    llm_tools = llm.bind_tools(tools)
-    llm_complex_tools = llm_complex.bind_tools(tools)
+    classifier_policy = ModelTierPolicy(classifier_tiers, make_classifier_validator(resource_names), upstream=llm_upstream)
+
+    # En replay nada toca el estado local real: el journal es temporal (cada
+    # replay llega a la cassette) y los inserts no alimentan índice ni anomalías
+    replaying = cassette is not None and cassette.mode == "replay"
+
+    set_blob_store(BlobStore((config.get("blobs") or {}).get("path") or ".blobs"))
+    journal = IngestJournal(":memory:" if replaying else (config.get("journal") or {}).get("path") or "ingest_journal.db")
+
+    # Presupuesto del ciclo clasificador → tools → reconcile
+    loop_config = config.get("loop") or {}
+    controller = LoopController(
+        max_steps=int(loop_config.get("max_steps", DEFAULT_MAX_STEPS)),
+        max_seconds=float(loop_config.get("max_seconds", 600)),
+        patience=int(loop_config.get("patience", 2)),
+        log_path=loop_config.get("log_path", "loop_log.jsonl"),
+    )
+
+    # Cola write-behind: los inserts de extractos se confirman al guardarse en
+    # disco y un flusher los sube a Notion en segundo plano
+    ingest_observers = ([] if replaying else [merchant_index.observe]) + ([prefetch.observe] if prefetch else [])
+    if detector and not replaying:
+        ingest_observers.append(detector.observe)
+    outbox_config = config.get("outbox") or {}
+    write_behind = None
+    # En replay no: los inserts encolados se subirían luego al Notion real
+    if outbox_config.get("enabled", True) and "insert-movement" in tools_by_name and not replaying:
+        outbox = Outbox(outbox_config.get("path") or "outbox.db")
+        write_behind = OutboxFlusher(
+            outbox, tools_by_name["insert-movement"], limiter, journal=journal, observers=ingest_observers,
+            workers=int(outbox_config.get("workers", 2)),
+            max_attempts=int(outbox_config.get("max_attempts", 8)),
+            list_tool=tools_by_name.get("list-movements"),
+        )
+        # El extracto se cierra en el journal cuando termina de subirse
+        controller.on_finish.append(
+            lambda state, completion: write_behind.seal(state.get("statement_id"))
+            if completion["status"] in ("complete", "reconciled") else None
+        )
+    set_write_behind(write_behind)
+
+    # Categorizador local (train_categorizer.py): las filas seguras no pasan por el LLM
+    categorizer_config = config.get("categorizer") or {}
+    categorizer_path = categorizer_config.get("path") or "categorizer.npz"
+    categorizer = None
+    if categorizer_config.get("enabled", True) and os.path.exists(categorizer_path):
+        categorizer = Categorizer(categorizer_path)
 
     builder = StateGraph(state_schema=State)
 
-    builder.add_node("fetch_user_info", user_info_node)
+    builder.add_node("fetch_user_info", make_user_info_node(resource_names))
     builder.set_entry_point("fetch_user_info")
-    builder.add_node("finance_classifier", make_finance_classifier_node(llm_complex_tools, resource_names))
-    builder.add_node("finance_qa", make_finance_qa_node(llm_tools, resource_names))
-    builder.add_node("ocr_node", ocr_node(config["mistral"]["api_key"]))
+    builder.add_node("finance_classifier", make_finance_classifier_node(
+        classifier_policy, resource_names, journal=journal, controller=controller,
+        categorizer=categorizer, min_confidence=float(categorizer_config.get("min_confidence", 0.8)),
+    ))
+    builder.add_node("finance_qa", make_finance_qa_node(llm_tools, resource_names, upstream=llm_upstream))
+    builder.add_node("ocr_node", ocr_node(config["mistral"]["api_key"], journal=journal))
+    # Cuenta origen por el encabezado del extracto, antes de cualquier llamada al LLM
+    builder.add_node("resolve_account", make_resolve_account_node(resource_names))
     builder.add_node("router_node", router_node)
-    builder.add_node("tools", build_rate_limited_tool_node(tools, min_interval=0.5))
-    builder.add_node("tools_qa", build_rate_limited_tool_node(tools, min_interval=0.5))
+    builder.add_node("query_planner", make_query_planner_node(qa_tools, resource_names, limiter=limiter, prefetch=prefetch))
+    builder.add_node("tools", build_rate_limited_tool_node(
+        tools, limiter=limiter, journal=journal, observers=ingest_observers, write_behind=write_behind
+    ))
+    # Verificación determinista del extracto tras cada lote de inserts
+    builder.add_node("reconcile", make_reconcile_node(
+        tools_by_name.get("list-movements"), limiter=limiter, journal=journal, controller=controller,
+        outbox=write_behind.outbox if write_behind else None,
+    ))
+    builder.add_node("tools_qa", build_rate_limited_tool_node(qa_tools, limiter=limiter, prefetch=prefetch))
 
     builder.add_edge("fetch_user_info", "router_node")
     builder.add_conditional_edges("router_node", lambda s: s["next"], {
         "ocr_node": "ocr_node",
-        "finance_qa": "finance_qa"
+        "finance_qa": "query_planner"
+    })
+    builder.add_conditional_edges("query_planner", lambda s: s["next"], {
+        "finance_qa": "finance_qa", "END": END
     })
-    builder.add_edge("ocr_node", "finance_classifier")
+    builder.add_edge("ocr_node", "resolve_account")
+    builder.add_edge("resolve_account", "finance_classifier")
     builder.add_conditional_edges("finance_classifier", finance_phase_condition, {
-        "tools": "tools", "END": END, END: END
+        "tools": "tools", "END": END
     })
     builder.add_conditional_edges("finance_qa", tools_condition , {"tools": "tools_qa", END: END})
-    builder.add_edge("tools", "finance_classifier")
+    builder.add_edge("tools", "reconcile")
+    builder.add_conditional_edges("reconcile", lambda s: s["next"], {
+        "finance_classifier": "finance_classifier", "END": END
+    })
     builder.add_edge("tools_qa", "finance_qa")
 
     return builder.compile(checkpointer=MemorySaver())
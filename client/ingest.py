@@ -0,0 +1,177 @@
+"""
+Ingesta headless de estados de cuenta.
+
+Procesa muchos PDFs/imágenes (OCR + clasificación) sin la TUI, con
+concurrencia acotada. Cada archivo termina como una línea en el reporte
+JSONL; al relanzar el comando se omiten los archivos ya procesados con
+éxito, de modo que una interrupción se reanuda donde se quedó.
+
+Uso:
+    python ingest.py extractos/ "marzo/*.pdf" --concurrency 4
+    python ingest.py extractos/ --report reporte.jsonl --no-resume
+"""
+import argparse
+import asyncio
+import glob
+import json
+import time
+import uuid
+from datetime import datetime
+from pathlib import Path
+from langchain_core.messages import HumanMessage
+from config import load_config
+from graph_builder import build_graph
+from mcp_setup import open_finance_client
+from agents.router_node import STATEMENT_EXTENSIONS
+from agents.outbox import get_write_behind
+from agents.loop_controller import recursion_limit
+
+# Estados de `completion` (agents/loop_controller.py) que cuentan como ingesta correcta
+OK_COMPLETIONS = ("complete", "reconciled", "already_ingested")
+
+
+def collect_files(patterns: list[str]) -> list[Path]:
+    """Expande directorios y globs a la lista ordenada de archivos soportados."""
+    found = {}
+    for pattern in patterns:
+        path = Path(pattern)
+        if path.is_dir():
+            candidates = path.rglob("*")
+        else:
+            candidates = (Path(p) for p in glob.glob(pattern, recursive=True))
+        for candidate in candidates:
+            if candidate.is_file() and candidate.suffix.lower() in STATEMENT_EXTENSIONS:
+                found[str(candidate.resolve())] = candidate.resolve()
+    return [found[k] for k in sorted(found)]
+
+
+def file_fingerprint(path: Path) -> str:
+    """Huella barata (tamaño + mtime) para detectar si el archivo cambió."""
+    stat = path.stat()
+    return f"{stat.st_size}-{int(stat.st_mtime)}"
+
+
+def is_done(path: Path, done: set[tuple[str, str]]) -> bool:
+    try:
+        return (str(path), file_fingerprint(path)) in done
+    except OSError:
+        return False  # desaparecido: el worker lo reporta como error
+
+
+def load_done(report_path: Path) -> set[tuple[str, str]]:
+    """Lee el reporte y devuelve los (archivo, huella) ya procesados con éxito."""
+    done = set()
+    if not report_path.exists():
+        return done
+    with open(report_path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue  # línea truncada por una interrupción
+            if record.get("status") == "ok":
+                done.add((record["file"], record["fingerprint"]))
+    return done
+
+
+def append_report(report_path: Path, record: dict):
+    with open(report_path, "a", encoding="utf-8") as f:
+        f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        f.flush()
+
+
+async def ingest_file(graph, path: Path, limit: int = 25) -> dict:
+    """Ejecuta el grafo completo para un archivo en su propio thread_id."""
+    config_graph = {"configurable": {"thread_id": str(uuid.uuid4())}, "recursion_limit": limit}
+    result = await graph.ainvoke({"messages": [HumanMessage(content=str(path))]}, config_graph)
+
+    last_ai = next(
+        (m.content for m in reversed(result.get("messages", [])) if getattr(m, "type", "") == "ai"),
+        None
+    )
+    if not result.get("markdown") and not result.get("statement_id"):
+        raise RuntimeError("El OCR no devolvió contenido")
+    # El estado del archivo lo decide cómo terminó el ciclo del clasificador
+    completion = result.get("completion") or {}
+    return {"summary": (last_ai or "")[:2000], "completion": completion.get("status")}
+
+
+async def run(args):
+    files = collect_files(args.paths)
+    report_path = Path(args.report)
+    done = load_done(report_path) if args.resume else set()
+
+    pending = [p for p in files if not is_done(p, done)]
+    skipped = len(files) - len(pending)
+    print(f"📂 {len(files)} archivos encontrados, {skipped} ya procesados, {len(pending)} pendientes.")
+    if not pending:
+        return
+
+    print("📦 Cargando configuración...")
+    config = load_config()
+    print("🔧 Conectando al MCP...")
+    client, tools, resource_names = await open_finance_client(config)
+
+    try:
+        graph = build_graph(config, tools, resource_names)
+        semaphore = asyncio.Semaphore(args.concurrency)
+        completed = 0
+        failed = 0
+
+        async def worker(path: Path):
+            nonlocal completed, failed
+            async with semaphore:
+                start = time.perf_counter()
+                record = {"file": str(path)}
+                try:
+                    record["fingerprint"] = file_fingerprint(path)
+                    record.update(await ingest_file(graph, path, recursion_limit(config)))
+                    if record["completion"] in OK_COMPLETIONS:
+                        record["status"] = "ok"
+                    else:
+                        # Se reintenta en la próxima corrida (el journal evita duplicar filas)
+                        record["status"] = "error"
+                        record["error"] = f"Clasificación sin terminar ({record['completion'] or 'sin resultado'})"
+                        failed += 1
+                except Exception as e:
+                    record["status"] = "error"
+                    record["error"] = f"{type(e).__name__}: {e}"
+                    failed += 1
+                record["seconds"] = round(time.perf_counter() - start, 2)
+                record["finished_at"] = datetime.now().isoformat(timespec="seconds")
+                append_report(report_path, record)
+
+                completed += 1
+                icon = "✅" if record["status"] == "ok" else "❌"
+                print(f"[{completed}/{len(pending)}] {icon} {path.name} ({record['seconds']}s)")
+
+        await asyncio.gather(*(worker(p) for p in pending))
+
+        # Los inserts se confirmaron al encolarse: esperar a que terminen de subir
+        write_behind = get_write_behind()
+        if write_behind:
+            depth = write_behind.outbox.stats()["depth"]
+            if depth:
+                print(f"📤 Subiendo a Notion los {depth} inserts en cola...")
+            await write_behind.drain()
+            await write_behind.stop()
+        print(f"🏁 Ingesta terminada: {completed - failed} correctos, {failed} con error. Reporte: {report_path}")
+    finally:
+        await client.__aexit__(None, None, None)
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Ingesta por lotes de estados de cuenta.")
+    parser.add_argument("paths", nargs="+", help="Directorios o globs con PDFs/imágenes")
+    parser.add_argument("--concurrency", type=int, default=3, help="Archivos procesados en paralelo")
+    parser.add_argument("--report", default="ingest_report.jsonl", help="Reporte JSONL por archivo")
+    parser.add_argument("--no-resume", dest="resume", action="store_false",
+                        help="Reprocesar también los archivos ya ingeridos")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(run(parse_args()))
+    except KeyboardInterrupt:
+        print("\n⏸️ Ingesta interrumpida. Vuelve a ejecutar el comando para reanudar.")
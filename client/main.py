@@ -6,11 +6,12 @@ from textual.widgets import Header, Footer, Input, Static, RichLog
 from config import load_config
 from utils import printGraph
 from langchain_core.messages import HumanMessage
-from langchain_mcp_adapters.client import MultiServerMCPClient
+from mcp_setup import open_finance_client
 from graph_builder import build_graph # <-- Importar la nueva función
+from agents.outbox import get_write_behind
+from agents.loop_controller import recursion_limit
 import asyncio
 import uuid
-from pathlib import Path
 
 class FinanceAssistantApp(App):
     CSS_PATH = "main.tcss"
@@ -27,6 +28,7 @@ class FinanceAssistantApp(App):
         self.graph_ready = False
         self.client_manager = None
         self.last_ai = None
+        self.write_behind = None
 
     def compose(self) -> ComposeResult:
         """Compone la interfaz de usuario"""
@@ -57,31 +59,18 @@ class FinanceAssistantApp(App):
 
             self.message_area.mount(Static("🔧 Conectando al MCP..."))
             
-            # Configurar MCP client
-            current_dir = Path(__file__).parent
-            finance_js = current_dir.parent / "servers" / "finance" / "build" / "finance.js"
-
-            self.client_manager = await MultiServerMCPClient({
-                "finance": {
-                    "command": "node",
-                    "args": [str(finance_js)],
-                    "transport": "stdio",
-                    "env": {
-                        "NOTION_TOKEN": config["notion"]["api_key"],
-                        "NOTION_DB_ACCOUNTS": config["notion"]["db_accounts"],
-                        "NOTION_DB_TRANSACTIONS": config["notion"]["db_transactions"]
-                    }
-                }
-            }).__aenter__()
-
             self.message_area.mount(Static("🛠️ Obteniendo herramientas y recursos..."))
-            tools = self.client_manager.get_tools()
-            resources = await self.client_manager.get_resources(server_name="finance")
-            resource_names = [r.as_string() for r in resources]
+            self.client_manager, tools, resource_names = await open_finance_client(config)
 
             self.message_area.mount(Static("📊 Construyendo grafo de estados..."))
             self.graph = build_graph(config, tools, resource_names)
-            self.config_graph = {"configurable": {"thread_id": self.thread_id}}
+            self.config_graph = {"configurable": {"thread_id": self.thread_id}, "recursion_limit": recursion_limit(config)}
+
+            # Cola de inserts hacia Notion: arranca ya (sube lo que quedó de una sesión anterior)
+            self.write_behind = get_write_behind()
+            if self.write_behind:
+                self.write_behind.start()
+                self.set_interval(1.0, self.update_queue_status)
             
             # Imprimir grafo (si la función existe)
             try:
@@ -151,9 +140,21 @@ class FinanceAssistantApp(App):
             self.query_input.placeholder = "Escribe tu pregunta y presiona Enter..."
             self.query_input.focus()
 
+    def update_queue_status(self):
+        """Profundidad y retraso de la cola de inserts en el subtítulo."""
+        stats = self.write_behind.outbox.stats()
+        if not stats["depth"] and not stats["failed"]:
+            self.sub_title = "📤 Notion al día"
+            return
+        failed = f" · {stats['failed']} fallidos" if stats["failed"] else ""
+        self.sub_title = f"📤 Notion: {stats['depth']} en cola · retraso {stats['lag']:.0f}s{failed}"
+
     def action_quit(self):
         """Acción para salir de la aplicación"""
         self.message_area.mount(Static(f"👋 Cerrando sesión. Tokens usados: {int(self.total_tokens_used)}"))
+        if self.write_behind and self.write_behind.outbox.stats()["depth"]:
+            # La cola es durable: lo pendiente se sube al volver a abrir la app
+            print(f"📤 Quedan {self.write_behind.outbox.stats()['depth']} inserts en cola; se subirán en la próxima sesión.")
         self.exit()
 
 async def main():
@@ -0,0 +1,230 @@
+"""
+Pool supervisado de procesos del servidor MCP de finanzas.
+
+Cada worker es un proceso `node finance.js` propio (un MultiServerMCPClient
+por worker). Las tools que expone el pool son proxies con el mismo nombre,
+descripción y esquema que las originales; cada llamada va al worker sano
+con menos llamadas en curso. Si un worker muere o se cuelga, la llamada se
+reintenta en otro worker y el caído se reinicia en segundo plano.
+"""
+import asyncio
+from typing import Any, Dict, List, Optional
+from langchain_core.tools import BaseTool, StructuredTool, ToolException
+from langchain_mcp_adapters.client import MultiServerMCPClient
+from agents.resilience import is_idempotent_tool
+
+SERVER_NAME = "finance"
+
+
+class WorkerUnavailable(Exception):
+    """No hay workers sanos para atender la llamada."""
+
+
+class FinanceWorker:
+    """Un proceso MCP. Vive dentro de su propia task porque stdio_client
+    usa task groups de anyio: el contexto debe abrirse y cerrarse en la
+    misma task."""
+
+    def __init__(self, index: int, connection: dict):
+        self.index = index
+        self.connection = connection
+        self.client: Optional[MultiServerMCPClient] = None
+        self.tools_by_name: Dict[str, BaseTool] = {}
+        self.healthy = False
+        self.in_flight = 0
+        self.restarts = 0
+        self.error: Optional[BaseException] = None
+        self._task: Optional[asyncio.Task] = None
+        self._ready = asyncio.Event()
+        self._stop = asyncio.Event()
+
+    async def _run(self):
+        try:
+            async with MultiServerMCPClient({SERVER_NAME: self.connection}) as client:
+                self.client = client
+                self.tools_by_name = {t.name: t for t in client.get_tools()}
+                self.healthy = True
+                self.error = None
+                self._ready.set()
+                await self._stop.wait()
+        except Exception as e:
+            self.error = e
+        finally:
+            self.healthy = False
+            self._ready.set()
+
+    async def start(self):
+        self._ready = asyncio.Event()
+        self._stop = asyncio.Event()
+        self._task = asyncio.create_task(self._run(), name=f"mcp-worker-{self.index}")
+        await self._ready.wait()
+        if not self.healthy:
+            raise RuntimeError(f"No se pudo iniciar el worker MCP #{self.index}: {self.error}")
+
+    async def stop(self, timeout: float = 5.0):
+        self.healthy = False
+        self._stop.set()
+        if self._task:
+            try:
+                await asyncio.wait_for(self._task, timeout)
+            except (asyncio.TimeoutError, Exception):
+                self._task.cancel()
+            self._task = None
+
+    async def ping(self, timeout: float):
+        await asyncio.wait_for(self.client.sessions[SERVER_NAME].send_ping(), timeout)
+
+    async def call(self, name: str, args: dict, timeout: float):
+        self.in_flight += 1
+        try:
+            return await asyncio.wait_for(self.tools_by_name[name].ainvoke(args), timeout)
+        finally:
+            self.in_flight -= 1
+
+
+class FinanceServerPool:
+    """
+    Supervisor de N workers MCP con balanceo, health-checks y reinicio.
+
+    Se usa igual que MultiServerMCPClient:
+        pool = await FinanceServerPool(connection, workers=3).__aenter__()
+        tools = pool.get_tools()
+        resources = await pool.get_resources(server_name="finance")
+    """
+
+    def __init__(
+        self,
+        connection: dict,
+        workers: int = 2,
+        call_timeout: float = 60.0,
+        health_interval: float = 15.0,
+        max_retries: int = 2,
+    ):
+        self.workers = [FinanceWorker(i, connection) for i in range(max(1, workers))]
+        self.call_timeout = call_timeout
+        self.health_interval = health_interval
+        self.max_retries = max_retries
+        self._restart_locks = {w.index: asyncio.Lock() for w in self.workers}
+        self._health_task: Optional[asyncio.Task] = None
+        self._background: set[asyncio.Task] = set()
+        self._tools: List[BaseTool] = []
+
+    async def __aenter__(self):
+        await asyncio.gather(*(w.start() for w in self.workers))
+        self._tools = [self._make_proxy(t) for t in self.workers[0].tools_by_name.values()]
+        self._health_task = asyncio.create_task(self._health_loop(), name="mcp-pool-health")
+        print(f"🧩 Pool MCP iniciado con {len(self.workers)} workers.")
+        return self
+
+    async def __aexit__(self, *exc):
+        if self._health_task:
+            self._health_task.cancel()
+        await asyncio.gather(*(w.stop() for w in self.workers), return_exceptions=True)
+
+    # ---------- API compatible con MultiServerMCPClient ----------
+    def get_tools(self) -> List[BaseTool]:
+        return list(self._tools)
+
+    async def get_resources(self, server_name: str = SERVER_NAME, uris=None):
+        worker = self._pick_worker()
+        return await worker.client.get_resources(server_name=server_name, uris=uris)
+
+    # ---------- Despacho ----------
+    def _pick_worker(self, exclude: Optional[set] = None) -> FinanceWorker:
+        candidates = [w for w in self.workers if w.healthy and w.index not in (exclude or set())]
+        if not candidates:
+            candidates = [w for w in self.workers if w.healthy]
+        if not candidates:
+            raise WorkerUnavailable("No hay workers MCP disponibles")
+        return min(candidates, key=lambda w: w.in_flight)
+
+    async def call_tool(self, name: str, args: dict) -> Any:
+        """
+        Ejecuta la tool en el worker menos ocupado. Los errores de la tool
+        (ToolException) se propagan tal cual; los fallos del proceso
+        (timeout, stream cerrado...) reinician el worker y reintentan la
+        llamada en otro, salvo en tools de escritura: un timeout puede
+        llegar después de que Notion creó la página, así que el error se
+        propaga y decide quien llama (ver agents/outbox.py).
+        """
+        tried = set()
+        last_error: Optional[BaseException] = None
+        for _ in range(self.max_retries + 1):
+            try:
+                worker = self._pick_worker(exclude=tried)
+            except WorkerUnavailable:
+                await asyncio.sleep(0.5)  # dar tiempo a un reinicio en curso
+                continue
+
+            tried.add(worker.index)
+            try:
+                return await worker.call(name, args, self.call_timeout)
+            except ToolException:
+                raise
+            except Exception as e:
+                last_error = e
+                self._schedule_restart(worker)
+                if not is_idempotent_tool(name):
+                    print(f"⚠️ Worker MCP #{worker.index} falló en '{name}' ({type(e).__name__}: {e}); "
+                          "no se reintenta una escritura.")
+                    raise
+                print(f"⚠️ Worker MCP #{worker.index} falló en '{name}' ({type(e).__name__}: {e}); reintentando.")
+
+        raise WorkerUnavailable(f"La tool '{name}' falló tras {self.max_retries + 1} intentos: {last_error}")
+
+    def _make_proxy(self, tool: BaseTool) -> BaseTool:
+        async def _call(**kwargs):
+            return await self.call_tool(tool.name, kwargs)
+
+        return StructuredTool(
+            name=tool.name,
+            description=tool.description,
+            args_schema=tool.args_schema,
+            coroutine=_call,
+        )
+
+    # ---------- Supervisión ----------
+    def _schedule_restart(self, worker: FinanceWorker):
+        task = asyncio.create_task(self._restart(worker))
+        self._background.add(task)
+        task.add_done_callback(self._background.discard)
+
+    async def _restart(self, worker: FinanceWorker):
+        lock = self._restart_locks[worker.index]
+        if lock.locked():
+            return  # ya se está reiniciando
+        async with lock:
+            await worker.stop()
+            backoff = 1.0
+            while True:
+                try:
+                    await worker.start()
+                    worker.restarts += 1
+                    print(f"🔁 Worker MCP #{worker.index} reiniciado (reinicios: {worker.restarts}).")
+                    return
+                except Exception as e:
+                    print(f"❌ No se pudo reiniciar el worker MCP #{worker.index}: {e}")
+                    await asyncio.sleep(backoff)
+                    backoff = min(backoff * 2, 30.0)
+
+    async def _health_loop(self):
+        while True:
+            await asyncio.sleep(self.health_interval)
+            for worker in self.workers:
+                if self._restart_locks[worker.index].locked():
+                    continue
+                try:
+                    if not worker.healthy:
+                        raise RuntimeError(worker.error or "worker detenido")
+                    await worker.ping(timeout=min(self.call_timeout, 10.0))
+                except Exception as e:
+                    print(f"🩺 Health-check falló en worker MCP #{worker.index}: {e}")
+                    self._schedule_restart(worker)
+
+    def stats(self) -> dict:
+        return {
+            "workers": len(self.workers),
+            "healthy": sum(w.healthy for w in self.workers),
+            "in_flight": sum(w.in_flight for w in self.workers),
+            "restarts": sum(w.restarts for w in self.workers),
+        }
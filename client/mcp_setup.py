@@ -0,0 +1,50 @@
+from pathlib import Path
+from mcp_pool import FinanceServerPool
+
+FINANCE_JS = Path(__file__).parent.parent / "servers" / "finance" / "build" / "finance.js"
+
+
+def finance_connection(config, workers: int = 1) -> dict:
+    """
+    Parámetros stdio para lanzar el servidor MCP de finanzas. Con varios
+    workers, el presupuesto de Notion (`mcp.max_rps`, `mcp.fanout`) se
+    reparte entre ellos y la caché de meses cerrados se desactiva: un
+    insert solo invalida la caché del worker que lo hizo.
+    """
+    mcp_config = config.get("mcp") or {}
+    workers = max(1, workers)
+    max_rps = float(mcp_config.get("max_rps") or 3)
+    fanout = int(mcp_config.get("fanout") or 4)
+    return {
+        "command": "node",
+        "args": [str(FINANCE_JS)],
+        "transport": "stdio",
+        "env": {
+            "NOTION_TOKEN": config["notion"]["api_key"],
+            "NOTION_DB_ACCOUNTS": config["notion"]["db_accounts"],
+            "NOTION_DB_TRANSACTIONS": config["notion"]["db_transactions"],
+            "NOTION_MAX_RPS": str(max_rps / workers),
+            "NOTION_FANOUT": str(max(1, fanout // workers)),
+            "NOTION_CACHE_TTL": "3600" if workers == 1 else "0",
+        }
+    }
+
+
+async def open_finance_client(config):
+    """
+    Arranca el pool de servidores MCP de finanzas y devuelve
+    (client, tools, resource_names). El llamador es responsable de cerrar
+    el client con `__aexit__`.
+    """
+    mcp_config = config.get("mcp") or {}
+    workers = int(mcp_config.get("workers") or 2)
+    client = await FinanceServerPool(
+        finance_connection(config, workers),
+        workers=workers,
+        call_timeout=float(mcp_config.get("call_timeout") or 60),
+        health_interval=float(mcp_config.get("health_interval") or 15),
+    ).__aenter__()
+    tools = client.get_tools()
+    resources = await client.get_resources(server_name="finance")
+    resource_names = [r.as_string() for r in resources]
+    return client, tools, resource_names
@@ -0,0 +1,157 @@
+"""
+Profiler por muestreo para `debug_cli.py --profile`.
+
+Un hilo aparte toma cada `interval` segundos la pila de todos los hilos
+(`sys._current_frames()`), sin instrumentar ninguna función: el coste es
+proporcional a la frecuencia de muestreo, no a la cantidad de código que
+corre. Por cada consulta se escribe un archivo `.folded` (formato de pilas
+colapsadas, compatible con flamegraph.pl, speedscope o inferno) y se
+imprime un resumen de las funciones más calientes, agrupadas en nuestro
+código, LangChain/LangGraph y el cliente MCP.
+
+Las muestras en las que un hilo solo espera (event loop en `select`,
+workers ociosos) se cuentan aparte como espera y no entran en el ranking.
+"""
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, Optional, Tuple
+
+CLIENT_ROOT = str(Path(__file__).resolve().parent)
+
+GROUP_PREFIXES = (
+    ("mcp", ("mcp/", "anyio/", "langchain_mcp_adapters/", "mcp_pool.py", "mcp_setup.py")),
+    ("langchain", ("langchain", "langgraph", "langsmith")),
+)
+# (archivo, función) hoja que indica que el hilo está esperando, no trabajando
+IDLE_LEAVES = {
+    ("selectors.py", "select"),
+    ("threading.py", "wait"),
+    ("threading.py", "_wait_for_tstate_lock"),
+    ("queue.py", "get"),
+    ("thread.py", "_worker"),   # worker de ThreadPoolExecutor esperando trabajo
+}
+
+
+def _short_path(path: str) -> str:
+    for marker in ("site-packages/", "dist-packages/"):
+        i = path.rfind(marker)
+        if i != -1:
+            return path[i + len(marker):]
+    if path.startswith(CLIENT_ROOT):
+        return os.path.relpath(path, CLIENT_ROOT)
+    return os.path.basename(path)
+
+
+def _group(short_path: str, in_client: bool) -> str:
+    for group, prefixes in GROUP_PREFIXES:
+        if short_path.startswith(prefixes):
+            return group
+    return "nuestro" if in_client else "otros"
+
+
+class SamplingProfiler:
+    def __init__(self, interval: float = 0.005, out_dir: str = "profiles", top: int = 15):
+        self.interval = interval
+        self.out_dir = Path(out_dir)
+        self.top = top
+        self._stacks: Counter = Counter()
+        self._frames: Dict[object, Tuple[str, str, bool]] = {}  # code → (etiqueta, ruta corta, en client/)
+        self._thread: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self._started_at = 0.0
+        self._queries = 0
+
+    # ---------- Muestreo ----------
+    def _label(self, code) -> Tuple[str, str, bool]:
+        info = self._frames.get(code)
+        if info is None:
+            short = _short_path(code.co_filename)
+            info = (f"{code.co_name} ({short}:{code.co_firstlineno})", short,
+                    code.co_filename.startswith(CLIENT_ROOT) and "site-packages" not in code.co_filename)
+            self._frames[code] = info
+        return info
+
+    def _sample(self):
+        own = threading.get_ident()
+        names = {t.ident: t.name for t in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == own:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(frame.f_code)
+                frame = frame.f_back
+            stack.reverse()
+            self._stacks[(names.get(ident, str(ident)), tuple(stack))] += 1
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def start(self):
+        self._stacks.clear()
+        self._stop.clear()
+        self._started_at = time.perf_counter()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self, label: str = "") -> Path:
+        """Detiene el muestreo, escribe el `.folded` e imprime el resumen."""
+        self._stop.set()
+        self._thread.join()
+        elapsed = time.perf_counter() - self._started_at
+        self._queries += 1
+        path = self._write_folded()
+        self._print_summary(label, elapsed, path)
+        return path
+
+    # ---------- Salida ----------
+    def _is_idle(self, stack: tuple) -> bool:
+        _, short, _ = self._label(stack[-1])
+        return (os.path.basename(short), stack[-1].co_name) in IDLE_LEAVES
+
+    def _write_folded(self) -> Path:
+        self.out_dir.mkdir(parents=True, exist_ok=True)
+        stamp = datetime.now().strftime("%Y%m%d-%H%M%S")
+        path = self.out_dir / f"{stamp}-q{self._queries}.folded"
+        with open(path, "w", encoding="utf-8") as f:
+            for (thread, stack), count in self._stacks.most_common():
+                frames = ";".join(self._label(code)[0].replace(";", ":") for code in stack)
+                f.write(f"{thread};{frames} {count}\n")
+        return path
+
+    def _print_summary(self, label: str, elapsed: float, path: Path):
+        total = sum(self._stacks.values())
+        if not total:
+            print("🔥 Perfil: sin muestras (consulta demasiado corta).")
+            return
+
+        own, inclusive, groups = Counter(), Counter(), Counter()
+        busy = 0
+        for (_, stack), count in self._stacks.items():
+            if not stack or self._is_idle(stack):
+                continue
+            busy += count
+            _, leaf_short, leaf_ours = self._label(stack[-1])
+            own[stack[-1]] += count
+            groups[_group(leaf_short, leaf_ours)] += count
+            for code in set(stack):
+                inclusive[code] += count
+
+        print(f"\n🔥 Perfil {label!r}: {elapsed:.2f}s, {total} muestras, "
+              f"{100 * (total - busy) / total:.0f}% en espera → {path}")
+        if not busy:
+            return
+        print("   Por grupo (tiempo propio): " + " | ".join(
+            f"{g} {100 * c / busy:.0f}%" for g, c in groups.most_common()
+        ))
+        print(f"   Top {self.top} funciones (propio / inclusivo, sobre muestras activas):")
+        for code, count in own.most_common(self.top):
+            name, short, ours = self._label(code)
+            print(f"   {100 * count / busy:5.1f}% {100 * inclusive[code] / busy:5.1f}%  "
+                  f"[{_group(short, ours)}] {name}")
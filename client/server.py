@@ -0,0 +1,192 @@
+"""
+Servidor ASGI multi-sesión.
+
+Un solo proceso atiende muchas conversaciones concurrentes. Todas las
+sesiones comparten el grafo compilado, el cliente MCP y el rate-limit de
+las tools; cada sesión tiene su propio thread_id y por lo tanto su
+propio estado en el checkpointer.
+
+Uso:
+    python server.py                       # host/puerto de config.yaml
+    uvicorn server:app --port 8000
+
+Endpoints:
+    GET  /health
+    POST /sessions                          → {"thread_id": ...}
+    POST /sessions/{thread_id}/messages     {"content": "..."} → {"reply": ...}
+"""
+import asyncio
+import time
+import uuid
+from contextlib import asynccontextmanager
+from langchain_core.messages import HumanMessage
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse
+from starlette.routing import Route
+from config import load_config
+from graph_builder import build_graph
+from mcp_setup import open_finance_client
+from agents.outbox import get_write_behind
+from agents.loop_controller import recursion_limit
+
+
+class SessionManager:
+    """
+    Estado compartido del servidor: grafo, cliente MCP y locks por sesión.
+
+    Las sesiones inactivas más de `session_ttl` segundos (o las menos
+    usadas, por encima de `max_sessions`) se descartan junto con su estado
+    en el checkpointer al crear sesiones nuevas.
+    """
+
+    def __init__(self, max_concurrent: int = 16, session_ttl: float = 3600.0, max_sessions: int = 1000):
+        self.graph = None
+        self.client = None
+        self.write_behind = None
+        self.recursion_limit = 25
+        self.max_concurrent = max_concurrent
+        self.session_ttl = session_ttl
+        self.max_sessions = max_sessions
+        self._semaphore = None
+        self._session_locks: dict[str, asyncio.Lock] = {}
+        self._last_used: dict[str, float] = {}
+
+    async def start(self, config):
+        self.client, tools, resource_names = await open_finance_client(config)
+        self.graph = build_graph(config, tools, resource_names)
+        self.recursion_limit = recursion_limit(config)
+        self._semaphore = asyncio.Semaphore(self.max_concurrent)
+        # Cola de inserts hacia Notion (lo pendiente de un arranque anterior incluido)
+        self.write_behind = get_write_behind()
+        if self.write_behind:
+            self.write_behind.start()
+
+    async def stop(self):
+        if self.write_behind:
+            await self.write_behind.stop()  # lo pendiente queda en disco
+        if self.client:
+            await self.client.__aexit__(None, None, None)
+
+    async def new_session(self) -> str:
+        await self._evict()
+        thread_id = str(uuid.uuid4())
+        self._session_locks[thread_id] = asyncio.Lock()
+        self._last_used[thread_id] = time.monotonic()
+        return thread_id
+
+    async def _evict(self):
+        """Descarta sesiones vencidas y, si sobran, las menos usadas (nunca una con un turno en curso)."""
+        idle = sorted((t for t, lock in self._session_locks.items() if not lock.locked()), key=self._last_used.get)
+        now = time.monotonic()
+        expired = [t for t in idle if now - self._last_used[t] > self.session_ttl]
+        overflow = len(self._session_locks) - len(expired) - (self.max_sessions - 1)
+        if overflow > 0:
+            expired += [t for t in idle if t not in expired][:overflow]
+        for thread_id in expired:
+            del self._session_locks[thread_id]
+            del self._last_used[thread_id]
+            try:
+                await self.graph.checkpointer.adelete_thread(thread_id)
+            except (AttributeError, NotImplementedError):
+                pass  # checkpointer sin borrado: al menos se libera el lock
+        if expired:
+            print(f"🧹 {len(expired)} sesiones inactivas descartadas ({len(self._session_locks)} activas)")
+
+    @property
+    def session_count(self) -> int:
+        return len(self._session_locks)
+
+    def has_session(self, thread_id: str) -> bool:
+        return thread_id in self._session_locks
+
+    async def send(self, thread_id: str, content: str) -> str:
+        """
+        Ejecuta un turno. Los turnos de una misma sesión se serializan (el
+        checkpointer no admite escrituras concurrentes al mismo thread);
+        sesiones distintas corren en paralelo hasta `max_concurrent`.
+        """
+        config_graph = {"configurable": {"thread_id": thread_id}, "recursion_limit": self.recursion_limit}
+        self._last_used[thread_id] = time.monotonic()
+        async with self._session_locks[thread_id], self._semaphore:
+            result = await self.graph.ainvoke({"messages": [HumanMessage(content=content)]}, config_graph)
+        self._last_used[thread_id] = time.monotonic()
+
+        return next(
+            (m.content for m in reversed(result.get("messages", [])) if getattr(m, "type", "") == "ai"),
+            ""
+        )
+
+
+config = load_config()
+server_config = config.get("server") or {}
+sessions = SessionManager(
+    max_concurrent=int(server_config.get("max_concurrent") or 16),
+    session_ttl=float(server_config.get("session_ttl") or 3600),
+    max_sessions=int(server_config.get("max_sessions") or 1000),
+)
+
+
+@asynccontextmanager
+async def lifespan(app):
+    print("🔧 Conectando al MCP y construyendo grafo compartido...")
+    await sessions.start(config)
+    print("✅ Servidor listo.")
+    try:
+        yield
+    finally:
+        await sessions.stop()
+
+
+async def health(request: Request):
+    return JSONResponse({"status": "ok", "sessions": sessions.session_count})
+
+
+async def create_session(request: Request):
+    return JSONResponse({"thread_id": await sessions.new_session()}, status_code=201)
+
+
+async def post_message(request: Request):
+    thread_id = request.path_params["thread_id"]
+    try:
+        body = await request.json()
+    except ValueError:
+        return JSONResponse({"error": "El cuerpo debe ser JSON válido"}, status_code=400)
+    content = body.get("content") if isinstance(body, dict) else None
+    if not isinstance(content, str) or not content.strip():
+        return JSONResponse({"error": "El campo 'content' es obligatorio"}, status_code=400)
+    # Después de leer el cuerpo: mientras se esperaba, la sesión pudo descartarse
+    if not sessions.has_session(thread_id):
+        return JSONResponse({"error": "Sesión no encontrada"}, status_code=404)
+
+    start = time.perf_counter()
+    try:
+        reply = await sessions.send(thread_id, content.strip())
+    except Exception as e:
+        return JSONResponse({"error": f"{type(e).__name__}: {e}"}, status_code=500)
+
+    return JSONResponse({
+        "thread_id": thread_id,
+        "reply": reply,
+        "seconds": round(time.perf_counter() - start, 3),
+    })
+
+
+app = Starlette(
+    routes=[
+        Route("/health", health, methods=["GET"]),
+        Route("/sessions", create_session, methods=["POST"]),
+        Route("/sessions/{thread_id}/messages", post_message, methods=["POST"]),
+    ],
+    lifespan=lifespan,
+)
+
+
+if __name__ == "__main__":
+    import uvicorn
+
+    uvicorn.run(
+        app,
+        host=server_config.get("host") or "127.0.0.1",
+        port=int(server_config.get("port") or 8000),
+    )
@@ -0,0 +1,122 @@
+"""
+Entrenamiento incremental del categorizador local (agents/categorizer.py).
+
+Primero trae de Notion los movimientos creados desde la última
+exportación (como export_movements.py) y luego suma al modelo solo las
+filas del historial que aún no vio. Antes de aprender cada lote lo
+clasifica con el modelo actual, así que el reporte muestra cómo le habría
+ido con movimientos que no conocía.
+
+Uso:
+    python train_categorizer.py               # exportar lo nuevo y entrenar con ello
+    python train_categorizer.py --no-export   # solo con el historial ya exportado
+    python train_categorizer.py --full        # reentrenar desde cero
+"""
+import argparse
+import asyncio
+import time
+from pathlib import Path
+from config import load_config
+from mcp_setup import open_finance_client
+from export_movements import export
+from agents.categorizer import SEP, Categorizer
+from agents.movement_store import MovementStore, MovementStoreWriter, has_export
+from agents.resilience import make_upstream
+
+
+async def export_new(config, history: Path):
+    print("🔧 Conectando al MCP...")
+    client, tools, _ = await open_finance_client(config)
+    try:
+        list_tool = next((t for t in tools if t.name == "list-movements"), None)
+        if list_tool is None:
+            raise RuntimeError("El servidor MCP no expone 'list-movements'; recompila servers/finance.")
+        writer = MovementStoreWriter(str(history))
+        print(f"📤 Exportando movimientos nuevos a {history}...")
+        notion = make_upstream("notion", (config.get("limits") or {}).get("notion"))
+        await export(list_tool, writer, limiter=notion)
+    finally:
+        await client.__aexit__(None, None, None)
+
+
+def train(model: Categorizer, store: MovementStore, batch_size: int, min_confidence: float) -> dict:
+    """Suma al modelo las filas [model.trained_rows, store.rows) por lotes."""
+    stats = {"rows": 0, "evaluated": 0, "correct": 0, "confident": 0, "confident_correct": 0}
+    for start in range(model.trained_rows, store.rows, batch_size):
+        batch = [store.row(i) for i in range(start, min(start + batch_size, store.rows))]
+        # Sin tipo ni categoría no hay nada que aprender
+        batch = [m for m in batch if m.get("type") or m.get("spendType")]
+        if batch and model.ready:
+            labels, confidences = model.predict([m["description"] for m in batch], (m["amount"] for m in batch))
+            for m, label, confidence in zip(batch, labels, confidences):
+                hit = label == f"{m.get('type') or ''}{SEP}{m.get('spendType') or ''}"
+                stats["evaluated"] += 1
+                stats["correct"] += hit
+                if confidence >= min_confidence:
+                    stats["confident"] += 1
+                    stats["confident_correct"] += hit
+        model.partial_fit(batch)
+        model.trained_rows = min(start + batch_size, store.rows)
+        stats["rows"] += len(batch)
+    return stats
+
+
+async def run(args):
+    print("📦 Cargando configuración...")
+    config = load_config()
+    history = Path((config.get("history") or {}).get("path") or "history")
+    categorizer_config = config.get("categorizer") or {}
+    model_path = Path(args.model or categorizer_config.get("path") or "categorizer.npz")
+    min_confidence = float(categorizer_config.get("min_confidence", 0.8))
+
+    if args.export:
+        await export_new(config, history)
+    if not has_export(str(history)):
+        print(f"❌ No hay historial exportado en {history}; ejecuta export_movements.py primero.")
+        return
+
+    store = MovementStore(str(history))
+    try:
+        model = Categorizer(str(model_path), load=not args.full)
+        first_id = store.page_id(0) if store.rows else ""
+        if model.trained_rows and (store.rows < model.trained_rows or model.first_id != first_id):
+            print("♻️ La exportación se rehízo desde cero: se reentrena el modelo completo.")
+            model = Categorizer(str(model_path), load=False)
+        model.first_id = first_id
+
+        pending = store.rows - model.trained_rows
+        if not pending:
+            print(f"✅ El categorizador ya está al día ({model.trained_rows} filas, {len(model.labels)} etiquetas).")
+            return
+
+        print(f"🧠 Entrenando con {pending} filas nuevas...")
+        start = time.perf_counter()
+        stats = train(model, store, args.batch_size, min_confidence)
+        model.save()
+    finally:
+        store.close()
+
+    print(f"✅ {stats['rows']} filas aprendidas en {time.perf_counter() - start:.2f}s; "
+          f"{model.trained_rows} en total, {len(model.labels)} etiquetas → {model_path}")
+    if stats["evaluated"]:
+        coverage = stats["confident"] / stats["evaluated"]
+        precision = stats["confident_correct"] / stats["confident"] if stats["confident"] else 0.0
+        print(f"📊 Sobre las filas nuevas (antes de aprenderlas): acierto {stats['correct'] / stats['evaluated']:.0%}; "
+              f"con confianza ≥ {min_confidence}: {coverage:.0%} de las filas, {precision:.0%} de acierto")
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Entrena de forma incremental el categorizador local.")
+    parser.add_argument("--model", help="Archivo del modelo (por defecto categorizer.path de config.yaml)")
+    parser.add_argument("--no-export", dest="export", action="store_false",
+                        help="No traer movimientos nuevos de Notion antes de entrenar")
+    parser.add_argument("--full", action="store_true", help="Descartar el modelo actual y entrenar desde cero")
+    parser.add_argument("--batch-size", type=int, default=4096, help="Filas por lote")
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    try:
+        asyncio.run(run(parse_args()))
+    except KeyboardInterrupt:
+        print("\n⏸️ Entrenamiento interrumpido; el modelo guardado no cambió.")
@@ -4,3 +4,11 @@ config();
 export const NOTION_TOKEN = process.env.NOTION_TOKEN!;
 export const DB_ACCOUNTS_ID = process.env.NOTION_DB_ACCOUNTS!;
 export const DB_TRANSACTIONS_ID = process.env.NOTION_DB_TRANSACTIONS!;
+
+// Presupuesto de Notion (~3 req/s promedio por integración) y particiones consultadas a la vez.
+// Con varios procesos (pool del cliente) cada uno recibe su parte del presupuesto.
+export const NOTION_MAX_RPS = Number(process.env.NOTION_MAX_RPS ?? 3);
+export const NOTION_FANOUT = Number(process.env.NOTION_FANOUT ?? 4);
+// Segundos que vive en caché un mes cerrado; 0 la desactiva (varios procesos
+// no ven los inserts de los demás, así que no pueden invalidarla)
+export const NOTION_CACHE_TTL = Number(process.env.NOTION_CACHE_TTL ?? 3600);
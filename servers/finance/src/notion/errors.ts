@@ -0,0 +1,18 @@
+import { APIResponseError, ClientErrorCode, isNotionClientError } from "@notionhq/client";
+
+/**
+ * Mensaje de error con una etiqueta legible por el cliente:
+ * `... [code=rate_limited retry_after=3]`. El cliente Python la usa para
+ * decidir si reintenta y cuánto espera (ver client/agents/resilience.py).
+ */
+export function describeError(err: unknown): string {
+  const message = (err as Error)?.message ?? String(err);
+  if (APIResponseError.isAPIResponseError(err)) {
+    const retryAfter = (err.headers as any)?.get?.("retry-after");
+    return `${message} [code=${err.code}${retryAfter ? ` retry_after=${retryAfter}` : ""}]`;
+  }
+  if (isNotionClientError(err) && err.code === ClientErrorCode.RequestTimeout) {
+    return `${message} [code=timeout]`;
+  }
+  return message;
+}
@@ -1,3 +1,5 @@
 export * from "./resources.js";
 export * from "./tools.js";
 export * from "./notionClient.js";
+export * from "./partitions.js";
+export * from "./throttle.js";
@@ -0,0 +1,122 @@
+import { notion } from "./notionClient.js";
+import { limited } from "./throttle.js";
+import { NOTION_CACHE_TTL, NOTION_FANOUT } from "../env.js";
+
+/**
+ * Consultas por rango de fechas partidas por mes.
+ *
+ * Un rango amplio (año en curso, varios años) se divide en meses que se
+ * consultan en paralelo, hasta `NOTION_FANOUT` a la vez y dentro del
+ * token bucket compartido; cada partición se pagina completa. Los meses
+ * ya cerrados se guardan en caché (un insert de este proceso invalida su
+ * mes; `NOTION_CACHE_TTL=0` la desactiva cuando hay varios procesos); el
+ * mes en curso siempre se consulta en vivo.
+ */
+
+export interface Partition {
+  month: string;   // YYYY-MM
+  start: string;   // YYYY-MM-DD, recortado al rango pedido
+  end: string;
+  closed: boolean; // mes anterior al actual: cacheable
+}
+
+const DATE_RE = /^\d{4}-\d{2}-\d{2}$/;
+// Los meses cerrados solo cambian por inserts de este servidor (que invalidan);
+// el TTL cubre ediciones hechas a mano en Notion
+const CLOSED_TTL_MS = NOTION_CACHE_TTL * 1000;
+const CACHE_MAX = 500;
+
+const pad = (n: number) => String(n).padStart(2, "0");
+
+export function monthPartitions(startDate: string, endDate: string, today = new Date()): Partition[] {
+  if (!DATE_RE.test(startDate) || !DATE_RE.test(endDate)) {
+    throw new Error(`Rango inválido ${startDate} → ${endDate} (usa YYYY-MM-DD)`);
+  }
+  if (startDate > endDate) return [];
+  const currentMonth = `${today.getFullYear()}-${pad(today.getMonth() + 1)}`;
+  const lastMonth = endDate.slice(0, 7);
+  const partitions: Partition[] = [];
+  let [year, month] = startDate.slice(0, 7).split("-").map(Number);
+  for (let key = startDate.slice(0, 7); key <= lastMonth; key = `${year}-${pad(month)}`) {
+    const first = `${key}-01`;
+    const last = `${key}-${pad(new Date(Date.UTC(year, month, 0)).getUTCDate())}`;
+    partitions.push({
+      month: key,
+      start: first < startDate ? startDate : first,
+      end: last > endDate ? endDate : last,
+      closed: key < currentMonth,
+    });
+    [year, month] = month === 12 ? [year + 1, 1] : [year, month + 1];
+  }
+  return partitions;
+}
+
+/** Como Promise.all, pero con a lo sumo `limit` promesas en curso; respeta el orden. */
+export async function mapLimit<T, R>(items: T[], limit: number, fn: (item: T) => Promise<R>): Promise<R[]> {
+  const results = new Array<R>(items.length);
+  let next = 0;
+  const worker = async () => {
+    while (next < items.length) {
+      const i = next++;
+      results[i] = await fn(items[i]);
+    }
+  };
+  await Promise.all(Array.from({ length: Math.min(Math.max(limit, 1), items.length) }, worker));
+  return results;
+}
+
+/**
+ * Todas las páginas de una consulta (Notion devuelve 100 por llamada), o
+ * las primeras `maxRows` si se indica.
+ */
+export async function queryAll(params: any, maxRows = Infinity): Promise<any[]> {
+  const pages: any[] = [];
+  let cursor: string | undefined;
+  do {
+    const pageSize = Math.max(1, Math.min(100, maxRows - pages.length));
+    const results: any = await limited(() =>
+      notion.databases.query({ ...params, start_cursor: cursor, page_size: pageSize })
+    );
+    pages.push(...results.results.filter((page: any) => "properties" in page && page.object === "page"));
+    cursor = results.has_more && pages.length < maxRows ? results.next_cursor ?? undefined : undefined;
+  } while (cursor);
+  return pages.slice(0, maxRows);
+}
+
+const cache = new Map<string, { value: unknown; at: number }>();
+
+/**
+ * Ejecuta `fetch` por cada mes del rango y devuelve los resultados en
+ * orden cronológico. `kind` identifica la consulta (p.ej. la categoría)
+ * dentro de la caché.
+ */
+export async function fanOut<R>(
+  kind: string,
+  startDate: string,
+  endDate: string,
+  fetch: (partition: Partition) => Promise<R>
+): Promise<{ partition: Partition; value: R }[]> {
+  return mapLimit(monthPartitions(startDate, endDate), NOTION_FANOUT, async (partition) => {
+    const key = `${partition.month}|${partition.start}|${partition.end}|${kind}`;
+    const cacheable = partition.closed && CLOSED_TTL_MS > 0;
+    const hit = cacheable ? cache.get(key) : undefined;
+    if (hit && Date.now() - hit.at < CLOSED_TTL_MS) {
+      return { partition, value: hit.value as R };
+    }
+    const value = await fetch(partition);
+    if (cacheable) {
+      cache.delete(key);
+      cache.set(key, { value, at: Date.now() });
+      if (cache.size > CACHE_MAX) cache.delete(cache.keys().next().value!);
+    }
+    return { partition, value };
+  });
+}
+
+/** Un insert cambia su mes: se descartan las particiones cacheadas de ese mes. */
+export function invalidateMonth(date: string) {
+  const prefix = `${date.slice(0, 7)}|`;
+  for (const key of [...cache.keys()]) {
+    if (key.startsWith(prefix)) cache.delete(key);
+  }
+}
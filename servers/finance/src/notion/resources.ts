@@ -56,7 +56,7 @@ import {
             {
               uri,
               mimeType: "application/json",
-              text: JSON.stringify(data, null, 2)
+              text: JSON.stringify(data)
             }
           ]
         };
@@ -75,7 +75,7 @@ import {
             {
               uri,
               mimeType: "application/json",
-              text: JSON.stringify({data}, null, 2)
+              text: JSON.stringify({data})
             }
           ]
         };
@@ -111,7 +111,7 @@ import {
             {
               uri,
               mimeType: "application/json",
-              text: JSON.stringify({data}, null, 2)
+              text: JSON.stringify({data})
             }
           ]
         };
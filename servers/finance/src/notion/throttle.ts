@@ -0,0 +1,39 @@
+import { NOTION_FANOUT, NOTION_MAX_RPS } from "../env.js";
+
+const sleep = (ms: number) => new Promise((resolve) => setTimeout(resolve, ms));
+
+/**
+ * Token bucket: `rate` solicitudes por segundo en promedio, con ráfagas
+ * de hasta `burst`. Lo comparten todas las herramientas del servidor; en
+ * el pool del cliente `NOTION_MAX_RPS` ya viene dividido entre los procesos.
+ */
+export class TokenBucket {
+  private tokens: number;
+  private last = Date.now();
+
+  constructor(private rate: number, private burst: number) {
+    this.tokens = burst;
+  }
+
+  async take(): Promise<void> {
+    for (;;) {
+      const now = Date.now();
+      this.tokens = Math.min(this.burst, this.tokens + ((now - this.last) / 1000) * this.rate);
+      this.last = now;
+      if (this.tokens >= 1) {
+        this.tokens -= 1;
+        return;
+      }
+      await sleep(((1 - this.tokens) / this.rate) * 1000);
+    }
+  }
+}
+
+// La ráfaga alcanza para la primera tanda de particiones; el resto va al ritmo promedio
+export const notionBucket = new TokenBucket(NOTION_MAX_RPS, Math.max(1, NOTION_FANOUT));
+
+/** Ejecuta una llamada a Notion dentro del presupuesto compartido. */
+export async function limited<T>(call: () => Promise<T>): Promise<T> {
+  await notionBucket.take();
+  return call();
+}
@@ -1,6 +1,9 @@
 import { z } from "zod";
 import { notion } from "./notionClient.js";
 import { DB_TRANSACTIONS_ID } from "../env.js";
+import { describeError } from "./errors.js";
+import { limited } from "./throttle.js";
+import { fanOut, invalidateMonth, queryAll } from "./partitions.js";
 import { McpServer, ResourceTemplate } from "@modelcontextprotocol/sdk/server/mcp.js";
 
 function getNotionPropertyValue(property: any, type: string): any {
@@ -21,7 +24,7 @@ export default function registerTools(server: McpServer) {
     },
     async (input) => {
       try {
-        const page = await notion.pages.create({
+        const page = await limited(() => notion.pages.create({
           parent: { database_id: DB_TRANSACTIONS_ID },
           properties: {
             "Transaction Date": {
@@ -43,7 +46,9 @@ export default function registerTools(server: McpServer) {
               ? { relation: [{ id: input.origin }] }
               : { relation: [] },
           },
-        });
+        }));
+        // Los totales cacheados de ese mes ya no valen
+        invalidateMonth(input.date);
 
         return {
           content: [
@@ -54,12 +59,11 @@ export default function registerTools(server: McpServer) {
           ],
         };
       } catch (err: unknown) {
-        const error = err as Error;
         return {
           content: [
             {
               type: "text",
-              text: `❌ Error al insertar movimiento: ${error.message}`,
+              text: `❌ Error al insertar movimiento: ${describeError(err)}`,
             },
           ],
           isError: true,
@@ -75,11 +79,11 @@ export default function registerTools(server: McpServer) {
     },
     async (input) => { // Cambiado de ({ limit }, extra) a (input)
       try {
-        const pages = await notion.databases.query({
+        const pages = await limited(() => notion.databases.query({
           database_id: DB_TRANSACTIONS_ID,
           sorts: [{ property: "Transaction Date", direction: "descending" }],
           page_size: input.limit, // Cambiado de limit a input.limit
-        });
+        }));
         
   const movimientos = pages.results
           .filter((page): page is Extract<typeof page, { properties: any }> => 
@@ -112,12 +116,11 @@ export default function registerTools(server: McpServer) {
           content: [{ type: "text", text: movimientosText || "No se encontraron movimientos." }],
         };
       } catch (err: unknown) {
-        const error = err as Error;
         return {
           content: [
             {
               type: "text",
-              text: `❌ Error al obtener movimientos: ${error.message}`,
+              text: `❌ Error al obtener movimientos: ${describeError(err)}`,
             },
           ],
           isError: true,
@@ -133,46 +136,55 @@ export default function registerTools(server: McpServer) {
     limit: z.number().default(5).describe("Cantidad máxima de movimientos a devolver"),
   },
   async ({ keyword, limit }) => {
-    const pages = await notion.databases.query({
-      database_id: DB_TRANSACTIONS_ID,
-      filter: {
-        property: "Decription",
-        rich_text: { contains: keyword },
-      },
-      page_size: limit,
-    });
+    try {
+      const pages = await limited(() => notion.databases.query({
+        database_id: DB_TRANSACTIONS_ID,
+        filter: {
+          property: "Decription",
+          rich_text: { contains: keyword },
+        },
+        page_size: limit,
+      }));
 
-    const items  = pages.results
-          .filter((page): page is Extract<typeof page, { properties: any }> => 
-            "properties" in page && page.object === "page"
-          )
-          .map(page => {
-            const props = page.properties;
-      return {
-        date: getNotionPropertyValue(props["Transaction Date"], "date")?.start || "",
-        description: getNotionPropertyValue(props["Decription"], "title")?.[0]?.text?.content || "",
-        amount: getNotionPropertyValue(props["Transaction Amount"], "number") || 0,
-        category: getNotionPropertyValue(props["Type Spend"], "select")?.name || "",
-        type: getNotionPropertyValue(props["Type Transacction"], "select")?.name || "",
-      };
-    });
+      const items = pages.results
+        .filter((page): page is Extract<typeof page, { properties: any }> =>
+          "properties" in page && page.object === "page"
+        )
+        .map(page => {
+          const props = page.properties;
+          return {
+            date: getNotionPropertyValue(props["Transaction Date"], "date")?.start || "",
+            description: getNotionPropertyValue(props["Decription"], "title")?.[0]?.text?.content || "",
+            amount: getNotionPropertyValue(props["Transaction Amount"], "number") || 0,
+            category: getNotionPropertyValue(props["Type Spend"], "select")?.name || "",
+            type: getNotionPropertyValue(props["Type Transacction"], "select")?.name || "",
+          };
+        });
 
-   let itemsText = items.map((item, i) => 
-  `#${i + 1} - Fecha: ${item.date}, Monto: ${item.amount}, Descripción: ${item.description}, Tipo: ${item.type}, Categoría: ${item.category}`
-).join("\n");
- 
-// Resumen de los movimientos encontrados
- itemsText +=  `\n\nTotal de movimientos encontrados: ${items.length}`;
-    const total = items.reduce((sum, item) => {
-      if (item.type == "Debito") {
-      return sum + item.amount;
+      if (!items.length) {
+        return {
+          content: [{ type: "text", text: "No se encontraron movimientos con esa palabra." }],
+        };
       }
-    }, 0);
 
-    itemsText += `\nTotal Debitos gastado: Q${total.toFixed(2)}`;
-return {
-  content: [{ type: "text", text: itemsText || "No se encontraron movimientos con esa palabra." }],
-};
+      let itemsText = items.map((item, i) =>
+        `#${i + 1} - Fecha: ${item.date}, Monto: ${item.amount}, Descripción: ${item.description}, Tipo: ${item.type}, Categoría: ${item.category}`
+      ).join("\n");
+
+      // Resumen de los movimientos encontrados
+      itemsText += `\n\nTotal de movimientos encontrados: ${items.length}`;
+      const total = items.reduce((sum, item) => item.type == "Debito" ? sum + item.amount : sum, 0);
+      itemsText += `\nTotal Debitos gastado: Q${total.toFixed(2)}`;
+
+      return {
+        content: [{ type: "text", text: itemsText }],
+      };
+    } catch (err: unknown) {
+      return {
+        content: [{ type: "text", text: `❌ Error al buscar movimientos: ${describeError(err)}` }],
+        isError: true,
+      };
+    }
   }
 );
 
@@ -184,25 +196,40 @@ server.tool(
     endDate: z.string().describe("Fecha fin (YYYY-MM-DD)"),
   },
   async ({ category, startDate, endDate }) => {
-    const results = await notion.databases.query({
-      database_id: DB_TRANSACTIONS_ID,
-      filter: {
-        and: [
-          { property: "Type Spend", select: { equals: category } },
-          { property: "Transaction Date", date: { on_or_after: startDate } },
-          { property: "Transaction Date", date: { on_or_before: endDate } },
-        ],
-      },
-    });
+    try {
+      // Un subtotal por mes, consultados en paralelo (ver partitions.ts)
+      const months = await fanOut(`total:${category}`, startDate, endDate, async ({ start, end }) => {
+        const pages = await queryAll({
+          database_id: DB_TRANSACTIONS_ID,
+          filter: {
+            and: [
+              { property: "Type Spend", select: { equals: category } },
+              { property: "Transaction Date", date: { on_or_after: start } },
+              { property: "Transaction Date", date: { on_or_before: end } },
+            ],
+          },
+        });
+        return pages.reduce((sum, page: any) => {
+          const amount = getNotionPropertyValue(page.properties["Transaction Amount"], "number") || 0;
+          return sum + amount;
+        }, 0);
+      });
 
-    const total = results.results.reduce((sum, page : any) => {
-      const amount = getNotionPropertyValue(page.properties["Transaction Amount"], "number") || 0;
-      return sum + amount;
-    }, 0);
+      const total = months.reduce((sum, { value }) => sum + value, 0);
+      let text = `Total gastado en ${category}: Q${total.toFixed(2)}`;
+      if (months.length > 1) {
+        text += "\n" + months.map(({ partition, value }) => `- ${partition.month}: Q${value.toFixed(2)}`).join("\n");
+      }
 
-    return {
-      content: [{ type: "text", text: `Total gastado en ${category}: Q${total.toFixed(2)}` }],
-    };
+      return {
+        content: [{ type: "text", text }],
+      };
+    } catch (err: unknown) {
+      return {
+        content: [{ type: "text", text: `❌ Error al calcular el total: ${describeError(err)}` }],
+        isError: true,
+      };
+    }
   }
 );
 
@@ -211,26 +238,24 @@ server.tool(
   {
     startDate: z.string().describe("Fecha inicio (YYYY-MM-DD)"),
     endDate: z.string().describe("Fecha fin (YYYY-MM-DD)"),
+    limit: z.number().int().min(1).max(500).default(100).describe("Máximo de movimientos listados (máx. 500); si hay más, se resume por mes"),
   },
-  async ({ startDate, endDate }) => {
+  async ({ startDate, endDate, limit }) => {
     try {
-      const results  = await notion.databases.query({
-        database_id: DB_TRANSACTIONS_ID,
-        filter: {
-          and: [
-            { property: "Transaction Date", date: { on_or_after: startDate } },
-            { property: "Transaction Date", date: { on_or_before: endDate } },
-          ],
-        },
-        sorts: [{ property: "Transaction Date", direction: "ascending" }],
-        page_size: 300, 
-      });
-
-      const movimientos  = results.results
-.filter((page): page is Extract<typeof page, { properties: any }> => 
-            "properties" in page && page.object === "page"
-          )
-        .map((page) => {
+      // Un mes por partición, en paralelo; concatenadas quedan en orden de fecha.
+      // Cada mes se lee hasta limit + 1 filas: basta para saber si hay que truncar
+      const months = await fanOut(`range:${limit}`, startDate, endDate, async ({ start, end }) => {
+        const pages = await queryAll({
+          database_id: DB_TRANSACTIONS_ID,
+          filter: {
+            and: [
+              { property: "Transaction Date", date: { on_or_after: start } },
+              { property: "Transaction Date", date: { on_or_before: end } },
+            ],
+          },
+          sorts: [{ property: "Transaction Date", direction: "ascending" }],
+        }, limit + 1);
+        return pages.map((page: any) => {
           const props = page.properties;
           return {
             date: getNotionPropertyValue(props["Transaction Date"], "date")?.start || "",
@@ -240,24 +265,97 @@ server.tool(
             type: getNotionPropertyValue(props["Type Transacction"], "select")?.name || "",
           };
         });
+      });
+
+      const movimientos = months.flatMap(({ value }) => value);
+      const truncated = movimientos.length > limit;
 
-      const text = movimientos.map((m, i) =>
+      let text = movimientos.slice(0, limit).map((m, i) =>
         `#${i + 1} - ${m.date}: ${m.description} (Q${m.amount}) [${m.type} / ${m.category}]`
       ).join("\n");
+      if (truncated) {
+        // Un mes que llegó al tope puede tener más filas: su subtotal es un mínimo
+        const subtotals = months.map(({ partition, value }) => {
+          const capped = value.length > limit;
+          const sum = value.slice(0, limit).reduce((acc, m) => acc + m.amount, 0);
+          return `- ${partition.month}: ${capped ? "más de " : ""}${Math.min(value.length, limit)} movimientos, ` +
+            `${capped ? "al menos " : ""}Q${sum.toFixed(2)}`;
+        });
+        text += `\n\n⚠️ Resultado truncado: se listan los primeros ${limit} movimientos. Subtotales por mes:\n` +
+          subtotals.join("\n") +
+          "\nPide un rango menor o usa get-total-by-category para totales exactos.";
+      }
 
       return {
         content: [{ type: "text", text: text || "No se encontraron movimientos en ese rango." }],
       };
     } catch (err: unknown) {
-      const error = err as Error;
       return {
-        content: [{ type: "text", text: `❌ Error al consultar movimientos: ${error.message}` }],
+        content: [{ type: "text", text: `❌ Error al consultar movimientos: ${describeError(err)}` }],
         isError: true,
       };
     }
   }
 );
 
+server.tool(
+  "list-movements",
+  {
+    startCursor: z.string().optional().describe("Cursor devuelto por la página anterior"),
+    pageSize: z.number().default(100).describe("Movimientos por página (máx. 100)"),
+    createdAfter: z.string().optional().describe("Solo movimientos creados en o después de este instante (ISO 8601, inclusivo: created_time tiene resolución de minutos)"),
+    origin: z.string().optional().describe("ID de la cuenta origen"),
+    startDate: z.string().optional().describe("Fecha inicio (YYYY-MM-DD)"),
+    endDate: z.string().optional().describe("Fecha fin (YYYY-MM-DD)"),
+  },
+  async ({ startCursor, pageSize, createdAfter, origin, startDate, endDate }) => {
+    try {
+      const filters: any[] = [];
+      if (createdAfter) filters.push({ timestamp: "created_time", created_time: { on_or_after: createdAfter } });
+      if (origin) filters.push({ property: "Origen", relation: { contains: origin } });
+      if (startDate) filters.push({ property: "Transaction Date", date: { on_or_after: startDate } });
+      if (endDate) filters.push({ property: "Transaction Date", date: { on_or_before: endDate } });
+
+      const results = await limited(() => notion.databases.query({
+        database_id: DB_TRANSACTIONS_ID,
+        ...(filters.length && { filter: { and: filters } }),
+        sorts: [{ timestamp: "created_time", direction: "ascending" }],
+        start_cursor: startCursor,
+        page_size: Math.min(Math.max(pageSize, 1), 100),
+      }));
 
+      const movements = results.results
+        .filter((page): page is Extract<typeof page, { properties: any }> =>
+          "properties" in page && page.object === "page"
+        )
+        .map((page: any) => {
+          const props = page.properties;
+          return {
+            id: page.id,
+            created: page.created_time,
+            date: getNotionPropertyValue(props["Transaction Date"], "date")?.start || "",
+            amount: getNotionPropertyValue(props["Transaction Amount"], "number") || 0,
+            description: getNotionPropertyValue(props["Decription"], "title")?.[0]?.text?.content || "",
+            type: getNotionPropertyValue(props["Type Transacction"], "select")?.name || "",
+            spendType: getNotionPropertyValue(props["Type Spend"], "select")?.name || "",
+            origin: getNotionPropertyValue(props["Origen"], "relation")?.[0]?.id || "",
+          };
+        });
+
+      // JSON para consumo programático (índices locales, exportes)
+      return {
+        content: [{
+          type: "text",
+          text: JSON.stringify({ movements, nextCursor: results.next_cursor, hasMore: results.has_more }),
+        }],
+      };
+    } catch (err: unknown) {
+      return {
+        content: [{ type: "text", text: `❌ Error al listar movimientos: ${describeError(err)}` }],
+        isError: true,
+      };
+    }
+  }
+);
 
 }